@@ -0,0 +1,172 @@
+# pylint: disable=missing-docstring
+
+import json
+import logging
+import sys
+
+from benchmarks import run as bench_run
+
+
+OK, SLOWER, FASTER, NEW, MISSING = 'ok', 'SLOWER', 'faster', 'new', 'missing'
+
+
+# ----------------------------------------------------------------------------
+
+
+def flatten(report):
+    # benchmark name -> {median, stdev, runs}, curve points as `curve[x]`
+    entries = dict()
+    for name, result in report.get('benchmarks', dict()).items():
+        entries[name] = result
+    for name, curve in report.get('curves', dict()).items():
+        for point in curve.get('points', list()):
+            entries['{}[{}={}]'.format(name, curve['param'], point['x'])] = \
+                point
+    return {name: {'median': result['median'],
+                   'stdev': result.get('stdev', 0.0),
+                   'runs': result.get('runs', 1)}
+            for name, result in entries.items()}
+
+
+def make_baseline(report):
+    return {'meta': report.get('meta', dict()),
+            'benchmarks': flatten(report)}
+
+
+def load(filename):
+    with open(filename, 'r') as fin:
+        data = json.load(fin)
+    # a full benchmark report can be used as baseline, too
+    if 'curves' in data or any('bytes' in result for result
+                               in data.get('benchmarks', dict()).values()):
+        return make_baseline(data)
+    return data
+
+
+def save(baseline, filename):
+    with open(filename, 'w') as fout:
+        json.dump(baseline, fout, indent=2, sort_keys=True)
+
+
+# ----------------------------------------------------------------------------
+
+
+def compare(baseline, current, threshold=0.1, noise=2.0):
+    # regression if the median is more than `threshold` (relative) slower and
+    # the difference is larger than `noise` times the baseline stdev
+    rows = list()
+    base = baseline['benchmarks']
+    cur = current['benchmarks']
+
+    for name in sorted(set(base) | set(cur)):
+        if name not in cur:
+            rows.append((name, base[name]['median'], None, None, MISSING))
+            continue
+        if name not in base:
+            rows.append((name, None, cur[name]['median'], None, NEW))
+            continue
+
+        old, new = base[name]['median'], cur[name]['median']
+        change = (new - old) / old if old > 0 else 0.0
+        delta = new - old
+        margin = noise * max(base[name]['stdev'], cur[name]['stdev'])
+
+        status = OK
+        if change > threshold and delta > margin:
+            status = SLOWER
+        elif change < -threshold and -delta > margin:
+            status = FASTER
+        rows.append((name, old, new, change, status))
+
+    return rows
+
+
+def format_rows(rows, only_changes=False):
+    def fmt_ms(value):
+        return '{:>11.3f}'.format(value * 1000) if value is not None \
+            else '{:>11}'.format('-')
+
+    lines = ['{:<56} {:>11} {:>11} {:>9}  {}'.format(
+        'benchmark', 'base [ms]', 'curr [ms]', 'change', 'status')]
+    for name, old, new, change, status in rows:
+        if only_changes and status == OK:
+            continue
+        lines.append('{:<56} {} {} {:>9}  {}'.format(
+            name, fmt_ms(old), fmt_ms(new),
+            '{:+.1%}'.format(change) if change is not None else '-',
+            status))
+    return '\n'.join(lines)
+
+
+def has_regression(rows, strict=False):
+    failing = (SLOWER, MISSING) if strict else (SLOWER,)
+    return any(row[4] in failing for row in rows)
+
+
+# ----------------------------------------------------------------------------
+
+
+def cli_main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Store benchmark baselines and compare runs against '
+                    'them, exits with 1 on regressions.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_save = subparsers.add_parser(
+        'save', help='Store a benchmark report as baseline.')
+    parser_save.add_argument('report', help='JSON report of benchmarks.run')
+    parser_save.add_argument('baseline', help='baseline JSON output file')
+
+    parser_check = subparsers.add_parser(
+        'check', help='Compare a benchmark report against a baseline.')
+    parser_check.add_argument('baseline', help='baseline JSON file')
+    parser_check.add_argument('report', nargs='?', default=None,
+                              help='JSON report of benchmarks.run, runs the '
+                                   'benchmarks if not given')
+    parser_check.add_argument('-t', '--threshold', type=float, default=10.0,
+                              help='Allowed slowdown of the median in '
+                                   'percent. (default: 10)')
+    parser_check.add_argument('--noise', type=float, default=2.0,
+                              help='Only report changes larger than this '
+                                   'many standard deviations. (default: 2)')
+    parser_check.add_argument('--strict', action='store_true',
+                              help='Fail on missing benchmarks, too.')
+    parser_check.add_argument('-a', '--all', action='store_true',
+                              help='Show unchanged benchmarks, too.')
+    parser_check.add_argument('-q', '--quick', action='store_true',
+                              help='Run only quick benchmarks (no report).')
+    parser_check.add_argument('-n', '--repeat', type=int, default=5,
+                              help='Timed runs per benchmark (no report).')
+    args = parser.parse_args()
+
+    if args.command == 'save':
+        save(load(args.report), args.baseline)
+        return
+
+    if args.command != 'check':
+        parser.print_help()
+        sys.exit(2)
+
+    baseline = load(args.baseline)
+    if args.report:
+        current = load(args.report)
+    else:
+        logging.disable(logging.CRITICAL)
+        current = make_baseline(bench_run.run(quick=args.quick,
+                                              repeat=args.repeat))
+
+    rows = compare(baseline, current, threshold=args.threshold / 100.0,
+                   noise=args.noise)
+    print(format_rows(rows, only_changes=not args.all))
+
+    if has_regression(rows, strict=args.strict):
+        print('Performance regression (threshold {:.1f}%)!'.format(
+            args.threshold))
+        sys.exit(1)
+    print('No performance regression (threshold {:.1f}%).'.format(
+        args.threshold))
+
+
+if __name__ == '__main__':
+    cli_main()
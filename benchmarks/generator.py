@@ -0,0 +1,130 @@
+# pylint: disable=missing-docstring
+
+import base64
+import binascii
+import random
+
+
+ENCODINGS = ('base64', 'quoted-printable', 'binary')
+
+CONTENT_TYPES = {
+    'base64': ('image/png', 'image/jpeg', 'font/woff2'),
+    'quoted-printable': ('text/html', 'text/css', 'text/javascript'),
+    'binary': ('text/css', 'application/octet-stream'),
+}
+
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur',
+         'adipiscing', 'elit', '<div class="x">', '</div>', 'a=b;', '\t',
+         'href="http://example.com/?q=1&amp;r=2"', '-->', '--', '\r\n')
+
+
+def make_boundary(rng):
+    chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+    return '----MultipartBoundary--{}----'.format(
+        ''.join(rng.choice(chars) for _ in range(42)))
+
+
+def _text(rng, size):
+    # no leading whitespace, a tab would look like a folded header line
+    words = [rng.choice(WORDS[:8])]
+    length = len(words[0])
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words).encode('utf-8')[:size]
+
+
+def _binary(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+
+def _lookalike(rng, boundary):
+    # variants of the delimiter that must not be recognized as one
+    variants = (
+        ' --{}\r\n',  # no preceding linebreak
+        '\r\n--{}-x\r\n',  # other (longer) boundary
+        '\r\n--{}x',  # no linebreak after
+        'x--{}--\r\n',  # close delimiter without linebreak
+    )
+    return rng.choice(variants).format(boundary).encode('ascii')
+
+
+def _payload(rng, encoding, size, boundary, lookalikes):
+    if encoding == 'base64':
+        data = _binary(rng, size)
+    else:
+        data = _text(rng, size)
+    if lookalikes and encoding == 'binary':
+        pieces = list()
+        for nr in range(lookalikes + 1):
+            pieces.append(data[nr * len(data) // (lookalikes + 1):
+                               (nr + 1) * len(data) // (lookalikes + 1)])
+            if nr < lookalikes:
+                pieces.append(_lookalike(rng, boundary))
+        data = b''.join(pieces)
+    return data
+
+
+def _encode(encoding, data):
+    if encoding == 'base64':
+        return base64.encodebytes(data).replace(b'\n', b'\r\n')
+    if encoding == 'quoted-printable':
+        data = binascii.b2a_qp(data.replace(b'\r\n', b'\n'))
+        return data.replace(b'\n', b'\r\n') + b'\r\n'
+    return data + b'\r\n'
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def generate_archive(num_parts=10, part_size=4096, encodings=ENCODINGS,
+                     num_headers=4, lookalikes=0, seed=0):
+    # deterministic synthetic Blink style archive, parts cycle through
+    # `encodings`, `num_headers` (at least 4) header fields per part,
+    # `lookalikes` boundary lookalikes in each binary part (encoding would
+    # break them up or even turn them into real delimiters)
+    rng = random.Random(seed)
+    boundary = make_boundary(rng)
+    main_location = 'http://example.com/page-{}.html'.format(seed)
+
+    out = list()
+    out.append('From: <Saved by Blink>\r\n'
+               'Snapshot-Content-Location: {}\r\n'
+               'Subject: Synthetic benchmark archive\r\n'
+               'Date: Mon, 1 Apr 2019 12:00:00 -0000\r\n'
+               'MIME-Version: 1.0\r\n'
+               'Content-Type: multipart/related;\r\n'
+               '\ttype="text/html";\r\n'
+               '\tboundary="{}"\r\n'
+               '\r\n\r\n'.format(main_location, boundary).encode('ascii'))
+    delimiter = '--{}\r\n'.format(boundary).encode('ascii')
+
+    for nr in range(num_parts):
+        encoding = encodings[nr % len(encodings)]
+        if nr == 0:
+            encoding, content_type = 'quoted-printable', 'text/html'
+            location = main_location
+        else:
+            content_type = rng.choice(CONTENT_TYPES[encoding])
+            location = 'http://example.com/res/{}-{}'.format(
+                nr, content_type.replace('/', '.'))
+
+        headers = ['Content-Type: {}'.format(content_type),
+                   'Content-ID: <frame-{}@mhtml.blink>'.format(nr),
+                   'Content-Transfer-Encoding: {}'.format(encoding),
+                   'Content-Location: {}'.format(location)]
+        for hnr in range(max(0, num_headers - len(headers))):
+            headers.append('X-Bench-Header-{}: value {};\r\n\tfolded'
+                           .format(hnr, rng.randint(0, 1 << 30)))
+
+        data = _encode(encoding, _payload(rng, encoding, part_size,
+                                          boundary, lookalikes))
+        assert b'\r\n' + delimiter not in data, 'boundary collision'
+        assert b'\r\n' + delimiter[:-2] + b'--' not in data, \
+            'boundary collision'
+        out.append(delimiter)
+        out.append('\r\n'.join(headers).encode('ascii') + b'\r\n\r\n')
+        out.append(data)
+
+    out.append('--{}--\r\n'.format(boundary).encode('ascii'))
+    return b''.join(out)
+# pylint: enable=too-many-arguments,too-many-locals
@@ -0,0 +1,361 @@
+# pylint: disable=missing-docstring
+
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import mhtml
+
+from benchmarks.generator import generate_archive
+
+
+# archive shapes for the single benchmarks, name -> generator arguments
+SHAPES = {
+    'small': dict(num_parts=20, part_size=2048),
+    'many_parts': dict(num_parts=2000, part_size=512),
+    'large_parts': dict(num_parts=20, part_size=512 * 1024),
+    'many_headers': dict(num_parts=500, part_size=512, num_headers=24),
+    'lookalikes': dict(num_parts=100, part_size=8192,
+                       encodings=('binary',), lookalikes=50),
+}
+
+# scaling curves, name -> (varied parameter, values, fixed arguments)
+CURVES = {
+    'parse_struct_by_parts': ('num_parts', (10, 100, 1000, 5000),
+                              dict(part_size=1024)),
+    'parse_struct_by_part_size': ('part_size', (1024, 16384, 262144,
+                                                1048576),
+                                  dict(num_parts=20)),
+    'parse_struct_by_headers': ('num_headers', (4, 16, 64),
+                                dict(num_parts=500, part_size=256)),
+    'parse_struct_by_lookalikes': ('lookalikes', (0, 10, 100, 500),
+                                   dict(num_parts=20, part_size=65536,
+                                        encodings=('binary',))),
+    # fuzz style, a single part full of boundary lookalikes, the throughput
+    # should stay constant (linear scan)
+    'parse_struct_adversarial': ('lookalikes', (1000, 10000, 100000,
+                                                400000),
+                                 dict(num_parts=2, part_size=65536,
+                                      encodings=('binary',), seed=31)),
+}
+
+QUICK_SHAPES = ('small', 'many_parts')
+
+
+# ----------------------------------------------------------------------------
+
+
+def measure(func, setup=None, repeat=5, warmup=1):
+    # `setup()` is not timed, its return value is the argument of `func`
+    timings = list()
+    for nr in range(warmup + repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(arg)
+        duration = time.perf_counter() - start
+        if nr >= warmup:
+            timings.append(duration)
+    return timings
+
+
+def summarize(timings, num_bytes, **params):
+    median = statistics.median(timings)
+    return {
+        'median': median,
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'min': min(timings),
+        'max': max(timings),
+        'runs': len(timings),
+        'bytes': num_bytes,
+        'throughput_mb_s': num_bytes / median / 1024 / 1024
+                           if median > 0 else None,
+        'params': params,
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    # scripts print their results and log a lot
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+
+# ----------------------------------------------------------------------------
+
+
+def bench_parse(content, repeat):
+    return {
+        'parse_mhtml': measure(lambda _: mhtml.parse_mhtml(content),
+                               repeat=repeat),
+        'parse_mhtml_struct': measure(
+            lambda _: mhtml.parse_mhtml_struct(content), repeat=repeat),
+        'parse_mhtml_struct_lazy': measure(
+            lambda _: mhtml.parse_mhtml_struct(content, lazy=True),
+            repeat=repeat),
+    }
+
+
+def bench_structure(content, repeat):
+    import pickle  # pylint: disable=import-outside-toplevel
+
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    data = mhtml.dumps_structure(mhtarc)
+    pickled = pickle.dumps(mhtarc, protocol=pickle.HIGHEST_PROTOCOL)
+    return {
+        'dumps_structure': measure(lambda _: mhtml.dumps_structure(mhtarc),
+                                   repeat=repeat),
+        'loads_structure': measure(
+            lambda _: mhtml.loads_structure(data, content, lazy=False),
+            repeat=repeat),
+        'loads_structure_lazy': measure(
+            lambda _: mhtml.loads_structure(data, content), repeat=repeat),
+        'pickle_dumps': measure(
+            lambda _: pickle.dumps(mhtarc, protocol=pickle.HIGHEST_PROTOCOL),
+            repeat=repeat),
+        'pickle_loads': measure(lambda _: pickle.loads(pickled),
+                                repeat=repeat),
+    }
+
+
+def bench_cache(content, repeat, folder):
+    # cold parse vs. warm `ParseCache` hits (eager and lazy headers)
+    filename = os.path.join(folder, 'cached.mhtml')
+    with open(filename, 'wb') as fout:
+        fout.write(content)
+    cache = mhtml.ParseCache(os.path.join(folder, 'cache'), min_size=0)
+    mhtml.MHTMLArchive_from_file(filename, cache=cache)
+    return {
+        'from_file': measure(
+            lambda _: mhtml.MHTMLArchive_from_file(filename), repeat=repeat),
+        'from_file_lazy': measure(
+            lambda _: mhtml.MHTMLArchive_from_file(filename, lazy=True),
+            repeat=repeat),
+        'from_file_cached': measure(
+            lambda _: mhtml.MHTMLArchive_from_file(filename, cache=cache),
+            repeat=repeat),
+        'from_file_cached_lazy': measure(
+            lambda _: mhtml.MHTMLArchive_from_file(filename, lazy=True,
+                                                   cache=cache),
+            repeat=repeat),
+    }
+
+
+def bench_compressed(content, repeat, folder):
+    # whole file decompression + buffer parse vs. streaming parts
+    filename = os.path.join(folder, 'in.mhtml.gz')
+    mhtml.MHTMLArchive_to_file(mhtml.parse_mhtml_struct(content), filename)
+    return {
+        'from_file_gzip': measure(
+            lambda _: mhtml.MHTMLArchive_from_file(filename), repeat=repeat),
+        'iter_file_parts_gzip': measure(
+            lambda _: list(mhtml.iter_file_parts(filename)), repeat=repeat),
+    }
+
+
+def bench_mutations(content, repeat):
+    def setup():
+        return mhtml.parse_mhtml_struct(content)
+
+    def remove(mhtarc):
+        # from the front, worst case for moving data and offsets
+        for _ in range(min(10, len(mhtarc.resources) - 1)):
+            mhtarc.remove_resource(1)
+
+    other = mhtml.parse_mhtml_struct(content)
+
+    def insert(mhtarc):
+        for resource in other.resources[1:11]:
+            mhtarc.insert_resource(1, resource)
+
+    return {
+        'remove_resource': measure(remove, setup=setup, repeat=repeat),
+        'insert_resource': measure(insert, setup=setup, repeat=repeat),
+    }
+
+
+def bench_to_file(content, repeat, folder):
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    filename = os.path.join(folder, 'out.mhtml')
+    return {
+        'MHTMLArchive_to_file': measure(
+            lambda _: mhtml.MHTMLArchive_to_file(mhtarc, filename),
+            repeat=repeat),
+    }
+
+
+def bench_scripts(content, repeat, folder):
+    # pylint: disable=import-outside-toplevel
+    from mhtml_scripts import extract, extract_main, merge, show_headers
+    from mhtml_scripts import show_infos, strip
+
+    filename = os.path.join(folder, 'in.mhtml')
+    with open(filename, 'wb') as fout:
+        fout.write(content)
+    out_dir = os.path.join(folder, 'out')
+
+    def clean_out_dir():
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    def run(func):
+        def wrapper(_):
+            with quiet():
+                func()
+        return wrapper
+
+    out_file = os.path.join(folder, 'out.file')
+    return {
+        'script_extract': measure(
+            run(lambda: extract.main(filename, out_dir)),
+            setup=clean_out_dir, repeat=repeat),
+        'script_extract_main': measure(
+            run(lambda: extract_main.main(filename, out_file)),
+            repeat=repeat),
+        'script_merge': measure(
+            run(lambda: merge.main(out_file, [filename, filename])),
+            repeat=repeat),
+        'script_show_headers': measure(
+            run(lambda: show_headers.main(filename)), repeat=repeat),
+        'script_show_infos': measure(
+            run(lambda: show_infos.main(filename)), repeat=repeat),
+        'script_strip': measure(
+            run(lambda: strip.main(
+                filename, out_file,
+                mhtml.ResourceFilter(exclude='image/*'))),
+            repeat=repeat),
+    }
+
+
+# ----------------------------------------------------------------------------
+
+
+def run_benchmarks(shapes=None, repeat=5, with_scripts=True):
+    if shapes is None:
+        shapes = sorted(SHAPES)
+
+    results = dict()
+    folder = tempfile.mkdtemp(prefix='mhtml-bench-')
+    try:
+        for shape in shapes:
+            content = generate_archive(**SHAPES[shape])
+            params = dict(SHAPES[shape])
+            params['encodings'] = list(params.get('encodings', []))
+
+            timings = dict()
+            timings.update(bench_parse(content, repeat))
+            timings.update(bench_structure(content, repeat))
+            timings.update(bench_cache(content, repeat, folder))
+            timings.update(bench_compressed(content, repeat, folder))
+            timings.update(bench_mutations(content, repeat))
+            timings.update(bench_to_file(content, repeat, folder))
+            if with_scripts:
+                timings.update(bench_scripts(content, repeat, folder))
+
+            for name, values in timings.items():
+                results['{}[{}]'.format(name, shape)] = \
+                    summarize(values, len(content), shape=shape, **params)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return results
+
+
+def run_curves(curves=None, repeat=5):
+    if curves is None:
+        curves = sorted(CURVES)
+
+    results = dict()
+    for curve in curves:
+        param, values, fixed = CURVES[curve]
+        points = list()
+        for value in values:
+            kwargs = dict(fixed)
+            kwargs[param] = value
+            content = generate_archive(**kwargs)
+            timings = measure(lambda _, c=content: mhtml.parse_mhtml_struct(c),
+                              repeat=repeat)
+            point = summarize(timings, len(content))
+            point['x'] = value
+            del point['params']
+            points.append(point)
+        results[curve] = {'param': param, 'points': points}
+
+    return results
+
+
+def run(quick=False, repeat=5, with_scripts=True, with_curves=True):
+    start = time.time()
+    report = {
+        'meta': {
+            'mhtml_version': mhtml.__version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'timestamp': start,
+            'repeat': repeat,
+            'quick': quick,
+        },
+        'benchmarks': run_benchmarks(
+            shapes=QUICK_SHAPES if quick else None, repeat=repeat,
+            with_scripts=with_scripts),
+    }
+    if with_curves:
+        report['curves'] = run_curves(repeat=repeat)
+    report['meta']['duration'] = time.time() - start
+    return report
+
+
+def print_report(report, stream=sys.stderr):
+    for name, result in sorted(report['benchmarks'].items()):
+        print('{:<48} {:>10.3f} ms  +- {:>8.3f}  {:>9.2f} MB/s'.format(
+            name, result['median'] * 1000, result['stdev'] * 1000,
+            result['throughput_mb_s'] or 0.0), file=stream)
+    for name, curve in sorted(report.get('curves', dict()).items()):
+        print('{} ({}):'.format(name, curve['param']), file=stream)
+        for point in curve['points']:
+            print('  {:>10} {:>10.3f} ms  {:>9.2f} MB/s'.format(
+                point['x'], point['median'] * 1000,
+                point['throughput_mb_s'] or 0.0), file=stream)
+
+
+def cli_main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Run MHTML benchmarks, write results as JSON.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON output file (default: stdout)')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='Timed runs per benchmark. (default: 5)')
+    parser.add_argument('-q', '--quick', action='store_true',
+                        help='Only small archive shapes.')
+    parser.add_argument('--no-scripts', action='store_true',
+                        help='Do not benchmark the scripts.')
+    parser.add_argument('--no-curves', action='store_true',
+                        help='Do not compute scaling curves.')
+    args = parser.parse_args()
+
+    # parser warnings and script logging would distort the timings
+    logging.disable(logging.CRITICAL)
+
+    report = run(quick=args.quick, repeat=args.repeat,
+                 with_scripts=not args.no_scripts,
+                 with_curves=not args.no_curves)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(report, fout, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -5,8 +5,21 @@
 __version__ = '0.1.0'
 
 
+import array
+import base64
+import binascii
+import collections
+import contextlib
+import functools
+import io
+import itertools
 import logging
 import os
+import re
+import struct
+import sys
+import threading
+import time
 
 from enum import Enum
 
@@ -18,6 +31,158 @@ logger.addHandler(logging.NullHandler())
 # ----------------------------------------------------------------------------
 
 
+class Stats:
+    # Collects wall time per phase and counters, see `collect_stats()`.
+    # Any object with `add_time(phase, seconds)` and `count(name, amount)`
+    # methods can be used instead, e. g. to forward into a metrics system.
+    def __init__(self):
+        self.timings = dict()
+        self.calls = dict()
+        self.counters = dict()
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        self.timings.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def as_dict(self):
+        return {'timings': dict(self.timings), 'calls': dict(self.calls),
+                'counters': dict(self.counters)}
+
+    def __repr__(self):
+        return 'Stats: ' + repr(self.as_dict())
+
+
+# process wide, `None` if disabled (then only costs a global lookup)
+_stats = None  # pylint: disable=invalid-name
+
+
+def set_stats(stats):
+    global _stats  # pylint: disable=global-statement,invalid-name
+    old_stats, _stats = _stats, stats
+    return old_stats
+
+
+@contextlib.contextmanager
+def collect_stats(stats=None):
+    if stats is None:
+        stats = Stats()
+    old_stats = set_stats(stats)
+    try:
+        yield stats
+    finally:
+        set_stats(old_stats)
+
+
+class RWLock:
+    # Readers/writer lock, many threads can read at once, a writer is
+    # exclusive. Writers are preferred (new readers wait for waiting
+    # writers). Both are reentrant, the writing thread may also read,
+    # upgrading a read to a write lock is not possible (would deadlock).
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = dict()
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        me = threading.get_ident()  # pylint: disable=invalid-name
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me not in self._readers:
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()  # pylint: disable=invalid-name
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth -= 1
+                return
+            count = self._readers.pop(me) - 1
+            if count:
+                self._readers[me] = count
+            elif not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()  # pylint: disable=invalid-name
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError('Can not upgrade a read lock!')
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_LOCK = _NoLock()
+
+
+def _write_locked(method):
+    # for `MHTMLArchive` mutations, only if locking is enabled
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        with lock.write_locked():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# ----------------------------------------------------------------------------
+
+
 class MHTMLArchive:
     def __init__(self, content, headers, header_length, boundary):
         assert isinstance(content, bytes), 'content should be bytes'
@@ -41,6 +206,27 @@ class MHTMLArchive:
         self._boundary = boundary
         self._resources = list()
         self._content = bytearray(content)
+        self._lock = None
+
+    def enable_locking(self):
+        # for sharing between threads: content getters of the archive and
+        # its resources take a read lock, mutations a write lock (archives
+        # inserting resources of each other concurrently can deadlock)
+        if self._lock is None:
+            self._lock = RWLock()
+        return self
+
+    @property
+    def lock(self):
+        return self._lock
+
+    def _read_locked(self):
+        lock = self._lock
+        return lock.read_locked() if lock is not None else _NO_LOCK
+
+    async def save(self, filename, executor=None, compression=None):
+        await save_archive(self, filename, executor=executor,
+                           compression=compression)
 
     @property
     def resources(self):
@@ -60,7 +246,12 @@ class MHTMLArchive:
 
     @property
     def content(self):
-        return bytes(self._content)
+        with self._read_locked():
+            return bytes(self._content)
+
+    def content_view(self):
+        # no copy, see `Resource.content_view()` for the lifetime rules
+        return memoryview(self._content)
 
     @property
     def content_hash(self):
@@ -115,30 +306,64 @@ class MHTMLArchive:
         for resource in self._resources[from_nr:]:
             resource._update_offsets(amount)
 
+        if _stats is not None:
+            _stats.count('offsets_updated', len(self._resources) - from_nr)
+
     def get_resource(self, nr):  # pylint: disable=invalid-name
         if not self._is_valid_resource_index(nr):
             return None
         return self._resources[nr]
 
+    def open_resource(self, nr_or_location, decode=True,
+                      buffer_size=io.DEFAULT_BUFFER_SIZE):
+        # buffered file object for streaming the content of a resource (by
+        # number, location or object), see `ResourceReader`
+        if isinstance(nr_or_location, str):
+            for resource in self._resources:
+                if resource.location == nr_or_location:
+                    break
+            else:
+                resource = None
+        else:
+            _, resource, _ = self._get_resource_and_nr(nr_or_location)
+        if resource is None:
+            raise KeyError('No such resource: {}'.format(nr_or_location))
+        return resource.open(decode=decode, buffer_size=buffer_size)
+
+    @_write_locked
     def remove_resource(self, nr_or_resource):
         nr, resource, ok = self._get_resource_and_nr(nr_or_resource)  # noqa: E501 pylint: disable=invalid-name
         if not ok:
             return False
 
+        stats = _stats
+        if stats is not None:
+            time_start = time.perf_counter()
+
         # compute ranges
         boundary_length = len(self._boundary) + 4
         start, end = resource.get_resource_range(boundary_length)
 
-        # remove
+        if stats is not None:
+            stats.count('bytes_copied', max(0, len(self._content) - end))
+
+        # remove, the resource is detached (its offsets would point to other
+        # content), lazy headers are parsed before
+        resource.headers  # pylint: disable=pointless-statement
         del self._content[start:end]
         del self._resources[nr]
+        resource._mhtml_file = None
 
         # update offsets of following resources
         resource_length = end - start
         self._update_offsets(-resource_length, nr)
 
+        if stats is not None:
+            stats.add_time('remove_resource', time.perf_counter() - time_start)
+
         return True
 
+    @_write_locked
     def insert_resource(self, nr, resource):  # pylint: disable=invalid-name
         if not isinstance(nr, int):
             return False
@@ -147,6 +372,10 @@ class MHTMLArchive:
         # TODO: check if same MHTML file?
         # should be ok, e. g. if reordering of resources in same file
 
+        stats = _stats
+        if stats is not None:
+            time_start = time.perf_counter()
+
         # no resources in file? - should normally not be possible ...
         if not self._resources:
             offset = self._header_length
@@ -165,8 +394,10 @@ class MHTMLArchive:
                 offset = other_res.get_resource_range()[1]
                 needs_offset_update = False
 
-        # new content
+        # new content, none if the resource has been removed (detached)
         content = resource.content_with_headers
+        if content is None:
+            raise ValueError('Resource has been removed from the archive!')
         boundary = bytes('--' + self.boundary + '\r\n', 'ascii')
         resource_length = len(content) + len(boundary)
 
@@ -179,6 +410,11 @@ class MHTMLArchive:
         new_resource = Resource(self, resource.headers, offset_start,
                                 offset_content, offset_end)
 
+        if stats is not None:
+            # both inserts move the tail
+            stats.count('bytes_copied', 2 * (len(self._content) - offset) +
+                        resource_length)
+
         # insert new content
         self._content[offset:offset] = content
         self._content[offset:offset] = boundary
@@ -188,11 +424,15 @@ class MHTMLArchive:
             # to be more explicit, only when really neccessary
             self._update_offsets(resource_length, nr + 1)
 
+        if stats is not None:
+            stats.add_time('insert_resource', time.perf_counter() - time_start)
+
         return True
 
     def append_resource(self, resource):
         return self.insert_resource(len(self._resources), resource)
 
+    @_write_locked
     def move_resource(self, nr_or_resource, to_pos):
         nr, resource, ok = self._get_resource_and_nr(nr_or_resource)  # noqa: E501 pylint: disable=invalid-name
         if not ok:
@@ -211,15 +451,25 @@ class MHTMLArchive:
         # moving to front of old pos will increase the nr
         return self.remove_resource(resource)
 
+    @_write_locked
     def replace_content(self, nr_or_resource, content):
         nr, resource, ok = self._get_resource_and_nr(nr_or_resource)  # noqa: E501 pylint: disable=invalid-name
         if not ok:
             return False
 
+        stats = _stats
+        if stats is not None:
+            time_start = time.perf_counter()
+
         # get content range of old
         offset_content = resource._offset_content
         offset_end = resource._offset_end
 
+        if stats is not None:
+            moved = len(self._content) - offset_end \
+                if len(content) != offset_end - offset_content else 0
+            stats.count('bytes_copied', moved + len(content))
+
         # replace
         self._content[offset_content:offset_end] = content
 
@@ -230,6 +480,9 @@ class MHTMLArchive:
         resource._offset_end += delta
         self._update_offsets(delta, nr + 1)
 
+        if stats is not None:
+            stats.add_time('replace_content', time.perf_counter() - time_start)
+
         return True
 
 
@@ -378,14 +631,173 @@ class ContentEncoding(Enum):
         return cls.UNKNOWN
 
 
+class _Base64Decoder:
+    # incremental, keeps incomplete 4 character groups for the next chunk
+    def __init__(self):
+        self._rest = b''
+
+    def decode(self, data, final=False):
+        data = self._rest + bytes(data).translate(None, b' \t\r\n')
+        if final:
+            self._rest = b''
+        else:
+            cut = len(data) - len(data) % 4
+            data, self._rest = data[:cut], data[cut:]
+        return binascii.a2b_base64(data) if data else b''
+
+
+class _QuotedPrintableDecoder:
+    # incremental, decodes complete lines (soft line breaks included)
+    def __init__(self):
+        self._rest = b''
+
+    def decode(self, data, final=False):
+        data = self._rest + bytes(data)
+        if final:
+            self._rest = b''
+        else:
+            cut = data.rfind(b'\n') + 1
+            if not cut:
+                # long line, do not split an escape sequence
+                cut = data.find(b'=', max(0, len(data) - 2))
+                if cut == -1:
+                    cut = len(data)
+            data, self._rest = data[:cut], data[cut:]
+        return binascii.a2b_qp(data) if data else b''
+
+
+class ResourceReader(io.RawIOBase):
+    # Raw file object over the content span of a resource (in the spirit of
+    # `zipfile.ZipFile.open()`), reads copy only the requested range and
+    # follow offset changes of the archive. If `decode` the payload is read
+    # like `decode_payload()` returns it, base64 and quoted-printable
+    # content is decoded in chunks of `chunk_size` encoded bytes, only
+    # undecoded content is seekable.
+    def __init__(self, resource, decode=True, chunk_size=64 * 1024):
+        super().__init__()
+        self._resource = resource
+        self._payload = decode
+        self._chunk_size = chunk_size
+        self._pos = 0
+        self._decoder = None
+        self._pending = b''
+        self._pending_pos = 0
+        self._eof = False
+
+        if decode:
+            encoding = ContentEncoding.parse(resource.headers.encoding)
+            if encoding is ContentEncoding.BASE64:
+                self._decoder = _Base64Decoder()
+            elif encoding is ContentEncoding.QUOTEDPRINTABLE:
+                self._decoder = _QuotedPrintableDecoder()
+            elif encoding is ContentEncoding.UNKNOWN and \
+                    resource.headers.encoding:
+                logger.warning('Unknown content encoding: %s, not decoded',
+                               resource.headers.encoding)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._decoder is None
+
+    def _archive(self):
+        archive = self._resource._mhtml_file
+        if archive is None:
+            raise ValueError('Resource has been removed from the archive!')
+        return archive
+
+    def _end(self, archive):
+        # end of the span to read, with the read lock of `archive` held
+        resource = self._resource
+        if resource._mhtml_file is not archive:
+            raise ValueError('Resource has been removed from the archive!')
+        if not self._payload:
+            return resource._offset_end
+        return _payload_end(archive._content, resource._offset_content,
+                            resource._offset_end)
+
+    def _size(self):
+        archive = self._archive()
+        with archive._read_locked():
+            return self._end(archive) - self._resource._offset_content
+
+    def _copy_span(self, buffer, size):
+        # copies encoded content at the current position into `buffer`
+        resource = self._resource
+        archive = self._archive()
+        with archive._read_locked():
+            end_pos = self._end(archive)
+            start = resource._offset_content + self._pos
+            end = min(start + size, end_pos)
+            if end <= start:
+                return 0
+            with memoryview(archive._content) as view:
+                buffer[:end - start] = view[start:end]
+        self._pos += end - start
+        return end - start
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        with memoryview(buffer) as view, view.cast('B') as out:
+            if self._decoder is None:
+                return self._copy_span(out, len(out))
+
+            while self._pending_pos >= len(self._pending) and \
+                    not self._eof:
+                chunk = bytearray(self._chunk_size)
+                num = self._copy_span(chunk, len(chunk))
+                self._eof = not num
+                self._pending = self._decoder.decode(
+                    memoryview(chunk)[:num], final=self._eof)
+                self._pending_pos = 0
+
+            num = min(len(out), len(self._pending) - self._pending_pos)
+            out[:num] = self._pending[self._pending_pos:
+                                      self._pending_pos + num]
+            self._pending_pos += num
+            return num
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if not self.seekable():
+            raise io.UnsupportedOperation('Decoded content is not seekable!')
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size() + offset
+        else:
+            raise ValueError('Invalid whence: {}'.format(whence))
+        if pos < 0:
+            raise ValueError('Negative seek position {}'.format(pos))
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        if not self.seekable():
+            raise io.UnsupportedOperation('Decoded content is not seekable!')
+        return self._pos
+
+
 class Resource:
+    # lazy headers of a loaded structure (see `loads_structure()`) are built
+    # from its string table, else parsed from the archive content
+    _header_table = None
+    _header_nr = None
+
     # pylint: disable=too-many-arguments
     def __init__(self, mhtml_file, headers,
-                 offset_start, offset_content, offset_end):
+                 offset_start, offset_content, offset_end,
+                 lazy_headers=False):
         assert isinstance(mhtml_file, MHTMLArchive), \
             'mhtml_file should be a MHTMLArchive'
 
-        if not isinstance(headers, ResourceHeader):
+        if headers is None and lazy_headers:
+            # parsed from archive content on first access
+            pass
+        elif not isinstance(headers, ResourceHeader):
             if isinstance(headers, (list, dict)):
                 logger.debug('Converting list/dict headers into '
                              'ResourceHeader')
@@ -404,6 +816,16 @@ class Resource:
 
     @property
     def headers(self):
+        if self._headers is None:
+            if self._header_table is not None:
+                self._headers = self._header_table.headers(self._header_nr)
+                return self._headers
+            # set before the resource is removed from the archive
+            archive = self._mhtml_file
+            with archive._read_locked():
+                if self._headers is None:
+                    self._headers, _ = parse_header(archive._content,
+                                                    self._offset_start)
         return self._headers
 
     @property
@@ -428,14 +850,24 @@ class Resource:
 
     @property
     def content_with_headers(self):
-        if not self._mhtml_file:
+        return self._copy(with_headers=True)
+
+    def _copy(self, with_headers=False):
+        # archive content of the resource, None if there is no content or
+        # the resource has been removed from the archive (also while waiting
+        # for the lock, its offsets are invalid then)
+        archive = self._mhtml_file
+        if not archive:
             return None
-        if not isinstance(self._mhtml_file._content, bytearray):
+        if not isinstance(archive._content, (bytearray, memoryview)):
             return None
 
-        content = bytes(self._mhtml_file
-                        ._content[self._offset_start:self._offset_end])
-        return content
+        with archive._read_locked():
+            if self._mhtml_file is not archive:
+                return None
+            start = self._offset_start if with_headers \
+                else self._offset_content
+            return bytes(archive._content[start:self._offset_end])
 
     @property
     def content_hash(self):
@@ -451,23 +883,54 @@ class Resource:
         m.update(self.content_with_headers)
         return m.digest()
 
-    def get_short_filename(self, default='res.bin'):
-        return make_filename(self._headers, default=default)
+    def content_view(self):
+        # memoryview of the (encoded) content in the archive buffer without
+        # a copy, it shows later changes of the buffer, mutations that resize
+        # the archive raise BufferError while a view exists, so release it
+        # (`with res.content_view() as view:`) before changing the archive
+        return self._view()
 
-    def get_content(self, decode=False):
-        if not self._mhtml_file:
+    def content_with_headers_view(self):
+        return self._view(with_headers=True)
+
+    def _view(self, with_headers=False):
+        archive = self._mhtml_file
+        if not archive:
             return None
-        if not isinstance(self._mhtml_file._content, bytearray):
+        content = archive._content
+        if not isinstance(content, (bytearray, memoryview)):
             return None
 
-        print('b')
-        content = bytes(self._mhtml_file
-                        ._content[self._offset_content:self._offset_end])
+        with archive._read_locked():
+            if self._mhtml_file is not archive:
+                return None
+            start = self._offset_start if with_headers \
+                else self._offset_content
+            return memoryview(content)[start:self._offset_end]
+
+    def __buffer__(self, flags):
+        # buffer protocol (Python 3.12+), e. g. `hashlib.sha256(resource)`
+        view = self.content_view()
+        if view is None:
+            raise BufferError('Resource has no content!')
+        return view
+
+    def open(self, decode=True, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        return io.BufferedReader(ResourceReader(self, decode=decode),
+                                 buffer_size=buffer_size)
+
+    def get_short_filename(self, default='res.bin'):
+        return make_filename(self.headers, default=default)
+
+    def get_content(self, decode=False):
+        content = self._copy()
+        if content is None:
+            return None
 
         if not decode:
             return content
 
-        encoding = self._headers.encoding
+        encoding = self.headers.encoding
         encoding = ContentEncoding.parse(encoding)
 
         if encoding in (ContentEncoding.BINARY, ContentEncoding.SEVENBIT,
@@ -483,13 +946,14 @@ class Resource:
 
         # if encoding is ContentEncoding.UNKNOWN:
         logger.warning('Unknown content encoding: %s',
-                       self._headers.encoding)
+                       self.headers.encoding)
         return None
 
     def set_content(self, content):
         if not self._mhtml_file:
             return False
-        if not isinstance(self._mhtml_file._content, bytearray):
+        # read-only (shared) archives raise in `replace_content`
+        if not isinstance(self._mhtml_file._content, (bytearray, memoryview)):
             return False
 
         # TODO: type check, conversions?
@@ -540,7 +1004,49 @@ def next_line(content, from_pos):
     return line, next_pos
 
 
-def parse_header(content, from_pos):
+# header fields end at the first linebreak not followed by a tab (folding)
+_HEADER_LINE_SEP = re.compile(r'\r\n(?!\t)')
+
+
+def find_header_end(content, from_pos):
+    # returns end of header fields (without last linebreak) and start of
+    # content after the empty line, or (-1, -1) if there is no empty line
+    if content[from_pos:from_pos + 2] == b'\r\n':
+        return from_pos, from_pos + 2
+
+    end_pos = content.find(b'\r\n\r\n', from_pos)
+    if end_pos == -1:
+        return -1, -1
+
+    return end_pos, end_pos + 4
+
+
+def _make_header(fields):
+    # takes the list of (name, value) tuples as is, without the checks and
+    # copying of the constructor
+    header = ResourceHeader.__new__(ResourceHeader)
+    header._headers = fields
+    return header
+
+
+def parse_header_block(block):
+    # whole block of header fields, decoded once and split in bulk
+    fields = list()
+    if not block:
+        return ResourceHeader()
+
+    for line in _HEADER_LINE_SEP.split(block.decode()):
+        name, sep, value = line.partition(': ')
+        if not sep:
+            logger.warning('No separator in line: %s', line)
+            continue
+        fields.append((name, value))
+
+    return _make_header(fields)
+
+
+def _parse_header_lines(content, from_pos):
+    # line by line, only for incomplete headers at the end of content
     header = ResourceHeader()
     next_pos = from_pos
 
@@ -567,6 +1073,26 @@ def parse_header(content, from_pos):
     return header, next_pos
 
 
+def parse_header(content, from_pos):
+    stats = _stats
+    if stats is not None:
+        time_start = time.perf_counter()
+
+    fields_end, next_pos = find_header_end(content, from_pos)
+    if fields_end == -1:
+        header, next_pos = _parse_header_lines(content, from_pos)
+    else:
+        header = parse_header_block(content[from_pos:fields_end])
+        if next_pos >= len(content):
+            next_pos = -1
+
+    if stats is not None:
+        stats.add_time('parse_header', time.perf_counter() - time_start)
+        stats.count('headers_parsed')
+
+    return header, next_pos
+
+
 def get_content_type(header_fields):
     ctype = header_fields.get('Content-Type', None)
 
@@ -673,27 +1199,69 @@ def make_uniq_filename(name, pre_dup_str='dup_'):
     return name
 
 
-def find_next_boundary(content, boundary, from_pos):
-    needle = bytes('--' + boundary + '\r\n', 'ascii')
-    next_pos = content.find(needle, from_pos)
-
-    if next_pos == -1:
-        needle_end = bytes('--' + boundary + '--\r\n', 'ascii')
-        next_pos = content.find(needle_end, from_pos)
-        if next_pos != -1 and next_pos + len(needle_end) == len(content):
-            return next_pos, -1
-
-        return next_pos, next_pos
+class BoundaryScanner:
+    # Searches the delimiter `--boundary\r\n` and the close delimiter
+    # `--boundary--\r\n` with a single search for their common prefix.
+    # A match has to be preceded by a linebreak, else the search continues
+    # after it. A real delimiter can not overlap such a false match (it would
+    # need the linebreak inside of it), so every byte is scanned only once
+    # and a whole archive is scanned in O(n), even with many lookalikes.
+    def __init__(self, boundary):
+        self.boundary = boundary
+        self.prefix = bytes('--' + boundary, 'ascii')
+        self.delimiter = self.prefix + b'\r\n'
+        self.close_delimiter = self.prefix + b'--\r\n'
+
+    def find(self, content, from_pos):
+        prefix = self.prefix
+        prefix_len = len(prefix)
+        pos = from_pos
+        num_false = 0
+
+        while True:
+            pos = content.find(prefix, pos)
+            if pos == -1:
+                next_pos = end_pos = -1
+                break
+
+            after_pos = pos + prefix_len
+            if pos >= 2 and content[pos - 2:pos] == b'\r\n':
+                after = content[after_pos:after_pos + 4]
+                if after[:2] == b'\r\n':
+                    end_pos, next_pos = pos, after_pos + 2
+                    break
+                if after == b'--\r\n':
+                    # close delimiter, anything after it is ignored
+                    end_pos, next_pos = pos, -1
+                    break
+
+            logger.debug('Found boundary in content?, %d, Search more ...',
+                         pos)
+            num_false += 1
+            pos = after_pos
+
+        if _stats is not None:
+            _stats.count('boundary_searches')
+            _stats.count('boundary_false_positives', num_false)
+            _stats.count('bytes_scanned', (end_pos if end_pos != -1
+                                           else len(content)) - from_pos)
+
+        return end_pos, next_pos
+
+
+@functools.lru_cache(maxsize=32)
+def get_boundary_scanner(boundary):
+    return BoundaryScanner(boundary)
 
-    if content[next_pos - 2:next_pos] != b'\r\n':
-        logger.debug('Found boundary in content?, %d, Search more ...',
-                     next_pos)
-        return find_next_boundary(content, boundary, next_pos + len(needle))
 
-    return next_pos, next_pos + len(needle)
+def find_next_boundary(content, boundary, from_pos):
+    # `boundary` as string or a prebuilt `BoundaryScanner`
+    if not isinstance(boundary, BoundaryScanner):
+        boundary = get_boundary_scanner(boundary)
+    return boundary.find(content, from_pos)
 
 
-def parse_part(content, boundary, from_pos):
+def parse_part(content, boundary, from_pos, lazy=False):
     start_pos = from_pos
     end_pos, next_pos = find_next_boundary(content, boundary, from_pos)
 
@@ -706,12 +1274,28 @@ def parse_part(content, boundary, from_pos):
 
     # TODO: include boundary in start offset?
 
+    if lazy:
+        # only find the end, headers are parsed on first access
+        fields_end, content_pos = find_header_end(content, start_pos)
+        if fields_end != -1 and content_pos <= end_pos:
+            if content_pos >= len(content):
+                content_pos = -1
+            return (None, start_pos, content_pos, end_pos), next_pos
+
     headers, content_pos = parse_header(content, start_pos)
 
     return (headers, start_pos, content_pos, end_pos), next_pos
 
 
-def parse_parts(content, boundary, from_pos):
+def parse_parts(content, boundary, from_pos, lazy=False):
+    stats = _stats
+    if stats is not None:
+        time_start = time.perf_counter()
+
+    # built once per archive
+    if not isinstance(boundary, BoundaryScanner):
+        boundary = BoundaryScanner(boundary)
+
     end_pos, next_pos = find_next_boundary(content, boundary, from_pos)
 
     if end_pos == -1:
@@ -725,12 +1309,144 @@ def parse_parts(content, boundary, from_pos):
 
     while next_pos != -1:
         logger.debug(next_pos)
-        part_data, next_pos = parse_part(content, boundary, next_pos)
+        part_data, next_pos = parse_part(content, boundary, next_pos,
+                                         lazy=lazy)
         parts.append(part_data)
 
+    if stats is not None:
+        stats.add_time('parse_parts', time.perf_counter() - time_start)
+        stats.count('parts_parsed', len(parts))
+
     return parts, next_pos
 
 
+def index_parts(content, boundary, from_pos):
+    # like `parse_parts` but headers are `None` if they can be parsed later
+    return parse_parts(content, boundary, from_pos, lazy=True)
+
+
+def _find_cut_points(content, scanner, first_pos, num_segments):
+    # part starts near equally sized segments, the scan only needs to find
+    # one boundary per cut point
+    cuts = [first_pos]
+    size = (len(content) - first_pos) // num_segments
+    for nr in range(1, num_segments):
+        pos = max(first_pos + nr * size, cuts[-1])
+        _, part_pos = scanner.find(content, pos)
+        if part_pos == -1 or part_pos >= len(content):
+            break
+        if part_pos > cuts[-1]:
+            cuts.append(part_pos)
+    return cuts
+
+
+def _parse_parts_segment(shm_name, start, end, boundary, lazy):
+    # runs in a worker process, parses all parts starting in [start, end),
+    # offsets relative to `start - 2` (the linebreak before the part start
+    # is needed to detect an empty part), part headers that run beyond the
+    # segment are marked with `False` to be parsed again on the full content
+    from multiprocessing import shared_memory  # noqa: E501 pylint: disable=import-outside-toplevel
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        segment = bytes(shm.buf[start - 2:end])
+    finally:
+        shm.close()
+
+    scanner = get_boundary_scanner(boundary)
+    parts = list()
+    next_pos = 2
+    while next_pos != -1 and next_pos < len(segment):
+        part_data, next_pos = parse_part(segment, scanner, next_pos,
+                                         lazy=lazy)
+        headers, start_pos, content_pos, end_pos = part_data
+        if content_pos == -1 or content_pos > end_pos:
+            headers = False
+        elif headers is not None:
+            # plain lists with interned names are much cheaper to pickle
+            headers = [(sys.intern(name), value)
+                       for name, value in headers._headers]
+        parts.append((headers, start_pos, content_pos, end_pos))
+
+    return parts, next_pos == -1
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def parse_parts_parallel(content, boundary, from_pos, jobs=None, lazy=False,
+                         min_segment_size=8 * 1024 * 1024):
+    # like `parse_parts` but the parts are parsed in `jobs` worker processes
+    # (None or 0: one per cpu), the content is handed over once with shared
+    # memory, falls back to `parse_parts` for small content or if shared
+    # memory is not available on the platform
+    try:
+        from multiprocessing import shared_memory  # noqa: E501 pylint: disable=import-outside-toplevel
+        from concurrent.futures import ProcessPoolExecutor  # noqa: E501 pylint: disable=import-outside-toplevel
+    except ImportError:
+        shared_memory = None
+
+    if not jobs or jobs < 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, max(1, (len(content) - from_pos) //
+                         max(1, min_segment_size)))
+
+    if jobs <= 1 or shared_memory is None:
+        return parse_parts(content, boundary, from_pos, lazy=lazy)
+
+    stats = _stats
+    if stats is not None:
+        time_start = time.perf_counter()
+
+    scanner = get_boundary_scanner(boundary)
+    end_pos, next_pos = scanner.find(content, from_pos)
+
+    if end_pos == -1:
+        logger.warning('No parts in file?, %d', from_pos)
+        return [], -1
+
+    if from_pos != end_pos:
+        logger.warning('Should have found first boundary?')
+
+    cuts = _find_cut_points(content, scanner, next_pos, jobs)
+    ends = cuts[1:] + [len(content)]
+
+    shm = shared_memory.SharedMemory(create=True, size=len(content))
+    try:
+        shm.buf[:len(content)] = content
+        with ProcessPoolExecutor(max_workers=len(cuts)) as executor:
+            futures = [executor.submit(_parse_parts_segment, shm.name,
+                                       start, end, boundary, lazy)
+                       for start, end in zip(cuts, ends)]
+            results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # merge offset tables, stop at the end-of-parts boundary
+    parts = list()
+    for start, (segment_parts, is_last) in zip(cuts, results):
+        base = start - 2
+        for headers, start_pos, content_pos, end_pos in segment_parts:
+            if headers is False:
+                part_data, _ = parse_part(content, scanner, base + start_pos,
+                                          lazy=lazy)
+            else:
+                if headers is not None:
+                    headers = _make_header(headers)
+                part_data = (headers, base + start_pos, base + content_pos,
+                             base + end_pos)
+            parts.append(part_data)
+        if is_last:
+            break
+
+    if stats is not None:
+        stats.add_time('parse_parts', time.perf_counter() - time_start)
+        stats.count('parts_parsed', len(parts))
+        stats.count('parallel_segments', len(cuts))
+
+    return parts, -1
+# pylint: enable=too-many-arguments,too-many-locals
+
+
 def parse_mhtml(content):
     pos = 0
 
@@ -760,7 +1476,338 @@ def parse_mhtml(content):
 # ----------------------------------------------------------------------------
 
 
-def parse_mhtml_struct(content, only_header=False):  # noqa: E501 pylint: disable=too-many-locals
+class ResourceFilter:
+    # A resource is removed if it matches any exclude rule (mime-type glob
+    # pattern, location regex or larger than `max_size` bytes). If include
+    # rules are given, it has to match at least one of them to be kept.
+    # pylint: disable=too-many-arguments
+    def __init__(self, include=None, exclude=None, max_size=None,
+                 include_location=None, exclude_location=None,
+                 keep_main=True):
+        def as_list(value):
+            if value is None:
+                return list()
+            if isinstance(value, str):
+                return [value]
+            return list(value)
+
+        self.include = as_list(include)
+        self.exclude = as_list(exclude)
+        self.max_size = max_size
+        self.include_location = [re.compile(pat)
+                                 for pat in as_list(include_location)]
+        self.exclude_location = [re.compile(pat)
+                                 for pat in as_list(exclude_location)]
+        self.keep_main = keep_main
+    # pylint: enable=too-many-arguments
+
+    @staticmethod
+    def _match_type(content_type, patterns):
+        import fnmatch
+        content_type = (content_type or '').lower()
+        return any(fnmatch.fnmatchcase(content_type, pat.lower())
+                   for pat in patterns)
+
+    @staticmethod
+    def _match_location(location, patterns):
+        location = location or ''
+        return any(pat.search(location) for pat in patterns)
+
+    def keep(self, headers, size, is_main=False):
+        if is_main and self.keep_main:
+            return True
+
+        content_type = headers.content_type
+        location = headers.location
+
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self._match_type(content_type, self.exclude):
+            return False
+        if self._match_location(location, self.exclude_location):
+            return False
+
+        if not self.include and not self.include_location:
+            return True
+        return self._match_type(content_type, self.include) \
+            or self._match_location(location, self.include_location)
+
+    def __call__(self, headers, size, is_main=False):
+        return self.keep(headers, size, is_main=is_main)
+
+
+def strip_mhtml(content, fileobj, keep):
+    # single pass, only copies the spans of kept parts into `fileobj`
+    # (no memmove + offset updates like with `remove_resource`)
+    # `keep(headers, size, is_main)`, e. g. a `ResourceFilter`
+    headers, parts = parse_mhtml(content)
+    view = memoryview(content)
+
+    if not parts:
+        logger.warning('No parts found, copy content unchanged.')
+        fileobj.write(view)
+        return 0, 0
+
+    boundary_length = len(get_boundary(headers)) + 4
+    main_location = headers.location
+
+    # header (+ anything before first boundary)
+    fileobj.write(view[:parts[0][1] - boundary_length])
+
+    num_kept = 0
+    for part_headers, start_pos, content_pos, end_pos in parts:
+        size = end_pos - content_pos if content_pos != -1 else 0
+        is_main = main_location is not None \
+            and part_headers.location == main_location
+        if not keep(part_headers, size, is_main):
+            continue
+        num_kept += 1
+        fileobj.write(view[start_pos - boundary_length:end_pos])
+
+    # closing boundary (+ epilogue)
+    fileobj.write(view[parts[-1][3]:])
+
+    return num_kept, len(parts) - num_kept
+
+
+_TRANSFER_ENCODING_RE = re.compile(
+    rb'^(content-transfer-encoding[ \t]*:[ \t]*)[^\r\n]*'
+    rb'(?:\r?\n[ \t][^\r\n]*)*', re.IGNORECASE | re.MULTILINE)
+
+
+def _payload_end(content, start, end):
+    # end of the payload in the content span `start`:`end` of a part, the
+    # linebreak before the next delimiter belongs to the delimiter (RFC 2046)
+    if end - start >= 2 and content[end - 2:end] == b'\r\n':
+        return end - 2
+    return end
+
+
+def _part_payload(data, encoding):
+    # decoded payload of the raw content of a part
+    data = data[:_payload_end(data, 0, len(data))]
+    if encoding is ContentEncoding.BASE64:
+        return _Base64Decoder().decode(data, final=True)
+    if encoding is ContentEncoding.QUOTEDPRINTABLE:
+        return _QuotedPrintableDecoder().decode(data, final=True)
+    return bytes(data)
+
+
+def decode_payload(data, encoding):
+    # decoded payload of the raw content of a part, `encoding` is the value
+    # of its Content-Transfer-Encoding header, unknown encodings are kept
+    return _part_payload(data, ContentEncoding.parse(encoding))
+
+
+def _decoded_content(data, encoding):
+    # `get_content(decode=True)` of container resources: the content as is
+    # for binary, 7bit and 8bit (like `Resource.get_content()`), the
+    # `decode_payload()` of base64 and quoted-printable, None for unknown
+    # encodings (no header is 7bit, RFC 2045)
+    content_encoding = ContentEncoding.parse(encoding)
+    if content_encoding in (ContentEncoding.BASE64,
+                            ContentEncoding.QUOTEDPRINTABLE):
+        return _part_payload(data, content_encoding)
+    if content_encoding is ContentEncoding.UNKNOWN and encoding:
+        logger.warning('Unknown content encoding: %s', encoding)
+        return None
+    return data
+
+
+def _is_8bit_text(data):
+    # RFC 2045 8bit data: no NUL, CR and LF only as CRLF, lines of at most
+    # 998 octets
+    if b'\0' in data:
+        return False
+    return all(len(line) <= 998 and b'\r' not in line and b'\n' not in line
+               for line in data.split(b'\r\n'))
+
+
+def _optimized_payload(data, encoding, marker, quoted_printable):
+    # -> (decoded payload, new encoding) or (None, None) if kept as is
+    encoding = ContentEncoding.parse(encoding)
+    if encoding is not ContentEncoding.BASE64 and not (
+            quoted_printable and
+            encoding is ContentEncoding.QUOTEDPRINTABLE):
+        return None, None
+
+    try:
+        payload = _part_payload(data, encoding)
+    except (binascii.Error, ValueError):
+        logger.warning('Invalid %s content, not converted.', encoding.value)
+        return None, None
+    if marker in payload:
+        logger.debug('Decoded content contains the boundary, not converted.')
+        return None, None
+
+    if encoding is ContentEncoding.QUOTEDPRINTABLE and _is_8bit_text(payload):
+        return payload, b'8bit'
+    return payload, b'binary'
+
+
+def optimize_mhtml(content, fileobj, quoted_printable=False):
+    # single pass like `strip_mhtml()`, base64 parts (and quoted-printable
+    # parts if `quoted_printable`) are written decoded as binary (8bit for
+    # valid text) if the boundary does not show up in the decoded data,
+    # only their Content-Transfer-Encoding header value is changed, all other
+    # bytes are copied -> (number of converted parts, number of parts)
+    headers, parts = parse_mhtml(content)
+    view = memoryview(content)
+
+    if not parts:
+        logger.warning('No parts found, copy content unchanged.')
+        fileobj.write(view)
+        return 0, 0
+
+    boundary = get_boundary(headers)
+    boundary_length = len(boundary) + 4
+    marker = bytes('--' + boundary, 'ascii')
+
+    # header (+ anything before first boundary)
+    fileobj.write(view[:parts[0][1] - boundary_length])
+
+    num_converted = 0
+    for part_headers, start_pos, content_pos, end_pos in parts:
+        payload = None
+        if content_pos != -1:
+            payload, encoding = _optimized_payload(
+                view[content_pos:end_pos], part_headers.encoding, marker,
+                quoted_printable)
+        if payload is None:
+            fileobj.write(view[start_pos - boundary_length:end_pos])
+            continue
+
+        header_block = _TRANSFER_ENCODING_RE.sub(
+            lambda match, enc=encoding: match.group(1) + enc,
+            bytes(view[start_pos:content_pos]), count=1)
+        fileobj.write(view[start_pos - boundary_length:start_pos])
+        fileobj.write(header_block)
+        fileobj.write(payload)
+        fileobj.write(b'\r\n')
+        num_converted += 1
+
+    # closing boundary (+ epilogue)
+    fileobj.write(view[parts[-1][3]:])
+
+    return num_converted, len(parts)
+
+
+def _archive_payloads(content):
+    mhtml_file = parse_mhtml_struct(content)
+    for resource in mhtml_file.resources:
+        headers = [(name, value) for name, value in resource.headers.items()
+                   if name.lower() != 'content-transfer-encoding']
+        yield headers, _part_payload(
+            resource.get_content(),
+            ContentEncoding.parse(resource.headers.encoding))
+
+
+def verify_optimized(content, optimized):
+    # round trip check, both archives have to parse into the same parts with
+    # the same decoded payloads and headers (besides the transfer encoding)
+    num_parts = 0
+    for num_parts, (original, converted) in enumerate(
+            itertools.zip_longest(_archive_payloads(content),
+                                  _archive_payloads(optimized)), 1):
+        if original is None or converted is None:
+            logger.warning('Number of parts differs!')
+            return False
+        if original != converted:
+            logger.warning('Part %d differs!', num_parts)
+            return False
+    logger.debug('Verified %d parts.', num_parts)
+    return True
+
+
+# ----------------------------------------------------------------------------
+
+
+# compression -> magic bytes at the start of the file
+COMPRESSIONS = collections.OrderedDict((
+    ('gzip', b'\x1f\x8b'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('bz2', b'BZh'),
+))
+
+_COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.xz': 'xz', '.bz2': 'bz2'}
+
+
+def detect_compression(head):
+    # name of the compression of data starting with `head` or None
+    for compression, magic in COMPRESSIONS.items():
+        if head[:len(magic)] == magic:
+            return compression
+    return None
+
+
+def compression_from_filename(filename):
+    # by suffix, e. g. "page.mhtml.gz" -> "gzip", None if plain
+    return _COMPRESSION_SUFFIXES.get(os.path.splitext(filename)[1].lower())
+
+
+def _compression_module(compression):
+    # pylint: disable=import-outside-toplevel
+    if compression == 'gzip':
+        import gzip
+        return gzip
+    if compression == 'xz':
+        import lzma
+        return lzma
+    if compression == 'bz2':
+        import bz2
+        return bz2
+    raise ValueError('Unknown compression: {!r}'.format(compression))
+
+
+def decompress(content, compression=None):
+    # `content` is returned as is if not compressed (detected by magic bytes)
+    if compression is None:
+        compression = detect_compression(content[:6])
+        if compression is None:
+            return content
+    return _compression_module(compression).decompress(content)
+
+
+def open_archive_file(filename, mode='rb', compression=None):
+    # binary file object, decompresses/compresses on the fly, for reading
+    # the compression is detected by magic bytes, for writing by the file
+    # suffix if `compression` is not given
+    if mode not in ('rb', 'wb'):
+        raise ValueError('Invalid mode: {!r}'.format(mode))
+    if compression is None:
+        if mode == 'rb':
+            with open(filename, 'rb') as fin:
+                compression = detect_compression(fin.read(6))
+        else:
+            compression = compression_from_filename(filename)
+    if compression is None:
+        return open(filename, mode)
+    return _compression_module(compression).open(filename, mode)
+
+
+def iter_file_parts(filename, chunk_size=64 * 1024):
+    # `ResourcePart` tuples of a (compressed) archive file, streaming with
+    # the incremental parser, memory is bounded by the largest part
+    parser = StreamParser()
+    with open_archive_file(filename, 'rb') as fin:
+        while True:
+            data = fin.read(chunk_size)
+            if not data:
+                break
+            for part in parser.feed(data):
+                yield part
+    for part in parser.close():
+        yield part
+
+
+# ----------------------------------------------------------------------------
+
+
+def parse_mhtml_struct(content, only_header=False, lazy=False, jobs=1):  # noqa: E501 pylint: disable=too-many-locals
+    stats = _stats
+    if stats is not None:
+        time_start = time.perf_counter()
+
     pos = 0
 
     # parse main header
@@ -781,37 +1828,1299 @@ def parse_mhtml_struct(content, only_header=False):  # noqa: E501 pylint: disabl
 
     mhtml_file = MHTMLArchive(content, headers, header_end_pos, boundary)
 
+    if stats is not None:
+        time_header = time.perf_counter()
+        stats.add_time('parse_main_header', time_header - time_start)
+
     if only_header:
         return mhtml_file
 
     # parse body parts ...
-    parts, parts_end_pos = parse_parts(content, boundary, header_end_pos)
+    # (lazy: only offsets, resource headers are parsed on first access)
+    if jobs != 1:
+        parts, parts_end_pos = parse_parts_parallel(
+            content, boundary, header_end_pos, jobs=jobs, lazy=lazy)
+    else:
+        parse_func = index_parts if lazy else parse_parts
+        parts, parts_end_pos = parse_func(content, boundary, header_end_pos)
     logger.debug('Got %d parts.', len(parts))
     assert parts_end_pos == -1, 'file should be completly parsed'
 
+    if stats is not None:
+        time_parts = time.perf_counter()
+
     resources = list()
     for part_data in parts:
         headers, start_pos, content_pos, end_pos = part_data
-        resource = Resource(mhtml_file, headers,
-                            start_pos, content_pos, end_pos)
+        if headers is None:
+            resource = Resource(mhtml_file, None, start_pos, content_pos,
+                                end_pos, lazy_headers=True)
+        else:
+            resource = Resource(mhtml_file, headers,
+                                start_pos, content_pos, end_pos)
         resources.append(resource)
     mhtml_file._set_resources(resources)
 
+    if stats is not None:
+        time_end = time.perf_counter()
+        stats.add_time('build_resources', time_end - time_parts)
+        stats.add_time('parse_mhtml_struct', time_end - time_start)
+        stats.count('bytes_parsed', len(content))
+
     return mhtml_file
 
 
 # pylint: disable=invalid-name
-def MHTMLArchive_from_file(filename, only_header=False):  # noqa: N802
+def MHTMLArchive_from_file(filename, only_header=False, lazy=False, jobs=1,  # noqa: N802,E501
+                           cache=None):
+    # `cache` is an optional `ParseCache`, gzip/xz/bz2 compressed files are
+    # decompressed transparently. Decompressing as a whole and parsing the
+    # buffer is deliberate: the archive needs the complete content anyway,
+    # the boundary scan of a buffer is faster than `StreamParser` (which
+    # copies every part) and in one thread nothing would overlap, for
+    # streaming see `iter_file_parts()`
     with open(filename, 'rb') as fin:
         content = fin.read()
+    file_size = len(content)
+    content = decompress(content)
+
+    use_cache = cache is not None and not only_header
+    if use_cache:
+        mhtml_file = cache.get(filename, content, file_size=file_size,
+                               lazy=lazy)
+        if mhtml_file is not None:
+            return mhtml_file
 
-    return parse_mhtml_struct(content, only_header=only_header)
+    mhtml_file = parse_mhtml_struct(content, only_header=only_header,
+                                    lazy=lazy, jobs=jobs)
 
+    if use_cache:
+        cache.put(filename, content, mhtml_file, file_size=file_size)
+    return mhtml_file
+
+
+def MHTMLArchive_to_file(mhtml_archive, filename, compression=None):  # noqa: N802,E501
+    # compressed if `compression` is given or by file suffix (.gz/.xz/.bz2)
+    stats = _stats
+    if stats is not None:
+        time_start = time.perf_counter()
 
-def MHTMLArchive_to_file(mhtml_archive, filename):  # noqa: N802
-    with open(filename, 'wb') as fout:
-        fout.write(mhtml_archive.content)
+    with open_archive_file(filename, 'wb', compression) as fout:
+        content = mhtml_archive.content
+        fout.write(content)
+
+    if stats is not None:
+        stats.add_time('to_file', time.perf_counter() - time_start)
+        stats.count('bytes_written', len(content))
 # pylint: enable=invalid-name
 
 
+# ----------------------------------------------------------------------------
+
+
+_STRUCT_MAGIC = b'MHTS'
+_STRUCT_VERSION = 2
+# magic, version, boundary string, number of strings, main header fields
+# and parts, main header length, content length
+_STRUCT_HEAD = struct.Struct('<4sB3xIIIIqq')
+_NO_STRING = 0xFFFFFFFF
+_U32 = 'I' if array.array('I').itemsize == 4 else 'L'
+
+
+def _array_to_bytes(values):
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _array_from_bytes(typecode, data, pos, count):
+    values = array.array(typecode)
+    end_pos = pos + count * values.itemsize
+    if end_pos > len(data):
+        raise ValueError('Truncated archive structure!')
+    values.frombytes(data[pos:end_pos])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values, end_pos
+
+
+def dumps_structure(mhtml_archive):
+    # compact encoding of the parsed structure without the content (see
+    # `loads_structure()`): header names and values are stored once in a
+    # string table, offsets and string indices as little endian arrays
+    resources = mhtml_archive.resources
+    boundary = mhtml_archive.boundary
+    headers = [resource.headers.items() for resource in resources]
+
+    # string -> index in the string table, in order of first appearance
+    index = dict()
+    if boundary is not None:
+        index[boundary] = 0
+    setdefault = index.setdefault
+    main_fields = array.array(_U32, [
+        setdefault(value, len(index)) for value in
+        itertools.chain.from_iterable(mhtml_archive.headers.items())])
+    fields = array.array(_U32, [
+        setdefault(value, len(index)) for value in
+        itertools.chain.from_iterable(itertools.chain.from_iterable(
+            headers))])
+    strings = list(index)
+    offsets = array.array('q', itertools.chain.from_iterable(
+        (resource._offset_start, resource._offset_content,
+         resource._offset_end, len(resource_headers))
+        for resource, resource_headers in zip(resources, headers)))
+    boundary = 0 if boundary is not None else _NO_STRING
+
+    # byte lengths, so that single strings can be decoded
+    encoded = [value.encode('utf-8', 'surrogateescape') for value in strings]
+    lengths = array.array(_U32, map(len, encoded))
+    text = b''.join(encoded)
+
+    return b''.join((
+        _STRUCT_HEAD.pack(_STRUCT_MAGIC, _STRUCT_VERSION, boundary,
+                          len(strings), len(main_fields) // 2,
+                          len(resources),
+                          mhtml_archive._header_length,
+                          len(mhtml_archive._content)),
+        _array_to_bytes(lengths), struct.pack('<q', len(text)), text,
+        _array_to_bytes(main_fields), _array_to_bytes(offsets),
+        _array_to_bytes(fields)))
+
+
+class _HeaderTable:
+    # Header fields of the parts of a `dumps_structure()` table as indices
+    # into its string table. The strings are decoded on the first access of
+    # part headers, a `ResourceHeader` is built when it is accessed, so
+    # loading only costs a few array copies.
+    def __init__(self, text, string_offsets, fields, field_offsets):
+        self._text = text
+        self._string_offsets = string_offsets
+        self._fields = fields
+        self._field_offsets = field_offsets
+        self._strings = None
+
+    def string(self, idx):
+        # single string, without decoding the table
+        if self._strings is not None:
+            return self._strings[idx]
+        return self._text[self._string_offsets[idx]:
+                          self._string_offsets[idx + 1]] \
+            .decode('utf-8', 'surrogateescape')
+
+    def _decode_strings(self):
+        text = self._text
+        offsets = self._string_offsets
+        # byte offsets are character offsets of ASCII text, decoded at once
+        if text.isascii():
+            text = text.decode('ascii')
+            strings = [text[start:end]
+                       for start, end in zip(offsets, offsets[1:])]
+        else:
+            strings = [text[start:end].decode('utf-8', 'surrogateescape')
+                       for start, end in zip(offsets, offsets[1:])]
+        # assigned at once, concurrent calls only decode twice
+        self._strings = strings
+        return strings
+
+    def make_header(self, indices):
+        strings = self._strings
+        if strings is None:
+            strings = self._decode_strings()
+        values = [strings[idx] for idx in indices]
+        return _make_header(list(zip(values[0::2], values[1::2])))
+
+    def headers(self, nr):  # pylint: disable=invalid-name
+        return self.make_header(self._fields[2 * self._field_offsets[nr]:
+                                             2 * self._field_offsets[nr + 1]])
+
+    def all_headers(self):
+        # headers of all parts, (name, value) pairs are built at once
+        strings = self._strings
+        if strings is None:
+            strings = self._decode_strings()
+        fields = self._fields
+        pairs = list(zip(map(strings.__getitem__, fields[0::2]),
+                         map(strings.__getitem__, fields[1::2])))
+        offsets = self._field_offsets
+        return [_make_header(pairs[start:end])
+                for start, end in zip(offsets, offsets[1:])]
+
+
+def _loads_structure(data):
+    # -> (main headers, header length, boundary, content length, part
+    # offsets (start, content, end, number of fields), `_HeaderTable`)
+    # pylint: disable=too-many-locals
+    if len(data) < _STRUCT_HEAD.size:
+        raise ValueError('Truncated archive structure!')
+    magic, version, boundary, num_strings, num_main_fields, num_parts, \
+        header_length, content_length = _STRUCT_HEAD.unpack_from(data)
+    if magic != _STRUCT_MAGIC or version != _STRUCT_VERSION:
+        raise ValueError('Unknown archive structure format!')
+
+    lengths, pos = _array_from_bytes(_U32, data, _STRUCT_HEAD.size,
+                                     num_strings)
+    if pos + 8 > len(data):
+        raise ValueError('Truncated archive structure!')
+    text_length, = struct.unpack_from('<q', data, pos)
+    pos += 8
+    text = bytes(data[pos:pos + text_length])
+    pos += text_length
+    string_offsets = array.array('q', itertools.chain(
+        (0,), itertools.accumulate(lengths)))
+    if string_offsets[-1] != len(text):
+        raise ValueError('Truncated archive structure!')
+
+    main_fields, pos = _array_from_bytes(_U32, data, pos,
+                                         2 * num_main_fields)
+    offsets, pos = _array_from_bytes('q', data, pos, 4 * num_parts)
+    field_offsets = array.array('q', itertools.chain(
+        (0,), itertools.accumulate(offsets[3::4])))
+    fields, pos = _array_from_bytes(_U32, data, pos, 2 * field_offsets[-1])
+    if max(itertools.chain(main_fields, fields), default=0) >= \
+            max(num_strings, 1) or (boundary != _NO_STRING and
+                                    boundary >= num_strings):
+        raise ValueError('Invalid string index in archive structure!')
+
+    table = _HeaderTable(text, string_offsets, fields, field_offsets)
+    values = [table.string(idx) for idx in main_fields]
+    main_headers = _make_header(list(zip(values[0::2], values[1::2])))
+    return (main_headers, header_length,
+            table.string(boundary) if boundary != _NO_STRING else None,
+            content_length, offsets, table)
+
+
+def _structure_resources(cls, owner, offsets, table, lazy):
+    # `cls` resources of a loaded structure, headers from the string table,
+    # built on first access if `lazy`
+    spans = zip(offsets[0::4], offsets[1::4], offsets[2::4])
+    if not lazy:
+        return [cls(owner, headers, start_pos, content_pos, end_pos)
+                for headers, (start_pos, content_pos, end_pos)
+                in zip(table.all_headers(), spans)]
+
+    resources = list()
+    for nr, (start_pos, content_pos, end_pos) in enumerate(spans):
+        resource = cls(owner, None, start_pos, content_pos, end_pos,
+                       lazy_headers=True)
+        resource._header_table = table
+        resource._header_nr = nr
+        resources.append(resource)
+    return resources
+
+
+def loads_structure(data, content, lazy=True):
+    # archive from `dumps_structure()` output and the matching content,
+    # resource headers are built on first access if `lazy` (else all at
+    # once). Lazy loading is the fast path, building all headers costs
+    # about as much as creating the resources.
+    headers, header_length, boundary, content_length, offsets, table = \
+        _loads_structure(data)
+    if len(content) != content_length:
+        raise ValueError('Content does not match the archive structure!')
+
+    mhtml_file = MHTMLArchive(content, headers, header_length, boundary)
+    mhtml_file._set_resources(_structure_resources(
+        Resource, mhtml_file, offsets, table, lazy))
+    return mhtml_file
+
+
+def _attach_shared_memory(name):
+    from multiprocessing import shared_memory  # noqa: E501 pylint: disable=import-outside-toplevel
+    try:
+        # Python 3.13+, only the owner should unlink the segment
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedArchive:
+    # Publishes the content and parsed structure of an archive in shared
+    # memory (Python 3.8+). Workers only need the small picklable `handle`
+    # to `attach_archive()` it without copying. The owner has to `close()`
+    # it when all workers are done, this frees the shared memory.
+    def __init__(self, mhtml_archive):
+        from multiprocessing import shared_memory  # noqa: E501 pylint: disable=import-outside-toplevel
+
+        assert isinstance(mhtml_archive, MHTMLArchive), \
+            'mhtml_archive should be a MHTMLArchive'
+
+        table = dumps_structure(mhtml_archive)
+        content = mhtml_archive._content
+        size = len(content) + len(table)
+
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._shm.buf[:len(content)] = content
+        self._shm.buf[len(content):size] = table
+        self._handle = (self._shm.name, len(content), len(table))
+
+    @property
+    def handle(self):
+        return self._handle
+
+    @property
+    def name(self):
+        return self._handle[0]
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SharedMHTMLArchive(MHTMLArchive):
+    # Read-only archive view onto a `SharedArchive`, content getters work
+    # as usual (and copy only the requested slice), mutations raise.
+    def __init__(self, shm, content_length, table):
+        headers, header_length, boundary, _, offsets, header_table = \
+            _loads_structure(table)
+        super().__init__(b'', headers, header_length, boundary)
+
+        self._shm = shm
+        self._content = shm.buf[:content_length].toreadonly()
+        self._set_resources(_structure_resources(
+            Resource, self, offsets, header_table, lazy=True))
+
+    def close(self):
+        # resources can not be used afterwards
+        if self._shm is None:
+            return
+        self._content.release()
+        self._shm.close()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Shared archive is read-only!')
+
+    remove_resource = _read_only
+    insert_resource = _read_only
+    append_resource = _read_only
+    replace_content = _read_only
+
+
+def attach_archive(handle):
+    # `handle` of a `SharedArchive`, close the returned archive when done
+    name, content_length, table_length = handle
+    shm = _attach_shared_memory(name)
+    table = bytes(shm.buf[content_length:content_length + table_length])
+    return SharedMHTMLArchive(shm, content_length, table)
+
+
+# ----------------------------------------------------------------------------
+
+
+class ParseCache:
+    # On-disk cache of parsed archive structures (see `dumps_structure()`)
+    # in a sqlite3 database in `directory`, keyed by the real path, size,
+    # mtime and a digest of the content (only computed if the others
+    # match an entry). Safe for concurrent use from multiple threads and
+    # processes (WAL journal, a connection per operation). The least
+    # recently used entries are evicted if the stored structures exceed
+    # `max_size` bytes. `full_hash=False` only digests the first and last
+    # 64 KiB, faster but an in-place edit that keeps size and mtime returns
+    # a stale structure. Files smaller than `min_size` bytes are not cached:
+    # `MHTMLArchive_from_file()` reads and decompresses the file before the
+    # lookup and opening the database costs more than parsing them. A hit
+    # still hashes the content and loads the structure, it pays off for
+    # archives with many parts, less so for few large ones.
+    FILENAME = 'mhtml-parse-cache.sqlite3'
+    SAMPLE_SIZE = 64 * 1024
+    MIN_SIZE = 256 * 1024
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024,
+                 full_hash=True, min_size=MIN_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self._filename = os.path.join(directory, self.FILENAME)
+        self._max_size = max_size
+        self._full_hash = full_hash
+        self._min_size = min_size
+
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS parse_cache ('
+                         'path TEXT PRIMARY KEY, size INTEGER, '
+                         'mtime_ns INTEGER, digest BLOB, structure BLOB, '
+                         'accessed REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS parse_cache_accessed '
+                         'ON parse_cache (accessed)')
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def _connect(self):
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        # autocommit, transactions are explicit
+        conn = sqlite3.connect(self._filename, timeout=30,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _stat_key(self, filename, file_size):
+        # (real path, size, mtime) or None if changed since reading,
+        # `file_size` differs from the content length for compressed files
+        stat = os.stat(filename)
+        if stat.st_size != file_size:
+            return None
+        return (os.path.realpath(filename), stat.st_size, stat.st_mtime_ns)
+
+    def _digest(self, content):
+        import hashlib  # pylint: disable=import-outside-toplevel
+        m = hashlib.blake2b(digest_size=20)  # pylint: disable=invalid-name
+        if self._full_hash or len(content) <= 2 * self.SAMPLE_SIZE:
+            m.update(content)
+        else:
+            m.update(content[:self.SAMPLE_SIZE])
+            m.update(content[-self.SAMPLE_SIZE:])
+        return m.digest()
+
+    def get(self, filename, content, file_size=None, lazy=True):
+        # archive from the cached structure or None, the content is only
+        # hashed if path, size and mtime match an entry, `lazy` builds the
+        # resource headers on first access (see `loads_structure()`)
+        if file_size is None:
+            file_size = len(content)
+        if file_size < self._min_size:
+            return None
+        key = self._stat_key(filename, file_size)
+        structure = None
+        if key is not None:
+            with contextlib.closing(self._connect()) as conn:
+                row = conn.execute(
+                    'SELECT digest, structure FROM parse_cache WHERE '
+                    'path = ? AND size = ? AND mtime_ns = ?',
+                    key).fetchone()
+                if row is not None and row[0] == self._digest(content):
+                    structure = row[1]
+                    conn.execute('UPDATE parse_cache SET accessed = ? '
+                                 'WHERE path = ?', (time.time(), key[0]))
+
+        mhtml_file = None
+        if structure is not None:
+            try:
+                mhtml_file = loads_structure(structure, content, lazy=lazy)
+            except ValueError:
+                logger.warning('Invalid cache entry for %s', filename)
+
+        if _stats is not None:
+            _stats.count('cache_hits' if mhtml_file is not None
+                         else 'cache_misses')
+        return mhtml_file
+
+    def put(self, filename, content, mhtml_archive, file_size=None):
+        if file_size is None:
+            file_size = len(content)
+        if file_size < self._min_size:
+            return False
+        key = self._stat_key(filename, file_size)
+        if key is None:
+            return False
+        key += (self._digest(content),)
+
+        structure = dumps_structure(mhtml_archive)
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('INSERT OR REPLACE INTO parse_cache VALUES '
+                             '(?, ?, ?, ?, ?, ?)',
+                             key + (structure, time.time()))
+                self._evict(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return True
+
+    def _evict(self, conn):
+        # keep the most recently used entries up to `max_size`
+        total = 0
+        paths = list()
+        for path, size in conn.execute(
+                'SELECT path, length(structure) FROM parse_cache '
+                'ORDER BY accessed DESC'):
+            total += size
+            if total > self._max_size:
+                paths.append((path,))
+        if paths:
+            conn.executemany('DELETE FROM parse_cache WHERE path = ?', paths)
+            logger.debug('Evicted %d cache entries.', len(paths))
+
+    def clear(self):
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('DELETE FROM parse_cache')
+
+    def __len__(self):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM parse_cache') \
+                .fetchone()[0]
+
+
+# ----------------------------------------------------------------------------
+
+
+ResourcePart = collections.namedtuple('ResourcePart',
+                                      ('headers', 'content', 'offset'))
+
+
+class StreamParser:
+    # Incremental parser for archives that arrive in chunks: `feed()`
+    # returns the resources completed by a chunk as `ResourcePart` tuples
+    # (`offset` of the part headers in the stream), `close()` the rest at
+    # the end of the stream. Only the current (incomplete) part is kept,
+    # the boundary search resumes where it stopped, so a stream is parsed
+    # in O(n) regardless of the chunk sizes.
+    def __init__(self):
+        self.headers = None
+        self.boundary = None
+        self._scanner = None
+        self._buffer = bytearray()
+        self._offset = 0  # stream offset of the buffer
+        self._scan_pos = 0
+        self._part_pos = None  # start of current part, None before first
+        self._done = False
+
+    @property
+    def done(self):
+        return self._done
+
+    def feed(self, data):
+        if self._done:
+            # epilogue after the end-of-parts boundary
+            return []
+        self._buffer += data
+        if self.headers is None and not self._parse_main_header():
+            return []
+        return self._parse_parts()
+
+    def close(self):
+        parts = list()
+        if not self._done:
+            if self.headers is not None or self._parse_main_header(True):
+                parts = self._parse_parts(True)
+        self._done = True
+        self._buffer = bytearray()
+        return parts
+
+    def _parse_main_header(self, final=False):
+        buf = self._buffer
+        fields_end, pos = find_header_end(buf, 0)
+        if fields_end == -1 or pos + 2 > len(buf):
+            if not final:
+                return False
+            if fields_end == -1:
+                logger.warning('Incomplete main header in stream!')
+                self._done = True
+                return False
+
+        self.headers = parse_header_block(bytes(buf[:fields_end]))
+        if buf[pos:pos + 2] == b'\r\n':
+            pos += 2
+        else:
+            logger.warning('After main header should follow two empty '
+                           'lines?, %d', pos)
+
+        self.boundary = get_boundary(self.headers)
+        if self.boundary is None:
+            logger.warning('Found no boundary in header!')
+            self._done = True
+            return False
+
+        self._scanner = get_boundary_scanner(self.boundary)
+        self._scan_pos = pos
+        return True
+
+    def _make_part(self, start_pos, end_pos):
+        data = bytes(self._buffer[start_pos:end_pos])
+        headers, content_pos = parse_header(data, 0)
+        content = data[content_pos:] if content_pos != -1 else b''
+        return ResourcePart(headers, content, self._offset + start_pos)
+
+    def _parse_parts(self, final=False):
+        buf = self._buffer
+        parts = list()
+
+        while not self._done:
+            end_pos, next_pos = self._scanner.find(buf, self._scan_pos)
+            if end_pos == -1:
+                if final:
+                    # no end-of-parts boundary
+                    if self._part_pos is not None:
+                        parts.append(self._make_part(self._part_pos,
+                                                     len(buf)))
+                    self._done = True
+                else:
+                    # a delimiter may be cut off at the end of the buffer
+                    self._scan_pos = max(
+                        self._scan_pos, self._part_pos or 0,
+                        len(buf) - len(self._scanner.prefix) - 4)
+                break
+
+            if self._part_pos is not None:
+                parts.append(self._make_part(self._part_pos, end_pos))
+            if next_pos == -1:
+                self._done = True
+                break
+            self._part_pos = self._scan_pos = next_pos
+
+        # drop completed parts, keep the linebreak before the current part
+        # (needed to detect an empty part)
+        keep_pos = self._part_pos if self._part_pos is not None \
+            else self._scan_pos
+        if keep_pos > 2 and not self._done:
+            cut = keep_pos - 2
+            del buf[:cut]
+            self._offset += cut
+            self._scan_pos -= cut
+            if self._part_pos is not None:
+                self._part_pos -= cut
+
+        return parts
+
+
+class AsyncResourceIterator:
+    # see `iter_resources()`, blocking reads and the parsing run in
+    # `executor` (default: the loop's thread pool), one chunk at a time
+    def __init__(self, stream, chunk_size=64 * 1024, executor=None):
+        import inspect  # pylint: disable=import-outside-toplevel
+
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._executor = executor
+        self._async_read = inspect.iscoroutinefunction(stream.read)
+        self._parser = StreamParser()
+        self._pending = collections.deque()
+        self._eof = False
+
+    @property
+    def headers(self):
+        # main header, once parsed
+        return self._parser.headers
+
+    def __aiter__(self):
+        return self
+
+    def _feed(self, data):
+        # -> completed parts, in the executor
+        if data:
+            return self._parser.feed(data)
+        self._eof = True
+        return self._parser.close()
+
+    def _read_and_feed(self):
+        return self._feed(self._stream.read(self._chunk_size))
+
+    async def __anext__(self):
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        loop = asyncio.get_running_loop()
+        while not self._pending:
+            if self._eof:
+                raise StopAsyncIteration
+            if self._async_read:
+                data = await self._stream.read(self._chunk_size)
+                parts = await loop.run_in_executor(self._executor,
+                                                   self._feed, data)
+            else:
+                parts = await loop.run_in_executor(self._executor,
+                                                   self._read_and_feed)
+            self._pending.extend(parts)
+        return self._pending.popleft()
+
+
+def iter_resources(stream, chunk_size=64 * 1024, executor=None):
+    # async iterator of `ResourcePart` tuples, `stream` has a `read(size)`
+    # method, a coroutine (e. g. `asyncio.StreamReader`) or a blocking one
+    # (file objects, read in `executor`), parsing runs in `executor`
+    return AsyncResourceIterator(stream, chunk_size=chunk_size,
+                                 executor=executor)
+
+
+async def load_archive(filename, executor=None, **kwargs):
+    # `MHTMLArchive_from_file()` in `executor` (default: the loop's thread
+    # pool), keyword arguments are passed through (lazy, jobs, cache ...)
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(
+        MHTMLArchive_from_file, filename, **kwargs))
+
+
+async def load_archives(filenames, limit=4, executor=None, **kwargs):
+    # at most `limit` archives are loaded at once, results in input order
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def load(filename):
+        async with semaphore:
+            return await load_archive(filename, executor=executor, **kwargs)
+
+    return await asyncio.gather(*[load(filename) for filename in filenames])
+
+
+async def save_archive(mhtml_archive, filename, executor=None,
+                       compression=None):
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, functools.partial(
+        MHTMLArchive_to_file, mhtml_archive, filename,
+        compression=compression))
+
+
+# ----------------------------------------------------------------------------
+
+
+def make_boundary():
+    # Blink style boundary with 42 random characters
+    import random  # pylint: disable=import-outside-toplevel
+    import string  # pylint: disable=import-outside-toplevel
+
+    rng = random.SystemRandom()
+    chars = string.ascii_letters + string.digits
+    return '----MultipartBoundary--{}----'.format(
+        ''.join(rng.choice(chars) for _ in range(42)))
+
+
+def _to_header(headers):
+    # copy as `ResourceHeader`
+    if isinstance(headers, ResourceHeader):
+        return _make_header(headers.as_list())
+    return ResourceHeader(headers)
+
+
+class _Base64Encoder:
+    # 76 character lines, input is encoded in multiples of 57 bytes
+    def __init__(self):
+        self._rest = b''
+
+    def encode(self, data, final=False):
+        data = self._rest + bytes(data)
+        if final:
+            self._rest = b''
+        else:
+            cut = len(data) - len(data) % 57
+            data, self._rest = data[:cut], data[cut:]
+        return base64.encodebytes(data).replace(b'\n', b'\r\n') \
+            if data else b''
+
+
+class _QuotedPrintableEncoder:
+    # complete lines are encoded, line breaks are written as CRLF
+    def __init__(self):
+        self._rest = b''
+
+    def encode(self, data, final=False):
+        data = self._rest + bytes(data)
+        if final:
+            self._rest = b''
+        else:
+            cut = data.rfind(b'\n') + 1
+            data, self._rest = data[:cut], data[cut:]
+        if not data:
+            return b''
+        data = binascii.b2a_qp(data.replace(b'\r\n', b'\n'))
+        return data.replace(b'\n', b'\r\n')
+
+
+class _IdentityEncoder:
+    def encode(self, data, final=False):  # pylint: disable=no-self-use
+        return data
+
+
+class MHTMLWriter:
+    # Writes an archive part by part with constant memory, `fileobj` is a
+    # binary file object or a filename (compressed by suffix or
+    # `compression`, see `open_archive_file()`). `headers` are the main
+    # header fields (MIME-Version and Content-Type with the boundary are
+    # added if not given), a Blink style `boundary` is generated if needed.
+    # Part data is checked for the boundary while streaming and raises a
+    # ValueError on a collision. `close()` writes the end-of-parts boundary.
+    # `raw_header` (with `boundary`) is written as is instead of `headers`,
+    # everything before the first delimiter, to reproduce an archive.
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fileobj, boundary=None, headers=None,
+                 compression=None, raw_header=None):
+        headers = _to_header(headers)
+        if raw_header is not None:
+            if boundary is None:
+                raise ValueError('A raw header needs the boundary!')
+        elif 'Content-Type' in headers:
+            header_boundary = get_boundary(headers)
+            if header_boundary is None:
+                raise ValueError('Content-Type without boundary!')
+            if boundary is not None and boundary != header_boundary:
+                raise ValueError('Boundary does not match Content-Type!')
+            boundary = header_boundary
+        else:
+            if boundary is None:
+                boundary = make_boundary()
+            if 'MIME-Version' not in headers:
+                headers['MIME-Version'] = '1.0'
+            headers['Content-Type'] = 'multipart/related;\r\n' \
+                '\ttype="text/html";\r\n\tboundary="{}"'.format(boundary)
+
+        self._boundary = boundary
+        self._marker = bytes('--' + boundary, 'ascii')
+        self._line_marker = b'\r\n' + self._marker
+        self._num_parts = 0
+
+        self._own_file = isinstance(fileobj, str)
+        if self._own_file:
+            fileobj = open_archive_file(fileobj, 'wb', compression)
+        self._fileobj = fileobj
+
+        if raw_header is not None:
+            self._write(raw_header)
+        else:
+            self._write(self._format_header(headers) + b'\r\n\r\n')
+
+    @property
+    def boundary(self):
+        return self._boundary
+
+    @property
+    def num_parts(self):
+        return self._num_parts
+
+    @property
+    def closed(self):
+        return self._fileobj is None
+
+    @staticmethod
+    def _format_header(headers):
+        return ''.join('{}: {}\r\n'.format(name, value)
+                       for name, value in headers.as_list()).encode('utf-8')
+
+    def _write(self, data):
+        if self._fileobj is None:
+            raise ValueError('Writer is closed!')
+        self._fileobj.write(data)
+
+    def _start_part(self):
+        self._write(self._marker + b'\r\n')
+        self._num_parts += 1
+
+    def _check_collision(self, tail, data):
+        # `tail` of the previous data of the part, as a boundary may span
+        # two chunks, returns the new tail. Only the boundary at the start
+        # of a line can be a delimiter (see `BoundaryScanner`), the data of
+        # a part starts on a new line (initial `tail` of a linebreak).
+        data = tail + bytes(data)
+        if self._line_marker in data:
+            raise ValueError('Boundary collision in part data!')
+        return data[-(len(self._line_marker) - 1):]
+
+    def _chunks(self, data_or_stream):
+        if hasattr(data_or_stream, 'read'):
+            while True:
+                chunk = data_or_stream.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            with memoryview(data_or_stream) as view:
+                for pos in range(0, len(view), self.CHUNK_SIZE):
+                    yield view[pos:pos + self.CHUNK_SIZE]
+
+    def add_part(self, headers, data_or_stream, encoding=None):
+        # `data_or_stream` is bytes-like or has a `read(size)` method, it is
+        # encoded with `encoding` (base64, quoted-printable, binary, 7bit,
+        # 8bit, default: Content-Transfer-Encoding of `headers` or binary)
+        headers = _to_header(headers)
+        if encoding is None:
+            encoding = headers.encoding or ContentEncoding.BINARY.value
+        content_encoding = ContentEncoding.parse(encoding)
+        if content_encoding is ContentEncoding.UNKNOWN:
+            raise ValueError('Unknown content encoding: {}'.format(encoding))
+        del headers['Content-Transfer-Encoding']
+        headers['Content-Transfer-Encoding'] = content_encoding.value
+
+        if content_encoding is ContentEncoding.BASE64:
+            encoder = _Base64Encoder()
+        elif content_encoding is ContentEncoding.QUOTEDPRINTABLE:
+            encoder = _QuotedPrintableEncoder()
+        else:
+            encoder = _IdentityEncoder()
+
+        self._start_part()
+        self._write(self._format_header(headers) + b'\r\n')
+
+        tail, last = b'\r\n', b''
+        for chunk in itertools.chain(self._chunks(data_or_stream), [b'']):
+            data = encoder.encode(chunk, final=not chunk)
+            if not data:
+                continue
+            if content_encoding is not ContentEncoding.BASE64:
+                # base64 can not contain the boundary ("-")
+                tail = self._check_collision(tail, data)
+            self._write(data)
+            last = bytes(data[-2:])
+
+        # the linebreak before the next boundary belongs to the delimiter,
+        # base64 lines already end with one (linebreaks are ignored),
+        # quoted-printable data without a final linebreak gets a soft line
+        # break to decode exactly
+        if content_encoding is ContentEncoding.QUOTEDPRINTABLE and \
+                last != b'\r\n':
+            self._write(b'=\r\n\r\n')
+        elif content_encoding is not ContentEncoding.BASE64 or \
+                last != b'\r\n':
+            self._write(b'\r\n')
+
+    def add_raw_part(self, content_with_headers, check=True):
+        # part headers and (encoded) content as is, e. g. of a resource of
+        # another archive, a missing final linebreak is added, without
+        # `check` (parts of parsed archives, can not contain a delimiter)
+        # the data is neither checked for the boundary nor changed
+        if check:
+            self._check_collision(b'\r\n', content_with_headers)
+        self._start_part()
+        self._write(content_with_headers)
+        if check and bytes(content_with_headers[-2:]) != b'\r\n':
+            self._write(b'\r\n')
+
+    def add_resource(self, resource):
+        with resource.content_with_headers_view() as view:
+            self.add_raw_part(view)
+
+    def close(self, trailer=None):
+        # `trailer` is written as is instead of the end-of-parts boundary
+        if self._fileobj is None:
+            return
+        self._write(self._marker + b'--\r\n' if trailer is None
+                    else trailer)
+        self._release()
+
+    def abort(self):
+        # closes without the end-of-parts delimiter, the output is not a
+        # complete archive (e. g. after an error while writing parts)
+        if self._fileobj is not None:
+            self._release()
+
+    def _release(self):
+        if self._own_file:
+            self._fileobj.close()
+        else:
+            self._fileobj.flush()
+        self._fileobj = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a failed archive is not terminated, it should not look complete
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# ----------------------------------------------------------------------------
+
+
+_CONTAINER_MAGIC = b'MHTZ'
+_CONTAINER_VERSION = 1
+# magic, version, compression, number of blocks, content length, offset and
+# length of the archive structure (followed by the block index)
+_CONTAINER_HEAD = struct.Struct('<4sBB2xIqqq')
+_CONTAINER_COMPRESSIONS = (None, 'gzip', 'xz', 'bz2')
+
+
+def _block_codec(compression):
+    # -> (compress, decompress) for single blocks, "gzip" blocks are plain
+    # zlib streams without the (per block) gzip header
+    # pylint: disable=import-outside-toplevel
+    if compression is None:
+        return bytes, bytes
+    if compression == 'gzip':
+        import zlib
+        return functools.partial(zlib.compress, level=6), zlib.decompress
+    module = _compression_module(compression)
+    return module.compress, module.decompress
+
+
+def _container_blocks(resources, content_length, block_size):
+    # block bounds, consecutive small resources share a block, blocks end
+    # at resource starts where possible, larger resources are split
+    bounds = [0]
+    prev_pos = 0
+    for pos in itertools.chain((res._offset_start for res in resources),
+                               (content_length,)):
+        if pos - bounds[-1] > block_size and prev_pos > bounds[-1]:
+            bounds.append(prev_pos)
+        while pos - bounds[-1] > block_size:
+            bounds.append(bounds[-1] + block_size)
+        prev_pos = pos
+    if bounds[-1] != content_length:
+        bounds.append(content_length)
+    return bounds
+
+
+def write_container(mhtml_archive, filename, compression='gzip',
+                    block_size=256 * 1024):
+    # Seekable container (see `MHTMLContainer`): the content is compressed
+    # in independent blocks of about `block_size` bytes, the archive
+    # structure and a block index are stored uncompressed at the end.
+    # Returns the number of blocks.
+    if compression not in _CONTAINER_COMPRESSIONS:
+        raise ValueError('Unknown compression: {!r}'.format(compression))
+    compress, _ = _block_codec(compression)
+
+    with mhtml_archive._read_locked(), open(filename, 'wb') as fout:
+        content = mhtml_archive._content
+        bounds = _container_blocks(mhtml_archive.resources, len(content),
+                                   block_size)
+        structure = dumps_structure(mhtml_archive)
+
+        fout.write(bytes(_CONTAINER_HEAD.size))
+        file_offsets = array.array('q', [_CONTAINER_HEAD.size])
+        with memoryview(content) as view:
+            for start, end in zip(bounds, bounds[1:]):
+                data = compress(view[start:end])
+                fout.write(data)
+                file_offsets.append(file_offsets[-1] + len(data))
+
+        fout.write(structure)
+        fout.write(_array_to_bytes(array.array('q', bounds)))
+        fout.write(_array_to_bytes(file_offsets))
+        fout.seek(0)
+        fout.write(_CONTAINER_HEAD.pack(
+            _CONTAINER_MAGIC, _CONTAINER_VERSION,
+            _CONTAINER_COMPRESSIONS.index(compression), len(bounds) - 1,
+            len(content), file_offsets[-1], len(structure)))
+    return len(bounds) - 1
+
+
+class ContainerResource:
+    # resource of a `MHTMLContainer`, content is read on access, headers
+    # are built from the structure on first access
+    _header_table = None
+    _header_nr = None
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, container, headers,
+                 offset_start, offset_content, offset_end,
+                 lazy_headers=False):
+        if headers is None and not lazy_headers:
+            headers = ResourceHeader()
+        self._container = container
+        self._headers = headers
+        self._offset_start = offset_start
+        self._offset_content = offset_content
+        self._offset_end = offset_end
+    # pylint: enable=too-many-arguments
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = self._header_table.headers(self._header_nr)
+        return self._headers
+
+    @property
+    def content_type(self):
+        return self.headers.content_type
+
+    @property
+    def encoding(self):
+        return self.headers.encoding
+
+    @property
+    def location(self):
+        return self.headers.location
+
+    @property
+    def size(self):
+        # of the (encoded) content
+        return self._offset_end - self._offset_content
+
+    @property
+    def content(self):
+        return self.get_content()
+
+    @property
+    def content_with_headers(self):
+        return self._container.read(self._offset_start, self._offset_end)
+
+    def get_content(self, decode=False):
+        content = self._container.read(self._offset_content,
+                                       self._offset_end)
+        if not decode:
+            return content
+        return _decoded_content(content, self.headers.encoding)
+
+
+class MHTMLContainer:
+    # Random access to a container written by `write_container()`, only the
+    # archive structure and block index are read on open, resource content
+    # is read by decompressing the blocks it spans (the last `cache_blocks`
+    # decompressed blocks are kept). Thread-safe for reading.
+    def __init__(self, filename, cache_blocks=8):
+        self._fileobj = open(filename, 'rb')
+        try:
+            self._read_index()
+        except Exception:
+            self._fileobj.close()
+            raise
+        self._io_lock = threading.Lock()
+        self._cache_blocks = cache_blocks
+        self._blocks = collections.OrderedDict()
+
+    def _read_index(self):
+        head = self._fileobj.read(_CONTAINER_HEAD.size)
+        if len(head) < _CONTAINER_HEAD.size:
+            raise ValueError('Truncated container!')
+        magic, version, compression, num_blocks, content_length, \
+            structure_offset, structure_length = \
+            _CONTAINER_HEAD.unpack(head)
+        if magic != _CONTAINER_MAGIC or version != _CONTAINER_VERSION or \
+                compression >= len(_CONTAINER_COMPRESSIONS):
+            raise ValueError('Unknown container format!')
+
+        self._fileobj.seek(structure_offset)
+        data = self._fileobj.read()
+        self._bounds, pos = _array_from_bytes('q', data, structure_length,
+                                              num_blocks + 1)
+        self._file_offsets, _ = _array_from_bytes('q', data, pos,
+                                                  num_blocks + 1)
+        self._structure = data[:structure_length]
+        headers, _, boundary, length, offsets, table = \
+            _loads_structure(self._structure)
+        if length != content_length or self._bounds[-1] != content_length:
+            raise ValueError('Container index does not match the content!')
+
+        self._compression = _CONTAINER_COMPRESSIONS[compression]
+        self._decompress = _block_codec(self._compression)[1]
+        self._headers = headers
+        self._boundary = boundary
+        self._resources = _structure_resources(
+            ContainerResource, self, offsets, table, lazy=True)
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def location(self):
+        return self._headers.location
+
+    @property
+    def boundary(self):
+        return self._boundary
+
+    @property
+    def resources(self):
+        return self._resources
+
+    @property
+    def num_blocks(self):
+        return len(self._bounds) - 1
+
+    @property
+    def content_length(self):
+        return self._bounds[-1]
+
+    def __len__(self):
+        return len(self._resources)
+
+    def get_resource(self, nr_or_location):
+        # by number or location, None if not found
+        if isinstance(nr_or_location, str):
+            for resource in self._resources:
+                if resource.location == nr_or_location:
+                    return resource
+            return None
+        if 0 <= nr_or_location < len(self._resources):
+            return self._resources[nr_or_location]
+        return None
+
+    def _block(self, nr):  # pylint: disable=invalid-name
+        with self._io_lock:
+            data = self._blocks.get(nr)
+            if data is not None:
+                self._blocks.move_to_end(nr)
+                return data
+
+            start = self._file_offsets[nr]
+            self._fileobj.seek(start)
+            data = self._fileobj.read(self._file_offsets[nr + 1] - start)
+
+        data = self._decompress(data)
+        if len(data) != self._bounds[nr + 1] - self._bounds[nr]:
+            raise ValueError('Corrupt container block {}!'.format(nr))
+        if self._cache_blocks:
+            with self._io_lock:
+                self._blocks[nr] = data
+                while len(self._blocks) > self._cache_blocks:
+                    self._blocks.popitem(last=False)
+        return data
+
+    def read(self, start, end):
+        # bytes of the archive content in [start, end)
+        import bisect  # pylint: disable=import-outside-toplevel
+
+        start = max(0, start)
+        end = min(end, self.content_length)
+        if start >= end:
+            return b''
+        first = bisect.bisect_right(self._bounds, start) - 1
+        last = bisect.bisect_left(self._bounds, end)
+        pieces = list()
+        for nr in range(first, last):  # pylint: disable=invalid-name
+            block_start = self._bounds[nr]
+            data = self._block(nr)
+            pieces.append(data[max(0, start - block_start):
+                               end - block_start])
+        return b''.join(pieces) if len(pieces) > 1 else bytes(pieces[0])
+
+    def iter_blocks(self):
+        # decompressed content blocks in order (not cached)
+        for nr in range(self.num_blocks):  # pylint: disable=invalid-name
+            with self._io_lock:
+                start = self._file_offsets[nr]
+                self._fileobj.seek(start)
+                data = self._fileobj.read(self._file_offsets[nr + 1] - start)
+            yield self._decompress(data)
+
+    def to_archive(self):
+        # the complete `MHTMLArchive`, lossless
+        content = b''.join(self.iter_blocks())
+        return loads_structure(self._structure, content)
+
+    def export(self, filename, compression=None):
+        # streams the standard archive into `filename`, compressed by suffix
+        # or `compression` (see `open_archive_file()`)
+        with open_archive_file(filename, 'wb', compression) as fout:
+            for data in self.iter_blocks():
+                fout.write(data)
+
+    def close(self):
+        self._fileobj.close()
+        self._blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 # EOF
@@ -0,0 +1,259 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import contextlib
+import fnmatch
+import glob
+import io
+import logging
+import os
+import sys
+import time
+
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+DEFAULT_PATTERNS = ('*.mht', '*.mhtm', '*.mhtml')
+
+
+BatchResult = namedtuple('BatchResult', ['filename', 'ok', 'output', 'error',
+                                         'size', 'duration'])
+
+
+# ----------------------------------------------------------------------------
+
+
+def is_archive_name(filename, patterns=DEFAULT_PATTERNS):
+    name = os.path.basename(filename).lower()
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def find_files(inputs, recursive=False, patterns=DEFAULT_PATTERNS):
+    # missing files are kept, so that the error shows up in the summary
+    seen = set()
+    filenames = list()
+
+    def add(filename):
+        if filename in seen:
+            return
+        seen.add(filename)
+        filenames.append(filename)
+
+    for name in inputs:
+        if os.path.isdir(name):
+            if recursive:
+                for root, dirs, files in os.walk(name):
+                    dirs.sort()
+                    for fn in sorted(files):
+                        if is_archive_name(fn, patterns):
+                            add(os.path.join(root, fn))
+            else:
+                for fn in sorted(os.listdir(name)):
+                    path = os.path.join(name, fn)
+                    if os.path.isfile(path) and is_archive_name(fn, patterns):
+                        add(path)
+        elif os.path.isfile(name):
+            add(name)
+        elif glob.has_magic(name):
+            for fn in sorted(glob.glob(name, recursive=recursive)):
+                if os.path.isfile(fn):
+                    add(fn)
+        else:
+            add(name)
+
+    return filenames
+
+
+def common_root(filenames):
+    # deepest directory containing all `filenames`
+    folders = [os.path.dirname(os.path.abspath(fn)) for fn in filenames]
+    if not folders:
+        return os.getcwd()
+    return os.path.commonpath(folders)
+
+
+def check_output(input_file, output_file):
+    # never overwrite an input
+    try:
+        same = os.path.samefile(input_file, output_file)
+    except OSError:
+        same = os.path.abspath(input_file) == os.path.abspath(output_file)
+    if same:
+        raise ValueError('Output "{}" is the input file!'.format(output_file))
+
+
+def make_output_path(input_file, folder, root, ext=None):
+    # output for `input_file` in `folder` with the path relative to `root`
+    # (see `common_root()`), so that inputs of the same name from different
+    # directories do not overwrite each other, `ext` replaces the extension,
+    # parent directories are created
+    name = os.path.relpath(os.path.abspath(input_file), root)
+    if ext is not None:
+        name = os.path.splitext(name)[0] + ext
+    output = os.path.join(folder, name)
+    check_output(input_file, output)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    return output
+
+
+# ----------------------------------------------------------------------------
+
+
+def run_one(func, filename, args=(), kwargs=None):
+    # never raises, stdout is captured so that parallel output does not
+    # get interleaved
+    if kwargs is None:
+        kwargs = dict()
+
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        size = 0
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            ret = func(filename, *args, **kwargs)
+    except Exception as ex:  # pylint: disable=broad-except
+        logger.debug('Processing "%s" failed!', filename, exc_info=True)
+        return BatchResult(filename, False, output.getvalue(),
+                           '{}: {}'.format(type(ex).__name__, ex), size,
+                           time.perf_counter() - start)
+
+    if ret is False:
+        return BatchResult(filename, False, output.getvalue(),
+                           'processing failed', size,
+                           time.perf_counter() - start)
+
+    return BatchResult(filename, True, output.getvalue(), None, size,
+                       time.perf_counter() - start)
+
+
+def run_batch(func, filenames, jobs=1, ordered=True, args=(), kwargs=None):
+    # jobs > 1 uses a process pool (func has to be picklable), jobs = 0 one
+    # worker per cpu, else everything runs in the current interpreter
+    if jobs is not None and jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    if not jobs or jobs == 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield run_one(func, filename, args, kwargs)
+        return
+
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_one, func, filename, args, kwargs)
+                   for filename in filenames]
+        names = {future: filename
+                 for future, filename in zip(futures, filenames)}
+
+        if not ordered:
+            futures = concurrent.futures.as_completed(futures)
+
+        for future in futures:
+            try:
+                yield future.result()
+            except Exception as ex:  # pylint: disable=broad-except
+                # e. g. a crashed worker (BrokenProcessPool)
+                yield BatchResult(names[future], False, '',
+                                  '{}: {}'.format(type(ex).__name__, ex),
+                                  0, 0.0)
+
+
+# ----------------------------------------------------------------------------
+
+
+class BatchSummary:
+    def __init__(self):
+        self.num_files = 0
+        self.num_bytes = 0
+        self.failures = list()
+        self._start = time.perf_counter()
+        self._end = None
+
+    def add(self, result):
+        self.num_files += 1
+        self.num_bytes += result.size
+        if not result.ok:
+            self.failures.append((result.filename, result.error))
+
+    def finish(self):
+        self._end = time.perf_counter()
+
+    @property
+    def duration(self):
+        end = self._end if self._end is not None else time.perf_counter()
+        return end - self._start
+
+    @property
+    def ok(self):
+        return not self.failures
+
+    def log(self, log=logger):
+        duration = self.duration
+        rate_files = self.num_files / duration if duration > 0 else 0.0
+        rate_bytes = self.num_bytes / duration if duration > 0 else 0.0
+        log.info('Processed %d files (%d bytes) in %.3f sec, '
+                 '%.1f files/s, %.2f MB/s, %d failed.',
+                 self.num_files, self.num_bytes, duration, rate_files,
+                 rate_bytes / 1024 / 1024, len(self.failures))
+        for filename, error in self.failures:
+            log.error('Failed: "%s": %s', filename, error)
+
+
+def add_batch_arguments(parser):
+    group = parser.add_argument_group('batch processing')
+    group.add_argument('-r', '--recursive', action='store_true',
+                       help='Search input directories recursively, '
+                            'allow "**" in glob patterns.')
+    group.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of worker processes, 0 for one per cpu. '
+                            '(default: 1)')
+    group.add_argument('--pattern', action='append', default=None,
+                       help='Filename pattern for files in input '
+                            'directories, can be given multiple times. '
+                            '(default: {})'.format(
+                                ', '.join(DEFAULT_PATTERNS)))
+    group.add_argument('--unordered', action='store_true',
+                       help='Print output as soon as a file is finished '
+                            'instead of in input order.')
+    return parser
+
+
+def process_files(func, inputs, batch_args, args=(), kwargs=None,
+                  show_names=None):
+    patterns = tuple(batch_args.pattern or DEFAULT_PATTERNS)
+    filenames = find_files(inputs, recursive=batch_args.recursive,
+                           patterns=patterns)
+    if not filenames:
+        logger.warning('No input files found: %s', inputs)
+
+    if show_names is None:
+        show_names = len(filenames) > 1
+
+    summary = BatchSummary()
+    for result in run_batch(func, filenames, jobs=batch_args.jobs,
+                            ordered=not batch_args.unordered,
+                            args=args, kwargs=kwargs):
+        summary.add(result)
+        if show_names and result.output:
+            print('==> {} <=='.format(result.filename))
+        if result.output:
+            sys.stdout.write(result.output)
+            sys.stdout.flush()
+        if not result.ok and len(filenames) == 1:
+            logger.error('Processing "%s" failed: %s', result.filename,
+                         result.error)
+    summary.finish()
+
+    if len(filenames) > 1:
+        summary.log()
+
+    return summary
+
@@ -0,0 +1,251 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import bisect
+import collections
+import hashlib
+import json
+import logging
+import sys
+
+import mhtml
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+# resources are matched by location, `old_nr`/`new_nr` and digests are None
+# for added/removed resources, `headers` are header changes
+ResourceChange = collections.namedtuple('ResourceChange', [
+    'location', 'old_nr', 'new_nr', 'old_digest', 'new_digest', 'headers'])
+
+# `headers` are (name, old values, new values) of the main header
+ArchiveDiff = collections.namedtuple('ArchiveDiff', [
+    'headers', 'added', 'removed', 'changed', 'moved', 'num_unchanged'])
+
+
+# ----------------------------------------------------------------------------
+
+
+def _digest(resource):
+    # zero-copy, hashlib releases the GIL for larger buffers
+    with resource.content_view() as view:
+        return hashlib.sha256(view).digest()
+
+
+def content_digests(mhtml_archive, executor=None):
+    if executor is None:
+        return [_digest(resource) for resource in mhtml_archive.resources]
+    return list(executor.map(_digest, mhtml_archive.resources))
+
+
+def diff_headers(old, new, ignore=()):
+    # -> [(name, old values, new values)] in order of first appearance
+    ignore = {name.lower() for name in ignore}
+    old_values = collections.OrderedDict()
+    new_values = collections.OrderedDict()
+    for headers, values in ((old, old_values), (new, new_values)):
+        for name, value in headers.as_list():
+            if name.lower() not in ignore:
+                values.setdefault(name.lower(), (name, list()))[1] \
+                    .append(value)
+
+    changes = list()
+    for key in list(old_values) + [key for key in new_values
+                                   if key not in old_values]:
+        name, old_list = old_values.get(key, (None, list()))
+        new_name, new_list = new_values.get(key, (name, list()))
+        if old_list != new_list:
+            changes.append((name or new_name, old_list, new_list))
+    return changes
+
+
+def _in_order(pairs):
+    # indices of the pairs (sorted by old nr) in a longest run with
+    # increasing new nr, all others have moved
+    tails = list()  # new nr at the end of the best run of each length
+    tail_idx = list()
+    prev = [None] * len(pairs)
+    for idx, (_, new_nr) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, new_nr)
+        if pos == len(tails):
+            tails.append(new_nr)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = new_nr
+            tail_idx[pos] = idx
+        prev[idx] = tail_idx[pos - 1] if pos > 0 else None
+
+    keep = set()
+    idx = tail_idx[-1] if tail_idx else None
+    while idx is not None:
+        keep.add(idx)
+        idx = prev[idx]
+    return keep
+
+
+def diff_archives(old, new, jobs=None, ignore_headers=()):
+    # Compares two `MHTMLArchive`s by resource location (duplicates are
+    # paired in order) and content digest, no contents are compared byte by
+    # byte. Digests are computed from memoryviews in a thread pool of `jobs`
+    # threads (None or <= 0: default size, 1: no pool).
+    if jobs is not None and jobs <= 0:
+        jobs = None
+    if jobs == 1:
+        old_digests = content_digests(old)
+        new_digests = content_digests(new)
+    else:
+        import concurrent.futures  # noqa: E501 pylint: disable=import-outside-toplevel
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            old_digests = content_digests(old, executor)
+            new_digests = content_digests(new, executor)
+
+    old_by_location = collections.OrderedDict()
+    for nr, resource in enumerate(old.resources):
+        old_by_location.setdefault(resource.location, list()).append(nr)
+    new_by_location = collections.OrderedDict()
+    for nr, resource in enumerate(new.resources):
+        new_by_location.setdefault(resource.location, list()).append(nr)
+
+    added, removed, changed, pairs = list(), list(), list(), list()
+    for location, old_nrs in old_by_location.items():
+        new_nrs = new_by_location.get(location, ())
+        pairs.extend(zip(old_nrs, new_nrs))
+        removed.extend(ResourceChange(location, nr, None, old_digests[nr],
+                                      None, list())
+                       for nr in old_nrs[len(new_nrs):])
+    for location, new_nrs in new_by_location.items():
+        old_nrs = old_by_location.get(location, ())
+        added.extend(ResourceChange(location, None, nr, None,
+                                    new_digests[nr], list())
+                     for nr in new_nrs[len(old_nrs):])
+    added.sort(key=lambda change: change.new_nr)
+
+    pairs.sort()
+    in_order = _in_order(pairs)
+    moved = list()
+    num_unchanged = 0
+    for idx, (old_nr, new_nr) in enumerate(pairs):
+        change = ResourceChange(
+            old.resources[old_nr].location, old_nr, new_nr,
+            old_digests[old_nr], new_digests[new_nr],
+            diff_headers(old.resources[old_nr].headers,
+                         new.resources[new_nr].headers, ignore_headers))
+        if change.old_digest != change.new_digest or change.headers:
+            changed.append(change)
+        elif idx not in in_order:
+            moved.append(change)
+        else:
+            num_unchanged += 1
+
+    return ArchiveDiff(diff_headers(old.headers, new.headers, ignore_headers),
+                       added, removed, changed, moved, num_unchanged)
+
+
+def is_identical(diff):
+    return not (diff.headers or diff.added or diff.removed or diff.changed
+                or diff.moved)
+
+
+# ----------------------------------------------------------------------------
+
+
+def _change_as_dict(change):
+    return {
+        'location': change.location,
+        'old_nr': change.old_nr,
+        'new_nr': change.new_nr,
+        'old_digest': change.old_digest.hex() if change.old_digest else None,
+        'new_digest': change.new_digest.hex() if change.new_digest else None,
+        'headers': [{'name': name, 'old': old_values, 'new': new_values}
+                    for name, old_values, new_values in change.headers],
+    }
+
+
+def diff_as_dict(diff):
+    return {
+        'headers': [{'name': name, 'old': old_values, 'new': new_values}
+                    for name, old_values, new_values in diff.headers],
+        'added': [_change_as_dict(change) for change in diff.added],
+        'removed': [_change_as_dict(change) for change in diff.removed],
+        'changed': [_change_as_dict(change) for change in diff.changed],
+        'moved': [_change_as_dict(change) for change in diff.moved],
+        'unchanged': diff.num_unchanged,
+    }
+
+
+def format_diff(diff):
+    lines = list()
+
+    def add_headers(headers, indent):
+        for name, old_values, new_values in headers:
+            lines.append('{}{}: {} -> {}'.format(
+                indent, name, ' | '.join(old_values) or '(none)',
+                ' | '.join(new_values) or '(none)'))
+
+    add_headers(diff.headers, '  header ')
+    for change in diff.removed:
+        lines.append('- {} {}'.format(change.old_nr, change.location))
+    for change in diff.added:
+        lines.append('+ {} {}'.format(change.new_nr, change.location))
+    for change in diff.changed:
+        lines.append('M {} -> {} {}{}'.format(
+            change.old_nr, change.new_nr, change.location,
+            '' if change.old_digest != change.new_digest
+            else ' (headers only)'))
+        add_headers(change.headers, '    ')
+    for change in diff.moved:
+        lines.append('> {} -> {} {}'.format(change.old_nr, change.new_nr,
+                                           change.location))
+    lines.append('{} added, {} removed, {} changed, {} moved, {} unchanged'
+                 .format(len(diff.added), len(diff.removed),
+                         len(diff.changed), len(diff.moved),
+                         diff.num_unchanged))
+    return '\n'.join(lines)
+
+
+def main(old_file, new_file, as_json=False, jobs=None, ignore_headers=()):
+    old = mhtml.MHTMLArchive_from_file(old_file, lazy=True)
+    new = mhtml.MHTMLArchive_from_file(new_file, lazy=True)
+    diff = diff_archives(old, new, jobs=jobs, ignore_headers=ignore_headers)
+
+    if as_json:
+        json.dump(diff_as_dict(diff), sys.stdout, indent=2)
+        print()
+    else:
+        print(format_diff(diff))
+    return is_identical(diff)
+
+
+def cli_main():
+    logging.basicConfig(format='%(levelname)-8s: %(message)s',
+                        level=logging.INFO)
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Compare two MHTML archives by resource location and '
+                    'content digest. Exit code 0 if identical, 1 if not.')
+    parser.add_argument('old', help='old MHTML archive')
+    parser.add_argument('new', help='new MHTML archive')
+    parser.add_argument('--json', action='store_true',
+                        help='Output as JSON.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of threads to compute digests, 0 '
+                             'for automatic. (default: automatic)')
+    parser.add_argument('--ignore-header', action='append', default=[],
+                        help='Header field to ignore, e. g. "Date", can be '
+                             'repeated.')
+    args = parser.parse_args()
+
+    try:
+        identical = main(args.old, args.new, as_json=args.json,
+                         jobs=args.jobs, ignore_headers=args.ignore_header)
+    except (OSError, ValueError) as ex:
+        logger.error('%s', ex)
+        sys.exit(2)
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == '__main__':
+    cli_main()
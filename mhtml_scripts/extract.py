@@ -3,9 +3,12 @@
 
 import logging
 import os
+import sys
 
 import mhtml
 
+from mhtml_scripts import batch
+
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -49,7 +52,7 @@ def main(filename, folder):
 
     # rewrite, own tools
     with open(filename, 'rb') as fin:
-        content = fin.read()
+        content = mhtml.decompress(fin.read())
 
     _, parts = mhtml.parse_mhtml(content)
 
@@ -64,17 +67,37 @@ def main(filename, folder):
             fout.write(pcontent)
 
 
+def main_subfolder(filename, folder, root):
+    # batch mode, each archive gets its own folder to avoid name clashes,
+    # with the path relative to the common `root` of the inputs
+    main(filename, batch.make_output_path(filename, folder, root, ''))
+
+
 def cli_main():
     logging.basicConfig(format='%(levelname)-8s: %(message)s',
                         level=logging.DEBUG)
 
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('file', help='MHT/MHTM/MHTML file')
+    parser.add_argument('files', nargs='+',
+                        help='MHT/MHTM/MHTML files, directories or globs')
     parser.add_argument('dir', help='output dir for extracted content')
+    batch.add_batch_arguments(parser)
     args = parser.parse_args()
 
-    main(args.file, args.dir)
+    filenames = batch.find_files(args.files, recursive=args.recursive,
+                                 patterns=args.pattern or
+                                 batch.DEFAULT_PATTERNS)
+    if len(filenames) == 1:
+        func, func_args = main, (args.dir,)
+    else:
+        func, func_args = main_subfolder, (args.dir,
+                                           batch.common_root(filenames))
+        os.makedirs(args.dir, exist_ok=True)
+
+    summary = batch.process_files(func, filenames, args, args=func_args)
+    if not summary.ok:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
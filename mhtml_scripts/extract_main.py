@@ -1,10 +1,15 @@
 # pylint: disable=redefined-builtin,invalid-name
 # pylint: disable=missing-docstring
 
+import glob
 import logging
+import os
+import sys
 
 import mhtml
 
+from mhtml_scripts import batch
+
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -13,12 +18,13 @@ logger.addHandler(logging.NullHandler())
 def main(filename, output_filename=None):
     if not output_filename:
         output_filename = filename.rsplit('.', 1)[0] + '.html'
+    batch.check_output(filename, output_filename)
     logger.info('Extracting main page from "%s" to "%s" ...',
                 filename, output_filename)
 
     # rewrite, own tools
     with open(filename, 'rb') as fin:
-        content = fin.read()
+        content = mhtml.decompress(fin.read())
 
     headers, parts = mhtml.parse_mhtml(content)
     main_url = headers['Snapshot-Content-Location']
@@ -38,18 +44,46 @@ def main(filename, output_filename=None):
             fout.write(pcontent)
 
 
+def main_folder(filename, folder, root):
+    # batch mode, main pages in the output folder with the paths relative to
+    # the common `root` of the inputs
+    main(filename, batch.make_output_path(filename, folder, root, '.html'))
+
+
 def cli_main():
     logging.basicConfig(format='%(levelname)-8s: %(message)s',
                         level=logging.DEBUG)
 
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('file', help='MHT/MHTM/MHTML file')
-    parser.add_argument('output', nargs='?', default=None,
-                        help='output dir for extracted content')
+    parser.add_argument('inputs', nargs='+',
+                        help='MHT/MHTM/MHTML files, directories or globs')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file for a single input, output dir '
+                             'for multiple inputs (default: next to input)')
+    batch.add_batch_arguments(parser)
     args = parser.parse_args()
 
-    main(args.file, args.output)
+    inputs, output = args.inputs, args.output
+    if output is None and len(inputs) == 2 \
+            and not batch.is_archive_name(inputs[1]) \
+            and not os.path.isdir(inputs[1]) \
+            and not glob.has_magic(inputs[1]):
+        # old call signature: file [output]
+        inputs, output = inputs[:1], inputs[1]
+
+    filenames = batch.find_files(inputs, recursive=args.recursive,
+                                 patterns=args.pattern or
+                                 batch.DEFAULT_PATTERNS)
+    if len(filenames) == 1 or output is None:
+        func, func_args = main, (output,)
+    else:
+        func, func_args = main_folder, (output, batch.common_root(filenames))
+        os.makedirs(output, exist_ok=True)
+
+    summary = batch.process_files(func, filenames, args, args=func_args)
+    if not summary.ok:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,155 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import collections
+import contextlib
+import logging
+import mmap
+import re
+import sys
+
+import mhtml
+
+from mhtml_scripts import batch
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+# `offset` is the offset in the archive (decompressed) for plain content,
+# for `decoded` (base64/quoted-printable) content the offset in the decoded
+# payload
+GrepMatch = collections.namedtuple('GrepMatch', [
+    'path', 'nr', 'location', 'content_type', 'offset', 'decoded', 'match'])
+
+_PLAIN_ENCODINGS = (mhtml.ContentEncoding.BINARY,
+                    mhtml.ContentEncoding.SEVENBIT,
+                    mhtml.ContentEncoding.EIGHTBIT,
+                    mhtml.ContentEncoding.UNKNOWN)
+
+
+# ----------------------------------------------------------------------------
+
+
+@contextlib.contextmanager
+def map_archive(path):
+    # read-only mmap of a plain archive (no copy), compressed or empty files
+    # are read into memory
+    with open(path, 'rb') as fin:
+        head = fin.read(6)
+        if not head or mhtml.detect_compression(head) is not None:
+            fin.seek(0)
+            yield mhtml.decompress(fin.read())
+            return
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            yield content
+
+
+def grep_content(content, regex, path=None, resource_filter=None,
+                 decode=True):
+    # -> `GrepMatch` of the compiled bytes `regex` in the part bodies of
+    # `content` (bytes or mmap), plain bodies are searched in place, encoded
+    # ones decoded (if `decode`) and only if kept by `resource_filter`
+    _, parts = mhtml.parse_mhtml(content)
+    for nr, (headers, _, content_pos, end_pos) in enumerate(parts or ()):
+        if content_pos == -1:
+            continue
+        if resource_filter is not None and \
+                not resource_filter(headers, end_pos - content_pos):
+            continue
+
+        encoding = mhtml.ContentEncoding.parse(headers.encoding)
+        if encoding in _PLAIN_ENCODINGS or not decode:
+            matches = ((match.start(), match.group())
+                       for match in regex.finditer(content, content_pos,
+                                                   end_pos))
+        else:
+            try:
+                payload = mhtml.decode_payload(content[content_pos:end_pos],
+                                               headers.encoding)
+            except ValueError:
+                logger.warning('Invalid %s content of resource %d in %s.',
+                               headers.encoding, nr, path)
+                continue
+            matches = ((match.start(), match.group())
+                       for match in regex.finditer(payload))
+
+        is_decoded = encoding not in _PLAIN_ENCODINGS and decode
+        for offset, match in matches:
+            yield GrepMatch(path, nr, headers.location, headers.content_type,
+                            offset, is_decoded, match)
+
+
+def grep_file(path, regex, resource_filter=None, decode=True):
+    with map_archive(path) as content:
+        # matches are bytes copies, nothing references the mapping after
+        return list(grep_content(content, regex, path=path,
+                                 resource_filter=resource_filter,
+                                 decode=decode))
+
+
+def format_match(match, max_length=200):
+    text = match.match[:max_length].decode('utf-8', 'backslashreplace')
+    return '{}:{}:{}{}:{}: {}'.format(
+        match.path, match.nr, 'd' if match.decoded else '', match.offset,
+        match.location, ' '.join(text.split()))
+
+
+def main(input_file, pattern, types=None, decode=True, ignore_case=False,
+         fixed_strings=False, count=False):
+    # pylint: disable=too-many-arguments
+    if fixed_strings:
+        pattern = re.escape(pattern)
+    regex = re.compile(pattern.encode('utf-8'),
+                       re.IGNORECASE if ignore_case else 0)
+    resource_filter = mhtml.ResourceFilter(include=types) if types else None
+
+    matches = grep_file(input_file, regex, resource_filter=resource_filter,
+                        decode=decode)
+    if count:
+        print('{}:{}'.format(input_file, len(matches)))
+    else:
+        for match in matches:
+            print(format_match(match))
+
+
+def cli_main():
+    logging.basicConfig(format='%(levelname)-8s: %(message)s',
+                        level=logging.INFO)
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Search resource contents of MHTML archives, base64 '
+                    'and quoted-printable encoded contents are decoded. '
+                    'Prints archive:resource:offset:location: match, '
+                    'offsets in decoded contents are marked with "d".')
+    # not `pattern`, used by the batch arguments
+    parser.add_argument('regex', metavar='PATTERN',
+                        help='regular expression')
+    parser.add_argument('inputs', nargs='+',
+                        help='MHT/MHTM/MHTML files, directories or globs')
+    parser.add_argument('-t', '--type', action='append', default=None,
+                        help='Only search resources matching the mime-type '
+                             'pattern, e. g. "text/*", can be repeated.')
+    parser.add_argument('-i', '--ignore-case', action='store_true')
+    parser.add_argument('-F', '--fixed-strings', action='store_true',
+                        help='The pattern is a plain string.')
+    parser.add_argument('-c', '--count', action='store_true',
+                        help='Only print the number of matches per file.')
+    parser.add_argument('--no-decode', action='store_true',
+                        help='Search encoded contents as is.')
+    batch.add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    summary = batch.process_files(main, args.inputs, args,
+                                  args=(args.regex, args.type,
+                                        not args.no_decode, args.ignore_case,
+                                        args.fixed_strings, args.count),
+                                  show_names=False)
+    if not summary.ok:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    cli_main()
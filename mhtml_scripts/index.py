@@ -0,0 +1,281 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import collections
+import contextlib
+import functools
+import hashlib
+import itertools
+import logging
+import os
+import sys
+import time
+
+import mhtml
+
+from mhtml_scripts import batch
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+# result of indexing a single archive (picklable, built in the workers)
+ArchiveEntry = collections.namedtuple('ArchiveEntry', [
+    'path', 'size', 'mtime_ns', 'location', 'boundary', 'resources',
+    'error'])
+
+UpdateResult = collections.namedtuple('UpdateResult', [
+    'num_indexed', 'num_skipped', 'num_failed', 'num_removed'])
+
+
+# ----------------------------------------------------------------------------
+
+
+def scan_archive(path, with_hash=False):
+    # -> `ArchiveEntry`, resources are rows of (nr, offset start, offset
+    # content, offset end, content type, location, encoding, size, digest)
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as fin:
+            content = mhtml.decompress(fin.read())
+        headers, parts = mhtml.parse_mhtml(content)
+    except Exception as ex:  # pylint: disable=broad-except
+        logger.debug('Indexing "%s" failed!', path, exc_info=True)
+        return ArchiveEntry(path, None, None, None, None, None,
+                            '{}: {}'.format(type(ex).__name__, ex))
+
+    resources = list()
+    view = memoryview(content)
+    for nr, (part_headers, start_pos, content_pos, end_pos) in \
+            enumerate(parts or ()):
+        size = end_pos - content_pos if content_pos != -1 else 0
+        digest = None
+        if with_hash and content_pos != -1:
+            digest = hashlib.sha256(view[content_pos:end_pos]).digest()
+        resources.append((nr, start_pos, content_pos, end_pos,
+                          part_headers.content_type, part_headers.location,
+                          part_headers.encoding, size, digest))
+
+    return ArchiveEntry(path, stat.st_size, stat.st_mtime_ns,
+                        headers.location, mhtml.get_boundary(headers),
+                        resources, None)
+
+
+@contextlib.contextmanager
+def transaction(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+class Catalog:
+    # sqlite3 catalog of the resources of many archives, see `update()`,
+    # subclasses change the `SCHEMA`, the scan function and `_insert()`
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS archives ('
+        'id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, '
+        'mtime_ns INTEGER, location TEXT, boundary TEXT, '
+        'num_resources INTEGER, indexed REAL)',
+        'CREATE TABLE IF NOT EXISTS resources ('
+        'archive INTEGER, nr INTEGER, offset_start INTEGER, '
+        'offset_content INTEGER, offset_end INTEGER, content_type TEXT, '
+        'location TEXT, encoding TEXT, size INTEGER, digest BLOB, '
+        'PRIMARY KEY (archive, nr))',
+        'CREATE INDEX IF NOT EXISTS resources_location '
+        'ON resources (location)',
+        'CREATE INDEX IF NOT EXISTS resources_digest ON resources (digest)',
+    )
+
+    def __init__(self, filename):
+        self._filename = filename
+        with contextlib.closing(self._connect()) as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def _connect(self):
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        # autocommit, transactions are explicit
+        conn = sqlite3.connect(self._filename, timeout=30,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _delete(self, conn, paths):
+        # pylint: disable=no-self-use
+        rows = [row for path in paths for row in conn.execute(
+            'SELECT id FROM archives WHERE path = ?', (path,))]
+        conn.executemany('DELETE FROM resources WHERE archive = ?', rows)
+        conn.executemany('DELETE FROM archives WHERE id = ?', rows)
+        return len(rows)
+
+    def _insert(self, conn, entries):
+        self._delete(conn, [entry.path for entry in entries])
+        for entry in entries:
+            archive_id = conn.execute(
+                'INSERT INTO archives (path, size, mtime_ns, location, '
+                'boundary, num_resources, indexed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (entry.path, entry.size, entry.mtime_ns, entry.location,
+                 entry.boundary, len(entry.resources), time.time())) \
+                .lastrowid
+            conn.executemany(
+                'INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((archive_id,) + row for row in entry.resources))
+
+    def _changed(self, paths):
+        # paths that are new or changed (by size and mtime)
+        with contextlib.closing(self._connect()) as conn:
+            known = {path: (size, mtime_ns) for path, size, mtime_ns
+                     in conn.execute('SELECT path, size, mtime_ns '
+                                     'FROM archives')}
+        changed = list()
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                changed.append(path)  # reported when indexing
+                continue
+            if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(path)
+        return changed
+
+    # pylint: disable=too-many-arguments
+    def update(self, filenames, jobs=1, with_hash=False, prune=False,
+               commit_every=200):
+        # indexes new and changed archives with `jobs` worker processes (0:
+        # one per cpu), the results are inserted in bulk in the main process
+        # in transactions of `commit_every` archives, `prune` removes
+        # archives that do not exist any more
+        return self._update(filenames, functools.partial(
+            scan_archive, with_hash=with_hash), jobs, prune, commit_every)
+    # pylint: enable=too-many-arguments
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def _update(self, filenames, scan, jobs, prune, commit_every):
+        # `scan(path)` (picklable) returns an entry with `path` and `error`
+        paths = list(dict.fromkeys(os.path.abspath(fn) for fn in filenames))
+        changed = self._changed(paths)
+        num_indexed = num_failed = num_removed = 0
+
+        if jobs is not None and jobs <= 0:
+            jobs = os.cpu_count() or 1
+
+        with contextlib.ExitStack() as stack:
+            if jobs and jobs > 1 and len(changed) > 1:
+                import concurrent.futures  # noqa: E501 pylint: disable=import-outside-toplevel
+                pool = stack.enter_context(
+                    concurrent.futures.ProcessPoolExecutor(max_workers=jobs))
+                entries = pool.map(scan, changed, chunksize=max(1, min(
+                    32, len(changed) // (jobs * 4))))
+            else:
+                entries = map(scan, changed)
+
+            conn = stack.enter_context(contextlib.closing(self._connect()))
+            pending = list()
+            for entry in itertools.chain(entries, (None,)):
+                if entry is not None:
+                    if entry.error is not None:
+                        logger.error('Failed: "%s": %s', entry.path,
+                                     entry.error)
+                        num_failed += 1
+                        continue
+                    pending.append(entry)
+                    num_indexed += 1
+                if pending and (entry is None or
+                                len(pending) >= commit_every):
+                    with transaction(conn):
+                        self._insert(conn, pending)
+                    logger.debug('Committed %d archives.', len(pending))
+                    pending = list()
+
+            if prune:
+                missing = [path for path, in conn.execute(
+                    'SELECT path FROM archives') if not os.path.exists(path)]
+                if missing:
+                    with transaction(conn):
+                        num_removed = self._delete(conn, missing)
+
+        return UpdateResult(num_indexed, len(paths) - len(changed),
+                            num_failed, num_removed)
+    # pylint: enable=too-many-arguments,too-many-locals
+
+    def find_location(self, location, like=False):
+        # -> [(archive path, resource nr)], with `like` the location is a
+        # SQL LIKE pattern (wildcards % and _)
+        op = 'LIKE' if like else '='
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute(
+                'SELECT archives.path, resources.nr FROM resources '
+                'JOIN archives ON resources.archive = archives.id '
+                'WHERE resources.location {} ? '
+                'ORDER BY archives.path, resources.nr'.format(op),
+                (location,)).fetchall()
+
+    def __len__(self):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM archives') \
+                .fetchone()[0]
+
+
+# ----------------------------------------------------------------------------
+
+
+def cli_main():
+    logging.basicConfig(format='%(levelname)-8s: %(message)s',
+                        level=logging.INFO)
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Index the resources of MHTML archives into a sqlite3 '
+                    'catalog, unchanged archives are skipped.')
+    parser.add_argument('catalog', help='sqlite3 catalog file')
+    parser.add_argument('inputs', nargs='*',
+                        help='MHT/MHTM/MHTML files, directories or globs')
+    parser.add_argument('--hash', action='store_true',
+                        help='Store the sha256 digest of resource contents.')
+    parser.add_argument('--prune', action='store_true',
+                        help='Remove archives that do not exist any more.')
+    parser.add_argument('--find', default=None, metavar='LOCATION',
+                        help='List archives with a resource of this '
+                             'location.')
+    parser.add_argument('--find-like', default=None, metavar='PATTERN',
+                        help='List archives with a resource location '
+                             'matching the SQL LIKE pattern (wildcards %% '
+                             'and _).')
+    batch.add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    if args.inputs or args.prune:
+        filenames = batch.find_files(args.inputs, recursive=args.recursive,
+                                     patterns=args.pattern or
+                                     batch.DEFAULT_PATTERNS)
+        start = time.perf_counter()
+        result = catalog.update(filenames, jobs=args.jobs,
+                                with_hash=args.hash, prune=args.prune)
+        logger.info('Indexed %d, skipped %d unchanged, %d failed, removed '
+                    '%d archives in %.3f sec.', result.num_indexed,
+                    result.num_skipped, result.num_failed, result.num_removed,
+                    time.perf_counter() - start)
+        if result.num_failed:
+            sys.exit(1)
+
+    for location, like in ((args.find, False), (args.find_like, True)):
+        if location is None:
+            continue
+        for path, nr in catalog.find_location(location, like=like):
+            print('{}\t{}'.format(path, nr))
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -5,12 +5,14 @@ import logging
 
 import mhtml
 
+from mhtml_scripts import batch
+
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
-def main(output_filename, input_filenames):
+def main(output_filename, input_filenames, cache_dir=None):
     logger.info('Extracting "%s" into "%s" ...', output_filename,
                 input_filenames)
 
@@ -18,9 +20,10 @@ def main(output_filename, input_filenames):
         logger.warning('Have to be at least two mhtml input files.')
         return False
 
+    cache = mhtml.ParseCache(cache_dir) if cache_dir else None
     mhtarcs = list()
     for input_filename in input_filenames:
-        mhtarc = mhtml.MHTMLArchive_from_file(input_filename)
+        mhtarc = mhtml.MHTMLArchive_from_file(input_filename, cache=cache)
         mhtarcs.append(mhtarc)
 
     mhtarc_final = mhtarcs[0]
@@ -58,10 +61,21 @@ def cli_main():
     parser = argparse.ArgumentParser()
     parser.add_argument('output', help='MHT/MHTM/MHTML file')
     parser.add_argument('inputs', nargs='+',
-                        help='more than one input file, first is main file')
+                        help='more than one input file, first is main file, '
+                             'directories and globs are expanded')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Search input directories recursively, '
+                             'allow "**" in glob patterns.')
+    parser.add_argument('--pattern', action='append', default=None,
+                        help='Filename pattern for files in input '
+                             'directories, can be given multiple times.')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory to cache parse results in.')
     args = parser.parse_args()
 
-    main(args.output, args.inputs)
+    inputs = batch.find_files(args.inputs, recursive=args.recursive,
+                              patterns=args.pattern or batch.DEFAULT_PATTERNS)
+    main(args.output, inputs, cache_dir=args.cache_dir)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import io
+import logging
+import os
+import sys
+
+import mhtml
+
+from mhtml_scripts import batch
+from mhtml_scripts.strip import make_output_filename
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+def main(input_file, output_file=None, quoted_printable=False, verify=True):
+    if not output_file:
+        output_file = make_output_filename(input_file, '.optimized')
+    batch.check_output(input_file, output_file)
+
+    logger.info('Optimizing "%s" into "%s" ...', input_file, output_file)
+
+    with open(input_file, 'rb') as fin:
+        content = mhtml.decompress(fin.read())
+
+    buffer = io.BytesIO()
+    num_converted, num_parts = mhtml.optimize_mhtml(
+        content, buffer, quoted_printable=quoted_printable)
+    optimized = buffer.getvalue()
+
+    # nothing is written if the result does not parse into the same parts
+    if verify and not mhtml.verify_optimized(content, optimized):
+        raise ValueError('Round trip check failed for "{}"!'
+                         .format(input_file))
+
+    with mhtml.open_archive_file(output_file, 'wb') as fout:
+        fout.write(optimized)
+
+    logger.info('Converted %d of %d parts, %d -> %d bytes.',
+                num_converted, num_parts, len(content), len(optimized))
+
+
+def main_folder(input_file, folder, root, quoted_printable=False,
+                verify=True):
+    # paths in `folder` relative to the common `root` of the inputs
+    main(input_file, batch.make_output_path(input_file, folder, root),
+         quoted_printable, verify)
+
+
+def cli_main():
+    logging.basicConfig(format='%(levelname)-8s: %(message)s',
+                        level=logging.INFO)
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Shrink MHTML archives by storing base64 (and '
+                    'quoted-printable) encoded resources as binary.')
+    parser.add_argument('inputs', nargs='+',
+                        help='MHT/MHTM/MHTML files, directories or globs')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file for a single input, output dir '
+                             'for multiple inputs (default: next to input '
+                             'with ".optimized" suffix)')
+    parser.add_argument('-q', '--quoted-printable', action='store_true',
+                        help='Also convert quoted-printable text parts '
+                             '(to 8bit or binary).')
+    parser.add_argument('--no-verify', action='store_true',
+                        help='Skip the round trip check of the result.')
+    batch.add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    filenames = batch.find_files(args.inputs, recursive=args.recursive,
+                                 patterns=args.pattern or
+                                 batch.DEFAULT_PATTERNS)
+    func_args = (args.quoted_printable, not args.no_verify)
+    if len(filenames) == 1 or args.output is None:
+        func, func_args = main, (args.output,) + func_args
+    else:
+        func, func_args = main_folder, (args.output,
+                                        batch.common_root(filenames)) + \
+            func_args
+        os.makedirs(args.output, exist_ok=True)
+
+    summary = batch.process_files(func, filenames, args, args=func_args)
+    if not summary.ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,316 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import collections
+import contextlib
+import functools
+import logging
+import os
+import re
+import struct
+import sys
+import time
+
+import mhtml
+
+from mhtml_scripts import batch
+from mhtml_scripts import index
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+TEXT_TYPES = ('text/html', 'text/css', 'text/plain')
+# positions stored per term and resource, the count is always complete
+MAX_POSITIONS = 16
+
+_TOKEN_RE = re.compile(r'\w{2,64}')
+_TAG_RE = re.compile(r'<[^>]*>')
+_CHARSET_RE = re.compile(r'charset\s*=\s*"?([\w.:-]+)', re.IGNORECASE)
+
+# result of scanning a single archive (picklable, built in the workers),
+# resources are (nr, offset content, offset end, content type, location,
+# encoding, charset, {term: (count, positions)})
+TextEntry = collections.namedtuple('TextEntry', [
+    'path', 'size', 'mtime_ns', 'resources', 'error'])
+
+SearchHit = collections.namedtuple('SearchHit', [
+    'path', 'nr', 'location', 'content_type', 'offset_content',
+    'offset_end', 'encoding', 'charset', 'score', 'positions'])
+
+
+# ----------------------------------------------------------------------------
+
+
+def get_charset(headers):
+    match = _CHARSET_RE.search(headers.get('Content-Type') or '')
+    return match.group(1).lower() if match else None
+
+
+def extract_text(payload, content_type, charset=None):
+    # text of a decoded payload, markup of html is blanked out, so that
+    # positions stay the same as in the decoded text
+    try:
+        text = payload.decode(charset or 'utf-8', 'replace')
+    except LookupError:
+        text = payload.decode('utf-8', 'replace')
+    if content_type == 'text/html':
+        text = _TAG_RE.sub(lambda match: ' ' * len(match.group()), text)
+    return text
+
+
+def tokenize(text):
+    # -> (term, position) with lowercase terms
+    for match in _TOKEN_RE.finditer(text):
+        yield match.group().lower(), match.start()
+
+
+def _postings(text):
+    postings = dict()
+    for term, pos in tokenize(text):
+        posting = postings.get(term)
+        if posting is None:
+            postings[term] = posting = [0, list()]
+        posting[0] += 1
+        if len(posting[1]) < MAX_POSITIONS:
+            posting[1].append(pos)
+    # positions as little endian uint32
+    return {term: (count, struct.pack('<{}I'.format(len(positions)),
+                                      *positions))
+            for term, (count, positions) in postings.items()}
+
+
+def scan_text(path, types=TEXT_TYPES):
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as fin:
+            content = mhtml.decompress(fin.read())
+        _, parts = mhtml.parse_mhtml(content)
+    except Exception as ex:  # pylint: disable=broad-except
+        logger.debug('Indexing "%s" failed!', path, exc_info=True)
+        return TextEntry(path, None, None, None,
+                         '{}: {}'.format(type(ex).__name__, ex))
+
+    resources = list()
+    view = memoryview(content)
+    for nr, (headers, _, content_pos, end_pos) in enumerate(parts or ()):
+        content_type = (headers.content_type or '').lower()
+        if content_pos == -1 or content_type not in types:
+            continue
+        charset = get_charset(headers)
+        try:
+            payload = mhtml.decode_payload(view[content_pos:end_pos],
+                                           headers.encoding)
+        except ValueError:
+            logger.warning('Invalid content of resource %d in "%s".', nr,
+                           path)
+            continue
+        text = extract_text(payload, content_type, charset)
+        resources.append((nr, content_pos, end_pos, content_type,
+                          headers.location, headers.encoding, charset,
+                          _postings(text)))
+
+    return TextEntry(path, stat.st_size, stat.st_mtime_ns, resources, None)
+
+
+class SearchIndex(index.Catalog):
+    # Inverted index over the decoded text resources of many archives in a
+    # sqlite3 database: postings of (term, resource) with the number of
+    # occurrences and the first positions in the decoded text, resources
+    # know their content offsets in the archive, so hits are shown by
+    # reading only that span. Updated incrementally like a `Catalog`.
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS archives ('
+        'id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, '
+        'mtime_ns INTEGER)',
+        'CREATE TABLE IF NOT EXISTS resources ('
+        'id INTEGER PRIMARY KEY, archive INTEGER, nr INTEGER, '
+        'offset_content INTEGER, offset_end INTEGER, content_type TEXT, '
+        'location TEXT, encoding TEXT, charset TEXT)',
+        'CREATE INDEX IF NOT EXISTS resources_archive '
+        'ON resources (archive)',
+        'CREATE TABLE IF NOT EXISTS terms ('
+        'id INTEGER PRIMARY KEY, term TEXT UNIQUE)',
+        'CREATE TABLE IF NOT EXISTS postings ('
+        'term INTEGER, resource INTEGER, count INTEGER, positions BLOB, '
+        'PRIMARY KEY (term, resource)) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS postings_resource '
+        'ON postings (resource)',
+    )
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._term_ids = None
+
+    def _delete(self, conn, paths):
+        rows = [row for path in paths for row in conn.execute(
+            'SELECT id FROM archives WHERE path = ?', (path,))]
+        conn.executemany('DELETE FROM postings WHERE resource IN ('
+                         'SELECT id FROM resources WHERE archive = ?)', rows)
+        conn.executemany('DELETE FROM resources WHERE archive = ?', rows)
+        conn.executemany('DELETE FROM archives WHERE id = ?', rows)
+        return len(rows)
+
+    def _term_id(self, conn, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            # maybe added by another process
+            row = conn.execute('SELECT id FROM terms WHERE term = ?',
+                               (term,)).fetchone()
+            if row is not None:
+                term_id = row[0]
+            else:
+                term_id = conn.execute('INSERT INTO terms (term) VALUES (?)',
+                                       (term,)).lastrowid
+            self._term_ids[term] = term_id
+        return term_id
+
+    def _insert(self, conn, entries):
+        self._delete(conn, [entry.path for entry in entries])
+        if self._term_ids is None:
+            self._term_ids = dict(conn.execute('SELECT term, id FROM terms'))
+        try:
+            for entry in entries:
+                archive_id = conn.execute(
+                    'INSERT INTO archives (path, size, mtime_ns) '
+                    'VALUES (?, ?, ?)',
+                    (entry.path, entry.size, entry.mtime_ns)).lastrowid
+                for resource in entry.resources:
+                    resource_id = conn.execute(
+                        'INSERT INTO resources (archive, nr, offset_content, '
+                        'offset_end, content_type, location, encoding, '
+                        'charset) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (archive_id,) + resource[:7]).lastrowid
+                    conn.executemany(
+                        'INSERT INTO postings VALUES (?, ?, ?, ?)',
+                        ((self._term_id(conn, term), resource_id, count,
+                          positions)
+                         for term, (count, positions)
+                         in resource[7].items()))
+        except BaseException:
+            # new term ids are rolled back
+            self._term_ids = None
+            raise
+
+    # pylint: disable=arguments-differ
+    def update(self, filenames, jobs=1, prune=False, commit_every=50,
+               types=TEXT_TYPES):
+        return self._update(filenames, functools.partial(
+            scan_text, types=tuple(types)), jobs, prune, commit_every)
+    # pylint: enable=arguments-differ
+
+    def search(self, query, limit=20):
+        # resources containing all words of `query`, most occurrences first
+        terms = list(dict.fromkeys(term for term, _ in tokenize(query)))
+        if not terms:
+            return list()
+
+        with contextlib.closing(self._connect()) as conn:
+            term_ids = dict(conn.execute(
+                'SELECT term, id FROM terms WHERE term IN ({})'.format(
+                    ', '.join('?' * len(terms))), terms))
+            if len(term_ids) != len(terms):
+                return list()
+            first_id = term_ids[terms[0]]
+
+            rows = conn.execute(
+                'SELECT archives.path, resources.nr, resources.location, '
+                'resources.content_type, resources.offset_content, '
+                'resources.offset_end, resources.encoding, resources.charset, '
+                'matches.score, postings.positions FROM ('
+                'SELECT resource, SUM(count) AS score FROM postings '
+                'WHERE term IN ({}) GROUP BY resource HAVING COUNT(*) = ?'
+                ') AS matches '
+                'JOIN resources ON resources.id = matches.resource '
+                'JOIN archives ON archives.id = resources.archive '
+                'JOIN postings ON postings.term = ? AND '
+                'postings.resource = matches.resource '
+                'ORDER BY matches.score DESC, archives.path, resources.nr '
+                'LIMIT ?'.format(', '.join('?' * len(term_ids))),
+                list(term_ids.values()) + [len(term_ids), first_id, limit])
+
+            return [SearchHit(*row[:-1], positions=list(struct.unpack(
+                '<{}I'.format(len(row[-1]) // 4), row[-1]))) for row in rows]
+
+    @staticmethod
+    def snippet(hit, width=40):
+        # text around the first match, only the content span of the
+        # resource is read from the archive
+        with mhtml.open_archive_file(hit.path) as fin:
+            fin.seek(hit.offset_content)
+            data = fin.read(hit.offset_end - hit.offset_content)
+        text = extract_text(mhtml.decode_payload(data, hit.encoding),
+                            hit.content_type, hit.charset)
+        pos = hit.positions[0] if hit.positions else 0
+        return ' '.join(text[max(0, pos - width):pos + width].split())
+
+
+# ----------------------------------------------------------------------------
+
+
+def cli_main():
+    logging.basicConfig(format='%(levelname)-8s: %(message)s',
+                        level=logging.INFO)
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Full-text search over the text resources of MHTML '
+                    'archives.')
+    parser.add_argument('index', help='sqlite3 index file')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_update = subparsers.add_parser(
+        'update', help='Index new and changed archives.')
+    parser_update.add_argument('inputs', nargs='*',
+                               help='MHT/MHTM/MHTML files, directories or '
+                                    'globs')
+    parser_update.add_argument('--prune', action='store_true',
+                               help='Remove archives that do not exist any '
+                                    'more.')
+    parser_update.add_argument('-t', '--type', action='append',
+                               default=None,
+                               help='Mime-type of resources to index, can be '
+                                    'repeated. (default: {})'.format(
+                                        ', '.join(TEXT_TYPES)))
+    batch.add_batch_arguments(parser_update)
+
+    parser_query = subparsers.add_parser(
+        'query', help='Search resources containing all words.')
+    parser_query.add_argument('words', nargs='+')
+    parser_query.add_argument('-n', '--limit', type=int, default=20,
+                              help='Maximum number of hits. (default: 20)')
+    parser_query.add_argument('--no-snippets', action='store_true',
+                              help='Do not show the text around matches.')
+    args = parser.parse_args()
+
+    search_index = SearchIndex(args.index)
+    if args.command == 'update':
+        filenames = batch.find_files(args.inputs, recursive=args.recursive,
+                                     patterns=args.pattern or
+                                     batch.DEFAULT_PATTERNS)
+        start = time.perf_counter()
+        result = search_index.update(filenames, jobs=args.jobs,
+                                     prune=args.prune,
+                                     types=args.type or TEXT_TYPES)
+        logger.info('Indexed %d, skipped %d unchanged, %d failed, removed '
+                    '%d archives in %.3f sec.', result.num_indexed,
+                    result.num_skipped, result.num_failed, result.num_removed,
+                    time.perf_counter() - start)
+        if result.num_failed:
+            sys.exit(1)
+        return
+
+    for hit in search_index.search(' '.join(args.words), limit=args.limit):
+        print('{}\t{}\t{}\t{}'.format(hit.path, hit.nr, hit.location,
+                                      hit.score))
+        if not args.no_snippets:
+            try:
+                print('    ' + SearchIndex.snippet(hit))
+            except OSError as ex:
+                logger.warning('Can not read "%s": %s', hit.path, ex)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -3,9 +3,12 @@
 
 import glob
 import logging
+import sys
 
 import mhtml
 
+from mhtml_scripts import batch
+
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 logger.addHandler(logging.NullHandler())
@@ -26,9 +29,11 @@ def print_separator(length=40, char='-'):
 
 
 def main(input_file, only_main_header=False, print_preview=False,
-         filter_resources=None):
+         filter_resources=None, cache_dir=None):
+    cache = mhtml.ParseCache(cache_dir) if cache_dir else None
     mhtarc = mhtml.MHTMLArchive_from_file(input_file,
-                                          only_header=only_main_header)
+                                          only_header=only_main_header,
+                                          cache=cache)
 
     max_name_len = max([len(n) for n in mhtarc.headers.as_dict().keys()])
     for name, value in mhtarc.headers.as_list():
@@ -69,7 +74,8 @@ def cli_main():
 
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('input', help='MHT/MHTM/MHTML file')
+    parser.add_argument('inputs', nargs='+',
+                        help='MHT/MHTM/MHTML files, directories or globs')
     parser.add_argument('-m', '--only-main-header', action='store_true',
                         help='Parse only main header.')
     parser.add_argument('-p', '--print-preview', action='store_true',
@@ -79,13 +85,21 @@ def cli_main():
                              'mime-type pattern. (default: *)')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='Print more logging output.')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory to cache parse results in.')
+    batch.add_batch_arguments(parser)
     args = parser.parse_args()
 
     if args.verbose:
         logger.setLevel(logging.DEBUG)
 
-    main(args.input, args.only_main_header, args.print_preview,
-         args.filter_resources)
+    summary = batch.process_files(main, args.inputs, args,
+                                  args=(args.only_main_header,
+                                        args.print_preview,
+                                        args.filter_resources,
+                                        args.cache_dir))
+    if not summary.ok:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
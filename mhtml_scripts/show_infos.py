@@ -3,6 +3,10 @@
 
 import email
 import logging
+import sys
+
+from mhtml_scripts import batch
+
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 logger.addHandler(logging.NullHandler())
@@ -65,10 +69,14 @@ def cli_main():
 
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('input', help='MHT/MHTM/MHTML file')
+    parser.add_argument('inputs', nargs='+',
+                        help='MHT/MHTM/MHTML files, directories or globs')
+    batch.add_batch_arguments(parser)
     args = parser.parse_args()
 
-    main(args.input)
+    summary = batch.process_files(main, args.inputs, args)
+    if not summary.ok:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,323 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import collections
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import sys
+import time
+
+import mhtml
+
+from mhtml_scripts import batch
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+IngestResult = collections.namedtuple('IngestResult', [
+    'name', 'num_parts', 'num_new_bodies', 'new_bytes', 'size'])
+
+
+# ----------------------------------------------------------------------------
+
+
+def split_archive(content):
+    # -> (boundary, raw header, [(raw part headers, body)], raw trailer)
+    # the raw pieces (memoryviews) joined with the delimiters are the
+    # original content, the header is everything before the first
+    # delimiter, the trailer the end-of-parts delimiter and the epilogue
+    headers, parts = mhtml.parse_mhtml(content)
+    if not parts:
+        raise ValueError('No parts found!')
+
+    boundary = mhtml.get_boundary(headers)
+    boundary_length = len(boundary) + 4
+    view = memoryview(content)
+
+    pieces = list()
+    for _, start_pos, content_pos, end_pos in parts:
+        if content_pos == -1:
+            content_pos = end_pos
+        pieces.append((view[start_pos:content_pos],
+                       view[content_pos:end_pos]))
+
+    return (boundary, view[:parts[0][1] - boundary_length], pieces,
+            view[parts[-1][3]:])
+
+
+class ArchiveStore:
+    # Content-addressed store of archives in a sqlite3 database in
+    # `directory`: part bodies (encoded content) are stored once by their
+    # sha256 digest and reference counted, each archive is a manifest of
+    # its raw main header, raw part headers with body digests and trailer,
+    # archives are reproduced byte for byte with a `MHTMLWriter`. Safe for
+    # concurrent use from multiple processes (WAL journal, a connection per
+    # operation).
+    FILENAME = 'mhtml-store.sqlite3'
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._filename = os.path.join(directory, self.FILENAME)
+
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS bodies ('
+                         'digest BLOB PRIMARY KEY, data BLOB, '
+                         'refs INTEGER)')
+            conn.execute('CREATE TABLE IF NOT EXISTS archives ('
+                         'id INTEGER PRIMARY KEY, name TEXT UNIQUE, '
+                         'boundary TEXT, header BLOB, trailer BLOB, '
+                         'size INTEGER, added REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS parts ('
+                         'archive INTEGER, nr INTEGER, headers BLOB, '
+                         'digest BLOB, PRIMARY KEY (archive, nr))')
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def _connect(self):
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        # autocommit, transactions are explicit
+        conn = sqlite3.connect(self._filename, timeout=60,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _unlink(conn, name):
+        # -> id of the removed archive entry (parts are kept) or None
+        row = conn.execute('SELECT id FROM archives WHERE name = ?',
+                           (name,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('DELETE FROM archives WHERE id = ?', row)
+        return row[0]
+
+    @staticmethod
+    def _release(conn, archive_id):
+        # drops the parts, bodies without references are deleted
+        conn.executemany('UPDATE bodies SET refs = refs - 1 '
+                         'WHERE digest = ?', conn.execute(
+                             'SELECT digest FROM parts WHERE archive = ?',
+                             (archive_id,)).fetchall())
+        conn.execute('DELETE FROM bodies WHERE refs <= 0')
+        conn.execute('DELETE FROM parts WHERE archive = ?', (archive_id,))
+
+    def add(self, name, content):
+        # stores (or replaces) archive `name`, only new bodies are stored
+        boundary, header, pieces, trailer = split_archive(content)
+        # digests outside of the transaction
+        digests = [hashlib.sha256(body).digest() for _, body in pieces]
+
+        num_new = new_bytes = 0
+        with self._transaction() as conn:
+            old_id = self._unlink(conn, name)
+            archive_id = conn.execute(
+                'INSERT INTO archives (name, boundary, header, trailer, '
+                'size, added) VALUES (?, ?, ?, ?, ?, ?)',
+                (name, boundary, bytes(header), bytes(trailer),
+                 len(content), time.time())).lastrowid
+            conn.executemany(
+                'INSERT INTO parts VALUES (?, ?, ?, ?)',
+                ((archive_id, nr, bytes(part_headers), digest)
+                 for nr, ((part_headers, _), digest)
+                 in enumerate(zip(pieces, digests))))
+
+            for (_, body), digest in zip(pieces, digests):
+                if conn.execute('UPDATE bodies SET refs = refs + 1 '
+                                'WHERE digest = ?', (digest,)).rowcount:
+                    continue
+                # only new bodies are copied
+                conn.execute('INSERT INTO bodies VALUES (?, ?, 1)',
+                             (digest, bytes(body)))
+                num_new += 1
+                new_bytes += len(body)
+
+            # after the new references, bodies of a replaced version that
+            # are still used are not deleted and stored again
+            if old_id is not None:
+                self._release(conn, old_id)
+
+        return IngestResult(name, len(pieces), num_new, new_bytes,
+                            len(content))
+
+    def add_file(self, filename, name=None):
+        with open(filename, 'rb') as fin:
+            content = mhtml.decompress(fin.read())
+        return self.add(name if name is not None else filename, content)
+
+    def restore(self, name, fileobj):
+        # writes the archive byte for byte into `fileobj` (file object or
+        # filename, compressed by suffix), bodies are read one at a time.
+        # A file is written under a temporary name and only replaced when
+        # complete, a file object is left without the end-of-parts
+        # delimiter on errors.
+        if not isinstance(fileobj, str):
+            self._restore(name, fileobj)
+            return
+
+        tmp_name = '{}.{}.tmp'.format(fileobj, os.getpid())
+        try:
+            self._restore(name, tmp_name,
+                          mhtml.compression_from_filename(fileobj))
+            os.replace(tmp_name, fileobj)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_name)
+            raise
+
+    def _restore(self, name, fileobj, compression=None):
+        with contextlib.closing(self._connect()) as conn:
+            # one snapshot for all reads, nothing to commit
+            conn.execute('BEGIN')
+            try:
+                row = conn.execute(
+                    'SELECT id, boundary, header, trailer FROM archives '
+                    'WHERE name = ?', (name,)).fetchone()
+                if row is None:
+                    raise KeyError('No such archive: {}'.format(name))
+                archive_id, boundary, header, trailer = row
+
+                with mhtml.MHTMLWriter(fileobj, boundary=boundary,
+                                       raw_header=header,
+                                       compression=compression) as writer:
+                    for part_headers, data in conn.execute(
+                            'SELECT parts.headers, bodies.data FROM parts '
+                            'JOIN bodies ON parts.digest = bodies.digest '
+                            'WHERE parts.archive = ? ORDER BY parts.nr',
+                            (archive_id,)):
+                        writer.add_raw_part(part_headers + data, check=False)
+                    writer.close(trailer=trailer)
+            finally:
+                conn.execute('ROLLBACK')
+
+    def get(self, name):
+        fout = io.BytesIO()
+        self.restore(name, fout)
+        return fout.getvalue()
+
+    def remove(self, name):
+        with self._transaction() as conn:
+            archive_id = self._unlink(conn, name)
+            if archive_id is None:
+                return False
+            self._release(conn, archive_id)
+        return True
+
+    def names(self):
+        with contextlib.closing(self._connect()) as conn:
+            return [name for name, in conn.execute(
+                'SELECT name FROM archives ORDER BY name')]
+
+    def __contains__(self, name):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute('SELECT 1 FROM archives WHERE name = ?',
+                                (name,)).fetchone() is not None
+
+    def __len__(self):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM archives') \
+                .fetchone()[0]
+
+    def stats(self):
+        # archive sizes vs stored body sizes (without manifests)
+        with contextlib.closing(self._connect()) as conn:
+            num_archives, archive_bytes = conn.execute(
+                'SELECT COUNT(*), TOTAL(size) FROM archives').fetchone()
+            num_bodies, body_bytes = conn.execute(
+                'SELECT COUNT(*), TOTAL(length(data)) FROM bodies') \
+                .fetchone()
+        return {'archives': num_archives, 'archive_bytes': int(archive_bytes),
+                'bodies': num_bodies, 'body_bytes': int(body_bytes)}
+
+
+# ----------------------------------------------------------------------------
+
+
+def main_add(filename, directory):
+    result = ArchiveStore(directory).add_file(filename)
+    print('{}: {} parts, {} new bodies, {} new bytes of {}'.format(
+        result.name, result.num_parts, result.num_new_bodies,
+        result.new_bytes, result.size))
+
+
+def cli_main():
+    logging.basicConfig(format='%(levelname)-8s: %(message)s',
+                        level=logging.INFO)
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Deduplicating store of MHTML archives, resources are '
+                    'stored once.')
+    parser.add_argument('store', help='store directory')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_add = subparsers.add_parser('add', help='Add archives.')
+    parser_add.add_argument('inputs', nargs='+',
+                            help='MHT/MHTM/MHTML files, directories or globs')
+    batch.add_batch_arguments(parser_add)
+
+    parser_restore = subparsers.add_parser('restore',
+                                           help='Restore an archive.')
+    parser_restore.add_argument('name', help='name of the archive (path when '
+                                             'added)')
+    parser_restore.add_argument('output', help='output file')
+
+    parser_remove = subparsers.add_parser('remove', help='Remove archives.')
+    parser_remove.add_argument('names', nargs='+')
+
+    subparsers.add_parser('list', help='List the stored archives.')
+    subparsers.add_parser('stats', help='Show storage statistics.')
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        # create the database before the workers access it
+        ArchiveStore(args.store)
+        summary = batch.process_files(main_add, args.inputs, args,
+                                      args=(args.store,), show_names=False)
+        if not summary.ok:
+            sys.exit(1)
+        return
+
+    store = ArchiveStore(args.store)
+    if args.command == 'restore':
+        try:
+            store.restore(args.name, args.output)
+        except KeyError as ex:
+            logger.error('%s', ex.args[0])
+            sys.exit(1)
+    elif args.command == 'remove':
+        missing = [name for name in args.names if not store.remove(name)]
+        for name in missing:
+            logger.warning('No such archive: %s', name)
+        if missing:
+            sys.exit(1)
+    elif args.command == 'list':
+        for name in store.names():
+            print(name)
+    elif args.command == 'stats':
+        stats = store.stats()
+        print('{archives} archives, {archive_bytes} bytes, stored as '
+              '{bodies} bodies, {body_bytes} bytes'.format(**stats))
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,122 @@
+# pylint: disable=invalid-name
+# pylint: disable=missing-docstring
+
+import logging
+import os
+import sys
+
+import mhtml
+
+from mhtml_scripts import batch
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+logger.addHandler(logging.NullHandler())
+
+
+def parse_size(value):
+    # plain bytes or with k/m/g suffix (1024 based)
+    value = value.strip().lower()
+    factor = 1
+    for suffix, suffix_factor in (('k', 1024), ('m', 1024 ** 2),
+                                  ('g', 1024 ** 3)):
+        if value.endswith(suffix):
+            factor = suffix_factor
+            value = value[:-1]
+            break
+    return int(float(value) * factor)
+
+
+def make_output_filename(filename, suffix='.stripped'):
+    base, ext = os.path.splitext(filename)
+    return base + suffix + ext
+
+
+def main(input_file, output_file=None, resource_filter=None):
+    if not output_file:
+        output_file = make_output_filename(input_file)
+    batch.check_output(input_file, output_file)
+    if resource_filter is None:
+        resource_filter = mhtml.ResourceFilter()
+
+    logger.info('Stripping "%s" into "%s" ...', input_file, output_file)
+
+    # the whole input is read: `strip_mhtml()` copies the kept spans byte
+    # for byte (main header, preamble, delimiter lines, epilogue), which
+    # `StreamParser` does not keep, the spans are written as memoryview
+    # slices without further copies
+    with open(input_file, 'rb') as fin:
+        content = mhtml.decompress(fin.read())
+
+    with mhtml.open_archive_file(output_file, 'wb') as fout:
+        num_kept, num_removed = mhtml.strip_mhtml(content, fout,
+                                                  resource_filter)
+
+    logger.info('Kept %d, removed %d resources, %d -> %d bytes.',
+                num_kept, num_removed, len(content),
+                os.path.getsize(output_file))
+
+
+def main_folder(input_file, folder, root, resource_filter=None):
+    # paths in `folder` relative to the common `root` of the inputs
+    main(input_file, batch.make_output_path(input_file, folder, root),
+         resource_filter)
+
+
+def cli_main():
+    logging.basicConfig(format='%(levelname)-8s: %(message)s',
+                        level=logging.INFO)
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Remove resources from MHTML archives.')
+    parser.add_argument('inputs', nargs='+',
+                        help='MHT/MHTM/MHTML files, directories or globs')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file for a single input, output dir '
+                             'for multiple inputs (default: next to input '
+                             'with ".stripped" suffix)')
+    parser.add_argument('-i', '--include', action='append', default=None,
+                        help='Only keep resources matching the mime-type '
+                             'pattern, e. g. "text/*", can be repeated.')
+    parser.add_argument('-e', '--exclude', action='append', default=None,
+                        help='Remove resources matching the mime-type '
+                             'pattern, e. g. "image/*", can be repeated.')
+    parser.add_argument('-s', '--max-size', type=parse_size, default=None,
+                        help='Remove resources larger than this (encoded) '
+                             'size, suffixes k, m, g are allowed.')
+    parser.add_argument('--include-location', action='append', default=None,
+                        help='Only keep resources with a location matching '
+                             'the regex, can be repeated.')
+    parser.add_argument('--exclude-location', action='append', default=None,
+                        help='Remove resources with a location matching '
+                             'the regex, can be repeated.')
+    parser.add_argument('--strip-main', action='store_true',
+                        help='Allow removing the main page.')
+    batch.add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    resource_filter = mhtml.ResourceFilter(
+        include=args.include, exclude=args.exclude, max_size=args.max_size,
+        include_location=args.include_location,
+        exclude_location=args.exclude_location,
+        keep_main=not args.strip_main)
+
+    filenames = batch.find_files(args.inputs, recursive=args.recursive,
+                                 patterns=args.pattern or
+                                 batch.DEFAULT_PATTERNS)
+    if len(filenames) == 1 or args.output is None:
+        func, func_args = main, (args.output, resource_filter)
+    else:
+        func, func_args = main_folder, (args.output,
+                                        batch.common_root(filenames),
+                                        resource_filter)
+        os.makedirs(args.output, exist_ok=True)
+
+    summary = batch.process_files(func, filenames, args, args=func_args)
+    if not summary.ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli_main()
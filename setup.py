@@ -224,9 +224,11 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: POSIX',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Topic :: Utilities',
     ],
     # single python file
@@ -241,9 +243,16 @@ setup(
             'mhtml-merge  = mhtml_scripts.merge:cli_main',
             'mhtml-list = mhtml_scripts.show_infos:cli_main',
             'mhtml-headers = mhtml_scripts.show_headers:cli_main',
+            'mhtml-strip = mhtml_scripts.strip:cli_main',
+            'mhtml-optimize = mhtml_scripts.optimize:cli_main',
+            'mhtml-store = mhtml_scripts.store:cli_main',
+            'mhtml-index = mhtml_scripts.index:cli_main',
+            'mhtml-search = mhtml_scripts.search:cli_main',
+            'mhtml-grep = mhtml_scripts.grep:cli_main',
+            'mhtml-diff = mhtml_scripts.diff:cli_main',
         ],
     },
-    python_requires='>=3.5',
+    python_requires='>=3.8',
     # $ pip install -e .
     install_requires=[
     ],
@@ -0,0 +1,38 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import sys
+
+import pytest
+
+
+def _make_archive_content(bndry, parts, location='loc0', headers=b'',
+                          epilogue=b''):
+    # archive of raw `parts` (headers + content), `headers` are extra main
+    # header lines (with linebreaks)
+    content = b'Snapshot-Content-Location: ' + location.encode() + \
+        b'\r\n' + headers + \
+        b'Content-Type: multipart/related;\r\n' \
+        b'\tboundary="' + bndry.encode() + b'"\r\n\r\n\r\n'
+    for part in parts:
+        content += bytes('--' + bndry + '\r\n', 'ascii') + part
+    return content + bytes('--' + bndry + '--\r\n', 'ascii') + epilogue
+
+
+def _run_cli(monkeypatch, cli_main, *argv):
+    # -> exit code of a script entry point
+    monkeypatch.setattr(sys, 'argv', [cli_main.__module__] + list(argv))
+    try:
+        cli_main()
+    except SystemExit as ex:
+        return ex.code
+    return 0
+
+
+@pytest.fixture
+def make_archive_content():
+    return _make_archive_content
+
+
+@pytest.fixture
+def run_cli(monkeypatch):
+    return lambda cli_main, *argv: _run_cli(monkeypatch, cli_main, *argv)
@@ -0,0 +1,81 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import json
+
+from benchmarks import compare
+from benchmarks.compare import cli_main
+
+
+def _report(**medians):
+    # name -> (median, stdev)
+    return {'benchmarks': {name: {'median': median, 'stdev': stdev,
+                                  'runs': 5}
+                           for name, (median, stdev) in medians.items()}}
+
+
+def test_compare():
+    baseline = _report(slow=(1.0, 0.01), noisy=(1.0, 0.2), fast=(1.0, 0.01),
+                       same=(1.0, 0.01), gone=(1.0, 0.0))
+    current = _report(slow=(1.2, 0.01), noisy=(1.3, 0.01), fast=(0.5, 0.01),
+                      same=(1.05, 0.01), added=(2.0, 0.0))
+    rows = {row[0]: row for row in compare.compare(baseline, current)}
+
+    # regression above the threshold
+    assert rows['slow'][4] == compare.SLOWER
+    assert abs(rows['slow'][3] - 0.2) < 1e-9
+    # above the threshold, but within the noise of the baseline
+    assert rows['noisy'][4] == compare.OK
+    # below the threshold
+    assert rows['same'][4] == compare.OK
+    assert rows['fast'][4] == compare.FASTER
+    # cases missing from one side
+    assert rows['gone'] == ('gone', 1.0, None, None, compare.MISSING)
+    assert rows['added'] == ('added', None, 2.0, None, compare.NEW)
+
+    status = {row[0]: row[4] for row in compare.compare(
+        baseline, current, threshold=0.25, noise=0.0)}
+    assert status['slow'] == compare.OK
+    assert status['noisy'] == compare.SLOWER
+
+    rows = list(rows.values())
+    assert compare.has_regression(rows)
+    rows = [row for row in rows if row[0] != 'slow']
+    assert not compare.has_regression(rows)
+    assert compare.has_regression(rows, strict=True)
+
+    text = compare.format_rows(sorted(rows), only_changes=True)
+    assert 'gone' in text and 'fast' in text and 'same' not in text
+
+
+def test_baseline_files(tmp_path, run_cli):
+    report = {
+        'meta': {'mhtml_version': 'x'},
+        'benchmarks': {'parse[small]': {'median': 0.5, 'stdev': 0.01,
+                                        'runs': 5, 'bytes': 100}},
+        'curves': {'by_parts': {'param': 'num_parts', 'points': [
+            {'x': 10, 'median': 0.1, 'stdev': 0.0, 'runs': 5}]}},
+    }
+    report_file = str(tmp_path / 'report.json')
+    with open(report_file, 'w') as fout:
+        json.dump(report, fout)
+
+    # full reports are flattened
+    baseline = compare.load(report_file)
+    assert baseline['benchmarks'] == {
+        'parse[small]': {'median': 0.5, 'stdev': 0.01, 'runs': 5},
+        'by_parts[num_parts=10]': {'median': 0.1, 'stdev': 0.0, 'runs': 5}}
+    baseline_file = str(tmp_path / 'baseline.json')
+    assert run_cli(cli_main, 'save', report_file, baseline_file) == 0
+    assert compare.load(baseline_file) == baseline
+
+    assert run_cli(cli_main, 'check', baseline_file, report_file) == 0
+
+    report['benchmarks']['parse[small]']['median'] = 0.7
+    del report['curves']
+    with open(report_file, 'w') as fout:
+        json.dump(report, fout)
+    assert run_cli(cli_main, 'check', baseline_file, report_file) == 1
+    assert run_cli(cli_main, 'check', baseline_file, report_file,
+                   '-t', '50') == 0
+    assert run_cli(cli_main, 'check', baseline_file, report_file,
+                   '-t', '50', '--strict') == 1
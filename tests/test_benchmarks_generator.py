@@ -0,0 +1,43 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import mhtml
+
+from benchmarks import generator
+from benchmarks.run import SHAPES
+
+
+def test_generate_archive_seed():
+    content = generator.generate_archive(num_parts=5, lookalikes=2, seed=3)
+    assert generator.generate_archive(num_parts=5, lookalikes=2,
+                                      seed=3) == content
+    assert generator.generate_archive(num_parts=5, lookalikes=2,
+                                      seed=4) != content
+
+
+def test_generate_archive_encodings():
+    content = generator.generate_archive(num_parts=7, part_size=1000)
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    # the main page is always quoted-printable html
+    assert [res.encoding for res in mhtarc.resources] == \
+        ['quoted-printable'] + [generator.ENCODINGS[nr % 3]
+                                for nr in range(1, 7)]
+    assert mhtarc.resources[0].location == mhtarc.location
+    assert [len(mhtml.decode_payload(res.content, res.encoding))
+            for res in mhtarc.resources] == [1000] * 7
+
+
+def test_generate_archive_shapes():
+    shape = SHAPES['many_headers']
+    mhtarc = mhtml.parse_mhtml_struct(generator.generate_archive(**shape))
+    assert len(mhtarc.resources) == shape['num_parts']
+    assert {len(res.headers) for res in mhtarc.resources} == \
+        {shape['num_headers']}
+
+    # every lookalike is found, but not taken for a delimiter (the main
+    # page is not binary and has none)
+    shape = SHAPES['lookalikes']
+    with mhtml.collect_stats() as stats:
+        mhtarc = mhtml.parse_mhtml_struct(generator.generate_archive(**shape))
+    assert len(mhtarc.resources) == shape['num_parts']
+    assert stats.counters['boundary_false_positives'] == \
+        (shape['num_parts'] - 1) * shape['lookalikes']
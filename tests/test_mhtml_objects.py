@@ -867,3 +867,222 @@ def test_content_hashing(mocker):
     mock_method_content1.assert_called_once_with()
     assert res.content_with_headers_hash == hash_content2
     mock_method_content2.assert_called_once_with()
+
+
+def test_RWLock():  # noqa: N802
+    import threading
+
+    lock = mhtml.RWLock()
+    events = list()
+
+    # reentrant, writer may read
+    with lock.write_locked():
+        with lock.write_locked():
+            with lock.read_locked():
+                pass
+    with lock.read_locked():
+        with lock.read_locked():
+            with pytest.raises(RuntimeError):
+                lock.acquire_write()
+
+    # readers share, writer waits for them
+    lock.acquire_read()
+    reader_done = threading.Event()
+
+    def reader():
+        with lock.read_locked():
+            events.append('read')
+        reader_done.set()
+
+    def writer():
+        with lock.write_locked():
+            events.append('write')
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    assert reader_done.wait(5)
+    thread.join()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    thread.join(0.05)
+    assert thread.is_alive() and events == ['read']
+    lock.release_read()
+    thread.join(5)
+    assert events == ['read', 'write']
+
+
+def test_MHTMLArchive_locking():  # noqa: N802
+    import threading
+
+    bndry = '---boundary---'
+    header = b'Content-Type: multipart/related;\r\n\tboundary="' + \
+        bndry.encode() + b'"\r\n\r\n\r\n'
+    parts = [b'Content-Location: loc' + str(nr).encode() + b'\r\n\r\n' +
+             bytes([65 + nr]) * 1000 + b'\r\n' for nr in range(50)]
+    content = header + b''.join(b'--' + bndry.encode() + b'\r\n' + part
+                                for part in parts) + \
+        b'--' + bndry.encode() + b'--\r\n'
+
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    assert mhtarc.lock is None
+    assert mhtarc.enable_locking() is mhtarc
+    lock = mhtarc.lock
+    assert isinstance(lock, mhtml.RWLock)
+    assert mhtarc.enable_locking().lock is lock
+
+    resources = list(mhtarc.resources)
+    errors = list()
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            for res in resources:
+                # None once removed, never the content of another resource
+                data = res.content
+                if data is None:
+                    continue
+                if data != bytes([data[0]]) * (len(data) - 2) + b'\r\n' \
+                        or data[0] not in (65 + resources.index(res),
+                                           ord('x')):
+                    errors.append(data[:20])
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(25):
+        assert mhtarc.remove_resource(0)
+    assert mhtarc.replace_content(0, b'x' * 10 + b'\r\n')
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(mhtarc.resources) == 25
+    assert all(res.content is None and res.content_view() is None
+               for res in resources[:25])
+    assert resources[0].location == 'loc0'
+    with pytest.raises(ValueError):
+        mhtml.ResourceReader(resources[0]).read()
+    with pytest.raises(ValueError, match='removed'):
+        mhtarc.insert_resource(0, resources[0])
+    assert len(mhtarc.resources) == 25
+    assert mhtarc.resources[0].content == b'x' * 10 + b'\r\n'
+    assert mhtarc.resources[1].content == bytes([65 + 26]) * 1000 + b'\r\n'
+
+
+def test_Resource_content_view():  # noqa: N802
+    import hashlib
+    import sys
+
+    bndry = '---boundary---'
+    header = b'Content-Type: multipart/related;\r\n\tboundary="' + \
+        bndry.encode() + b'"\r\n\r\n\r\n'
+    content = header + b'--' + bndry.encode() + b'\r\n' + \
+        b'H1: V1\r\n\r\nContent\r\n' + b'--' + bndry.encode() + b'\r\n' + \
+        b'H2: V2\r\n\r\nother\r\n' + b'--' + bndry.encode() + b'--\r\n'
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    res = mhtarc.resources[0]
+
+    view = res.content_view()
+    assert isinstance(view, memoryview)
+    assert view == b'Content\r\n' == res.content
+    assert res.content_with_headers_view() == res.content_with_headers
+    assert mhtarc.content_view() == content
+    if sys.version_info >= (3, 12):
+        assert hashlib.sha256(res).digest() == res.content_hash
+        assert bytes(res) == res.content
+
+    # resizing mutations are not possible while a view exists
+    with pytest.raises(BufferError):
+        mhtarc.remove_resource(1)
+    assert len(mhtarc.resources) == 2
+    # same size changes are visible
+    assert mhtarc.replace_content(0, b'CONTENT\r\n')
+    assert view == b'CONTENT\r\n'
+    view.release()
+    assert mhtarc.remove_resource(1)
+
+    with res.content_view() as view:
+        assert view.tobytes() == b'CONTENT\r\n'
+    assert res.content_with_headers_view().tobytes() == \
+        b'H1: V1\r\n\r\nCONTENT\r\n'
+
+    res._mhtml_file._content = None
+    assert res.content_view() is None
+    assert res.content_with_headers_view() is None
+    res._mhtml_file = None
+    assert res.content_view() is None
+
+
+def test_ResourceReader():  # noqa: N802
+    import base64
+    import binascii
+    import io
+
+    bndry = '---boundary---'
+    data = bytes(range(256)) * 20
+    text = b'line with = and \xe4 umlaut ' * 10 + b'\r\nsecond line\r\n'
+    parts = [
+        (b'Content-Transfer-Encoding: base64\r\nContent-Location: img\r\n',
+         base64.encodebytes(data).replace(b'\n', b'\r\n')),
+        (b'Content-Transfer-Encoding: quoted-printable\r\n',
+         binascii.b2a_qp(text.replace(b'\r\n', b'\n'))
+         .replace(b'\n', b'\r\n') + b'\r\n'),
+        (b'Content-Transfer-Encoding: binary\r\n', data + b'\r\n'),
+    ]
+    content = b'Content-Type: multipart/related;\r\n\tboundary="' + \
+        bndry.encode() + b'"\r\n\r\n\r\n'
+    for headers, payload in parts:
+        content += b'--' + bndry.encode() + b'\r\n' + headers + b'\r\n' + \
+            payload
+    content += b'--' + bndry.encode() + b'--\r\n'
+    mhtarc = mhtml.parse_mhtml_struct(content)
+
+    for chunk_size in (1, 3, 5, 77, 1 << 16):
+        for nr, expected in enumerate((data, text, data)):
+            # the linebreak before the delimiter is not part of the payload
+            res = mhtarc.resources[nr]
+            assert mhtml.decode_payload(res.content,
+                                        res.headers.encoding) == expected
+            raw = mhtml.ResourceReader(res, chunk_size=chunk_size)
+            assert raw.read() == expected
+            assert raw.read() == b''
+            with mhtml.ResourceReader(res, chunk_size=chunk_size) as raw:
+                pieces = list(iter(lambda: raw.read(7), b''))
+            assert b''.join(pieces) == expected
+
+    # buffered, by location, number or object
+    with mhtarc.open_resource('img') as fin:
+        assert isinstance(fin, io.BufferedReader)
+        assert fin.read(10) == data[:10]
+        assert fin.read() == data[10:]
+        assert not fin.seekable()
+        with pytest.raises(io.UnsupportedOperation):
+            fin.seek(0)
+    with mhtarc.open_resource(0, decode=False) as fin:
+        assert fin.read() == mhtarc.resources[0].content
+    with mhtarc.resources[1].open() as fin:
+        assert fin.readline() == text.split(b'\r\n')[0] + b'\r\n'
+    with pytest.raises(KeyError):
+        mhtarc.open_resource('missing')
+    with pytest.raises(KeyError):
+        mhtarc.open_resource(3)
+
+    # binary content is seekable
+    with mhtarc.open_resource(mhtarc.resources[2]) as fin:
+        assert fin.seekable()
+        assert fin.seek(-4, io.SEEK_END) == len(data) - 4
+        assert fin.read() == data[-4:]
+        fin.seek(256)
+        assert fin.read(3) == b'\x00\x01\x02'
+        assert fin.tell() == 259
+        buf = bytearray(4)
+        assert fin.readinto(buf) == 4 and buf == b'\x03\x04\x05\x06'
+    with pytest.raises(ValueError):
+        mhtml.ResourceReader(mhtarc.resources[2]).seek(-1)
+
+    # readers follow changes of the archive
+    fin = mhtarc.open_resource(2)
+    assert mhtarc.remove_resource(0)
+    assert fin.read() == data
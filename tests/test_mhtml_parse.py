@@ -1,6 +1,8 @@
 # pylint: disable=missing-docstring,invalid-name
 # pylint: disable=protected-access
 
+import os
+
 import pytest
 
 import mhtml
@@ -241,6 +243,72 @@ def test_find_next_boundary():
                                     b'--\r\n', '---boundary---', 0) == (2, -1)
 
 
+def test_parse_header_block():
+    assert mhtml.find_header_end(b'', 0) == (-1, -1)
+    assert mhtml.find_header_end(b'\r\nabc', 0) == (0, 2)
+    assert mhtml.find_header_end(b'CH: CV\r\n\r\nabc', 0) == (6, 10)
+    assert mhtml.find_header_end(b'CH: CV\r\n\tCV2\r\n\r\n', 0) == (12, 16)
+    assert mhtml.find_header_end(b'CH: CV\r\n', 0) == (-1, -1)
+
+    assert mhtml.parse_header_block(b'') == mhtml.ResourceHeader()
+    assert mhtml.parse_header_block(b'CH: CV;\r\n\tCV2\r\nCH2: CV3') == \
+        mhtml.ResourceHeader([('CH', 'CV;\r\n\tCV2'), ('CH2', 'CV3')])
+    assert mhtml.parse_header_block(b'CH: CV\r\nbad\r\nCH2: \xc3\xa4') == \
+        mhtml.ResourceHeader([('CH', 'CV'), ('CH2', '\xe4')])
+
+    # content starting with a tab is not a folded empty line
+    assert mhtml.parse_header(b'CH: CV\r\n\r\n\tcontent\r\n', 0) == \
+        (mhtml.ResourceHeader([('CH', 'CV')]), 10)
+
+
+def test_BoundaryScanner():  # noqa: N802
+    bndry = '---boundary---'
+    scanner = mhtml.BoundaryScanner(bndry)
+    assert scanner.delimiter == b'-----boundary---\r\n'
+    assert scanner.close_delimiter == b'-----boundary-----\r\n'
+
+    # same as `find_next_boundary`
+    assert scanner.find(b'\r\n--' + bndry.encode() + b'\r\n', 0) == \
+        (2, 20)
+    assert mhtml.find_next_boundary(b'\r\n--' + bndry.encode() + b'\r\n',
+                                    scanner, 0) == (2, 20)
+
+    # lookalikes are skipped
+    content = b'x--' + bndry.encode() + b'\r\n' \
+        + b'\r\n--' + bndry.encode() + b'-other\r\n' \
+        + b'\r\n--' + bndry.encode() + b'x' \
+        + b'x--' + bndry.encode() + b'--\r\n' \
+        + b'\r\n--' + bndry.encode() + b'\r\n'
+    assert scanner.find(content, 0) == (len(content) - 18, len(content))
+    assert scanner.find(content, len(content) - 18) == \
+        (len(content) - 18, len(content))
+    assert scanner.find(content, len(content) - 17) == (-1, -1)
+
+    # close delimiter ends the parts, even with trailing data
+    content = b'\r\n--' + bndry.encode() + b'--\r\n\r\nepilogue'
+    assert scanner.find(content, 0) == (2, -1)
+    headers, parts = mhtml.parse_mhtml(
+        b'Content-Type: multipart/related; boundary="' + bndry.encode()
+        + b'"\r\n\r\n\r\n--' + bndry.encode() + b'\r\nA: B\r\n\r\n'
+        + b'content\r\n' + content[2:])
+    assert headers['Content-Type'].startswith('multipart/related')
+    assert len(parts) == 1
+    assert parts[0][0] == mhtml.ResourceHeader([('A', 'B')])
+
+
+def test_find_next_boundary_many_lookalikes():
+    # used to recurse for every lookalike
+    bndry = '---boundary---'
+    lookalike = b' --' + bndry.encode() + b'\r\n'
+    content = b'\r\n' + lookalike * 20000 + b'\r\n--' + bndry.encode() \
+        + b'--\r\n'
+    with mhtml.collect_stats() as stats:
+        assert mhtml.find_next_boundary(content, bndry, 0) == \
+            (len(content) - 20, -1)
+    assert stats.counters['boundary_false_positives'] == 20000
+    assert stats.counters['bytes_scanned'] == len(content) - 20
+
+
 def test_parse_part():
     # boundary is string (because from header)
     with pytest.raises(TypeError):
@@ -519,7 +587,8 @@ def test_MHTMLArchive_from_file(mocker):  # noqa: N80
     mhtml.MHTMLArchive_from_file('somefilename', only_header=True)
 
     mock_open.assert_called_once_with('somefilename', 'rb')
-    mock_parse.assert_called_once_with(b'abc', only_header=True)
+    mock_parse.assert_called_once_with(b'abc', only_header=True, lazy=False,
+                                       jobs=1)
 
 
 def test_MHTMLArchive_to_file(mocker):  # noqa: N80
@@ -533,3 +602,770 @@ def test_MHTMLArchive_to_file(mocker):  # noqa: N80
     mock_open.assert_called_once_with('somefilename', 'wb')
     mock_handle = mock_open()
     mock_handle.write.assert_called_once_with(b'abc2')
+
+
+# ---------------------------------------------------------------------------
+
+
+def test_ResourceFilter():  # noqa: N802
+    html = mhtml.ResourceHeader([('Content-Type', 'text/html'),
+                                 ('Content-Location', 'http://a/b.html')])
+    img = mhtml.ResourceHeader([('Content-Type', 'image/PNG'),
+                                ('Content-Location', 'http://ads/x.png')])
+
+    rf = mhtml.ResourceFilter()
+    assert rf(html, 10) and rf(img, 10)
+
+    rf = mhtml.ResourceFilter(exclude='image/*')
+    assert rf(html, 10) and not rf(img, 10)
+    # main page is kept
+    assert rf(img, 10, is_main=True)
+    rf = mhtml.ResourceFilter(exclude='image/*', keep_main=False)
+    assert not rf(img, 10, is_main=True)
+
+    rf = mhtml.ResourceFilter(include=['text/*'])
+    assert rf(html, 10) and not rf(img, 10)
+    rf = mhtml.ResourceFilter(include=['text/*'], include_location=r'//ads/')
+    assert rf(html, 10) and rf(img, 10)
+
+    rf = mhtml.ResourceFilter(exclude_location=[r'//ads/'])
+    assert rf(html, 10) and not rf(img, 10)
+
+    rf = mhtml.ResourceFilter(max_size=10)
+    assert rf(html, 10) and not rf(img, 11)
+
+
+def test_strip_mhtml(make_archive_content):
+    import io
+
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    part2 = b'Content-Type: image/png\r\nContent-Location: loc1\r\n\r\n' \
+        b'png\r\n'
+    part3 = b'Content-Type: text/css\r\nContent-Location: loc2\r\n\r\n' \
+        b'css\r\n'
+    content = make_archive_content(bndry, [part1, part2, part3])
+
+    fout = io.BytesIO()
+    assert mhtml.strip_mhtml(content, fout, mhtml.ResourceFilter()) == (3, 0)
+    assert fout.getvalue() == content
+
+    fout = io.BytesIO()
+    assert mhtml.strip_mhtml(content, fout,
+                             mhtml.ResourceFilter(exclude='image/*')) \
+        == (2, 1)
+    assert fout.getvalue() == make_archive_content(bndry, [part1, part3])
+
+    # main page kept
+    fout = io.BytesIO()
+    assert mhtml.strip_mhtml(content, fout,
+                             lambda headers, size, is_main: is_main) == (1, 2)
+    assert fout.getvalue() == make_archive_content(bndry, [part1])
+    mhtarc = mhtml.parse_mhtml_struct(fout.getvalue())
+    assert len(mhtarc.resources) == 1
+    assert mhtarc.resources[0].content == b'<html>\r\n'
+
+
+def test_optimize_mhtml(make_archive_content):
+    import base64
+    import binascii
+    import io
+
+    bndry = '---boundary---'
+    data = bytes(range(256)) * 4
+    text = b'<html>\r\n' + 'caf\u00e9 '.encode('utf-8') * 100 + \
+        b'\r\n</html>'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n' \
+        b'Content-Transfer-Encoding: quoted-printable\r\n\r\n' + \
+        binascii.b2a_qp(text) + b'\r\n'
+    part2 = b'Content-Type: image/png\r\nContent-Transfer-Encoding: \r\n' \
+        b'\tBASE64\r\nContent-Location: loc1\r\n\r\n' + \
+        base64.encodebytes(data).replace(b'\n', b'\r\n')
+    # would contain the boundary, kept
+    collision = b'x\r\n--' + bndry.encode() + b'\r\ny'
+    part3 = b'Content-Type: image/png\r\n' \
+        b'Content-Transfer-Encoding: base64\r\n\r\n' + \
+        base64.encodebytes(collision).replace(b'\n', b'\r\n')
+    part4 = b'Content-Type: text/css\r\n\r\ncss\r\n'
+    content = make_archive_content(bndry, [part1, part2, part3, part4])
+
+    fout = io.BytesIO()
+    assert mhtml.optimize_mhtml(content, fout) == (1, 4)
+    optimized = fout.getvalue()
+    assert len(optimized) < len(content)
+    assert mhtml.verify_optimized(content, optimized)
+    mhtarc = mhtml.parse_mhtml_struct(optimized)
+    assert [res.encoding for res in mhtarc.resources] == \
+        ['quoted-printable', 'binary', 'base64', None]
+    assert mhtarc.resources[1].content == data + b'\r\n'
+    assert mhtarc.resources[1].location == 'loc1'
+    assert mhtarc.resources[2].content_with_headers == part3
+
+    fout = io.BytesIO()
+    assert mhtml.optimize_mhtml(content, fout, quoted_printable=True) == \
+        (2, 4)
+    assert mhtml.verify_optimized(content, fout.getvalue())
+    mhtarc = mhtml.parse_mhtml_struct(fout.getvalue())
+    assert mhtarc.resources[0].encoding == '8bit'
+    assert mhtarc.resources[0].content == text + b'\r\n'
+
+    # nothing to convert
+    fout = io.BytesIO()
+    assert mhtml.optimize_mhtml(optimized, fout) == (0, 4)
+    assert fout.getvalue() == optimized
+
+    assert not mhtml.verify_optimized(
+        content, make_archive_content(bndry, [part1, part2, part3]))
+    assert not mhtml.verify_optimized(
+        content, make_archive_content(bndry, [part1, part2, part3,
+                                               part4 + b'x']))
+
+
+def test_collect_stats(make_archive_content):
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\n\r\n' \
+        b'x --' + bndry.encode() + b'\r\n<html>\r\n'
+    part2 = b'Content-Type: text/css\r\n\r\ncss\r\n'
+    content = make_archive_content(bndry, [part1, part2])
+
+    assert mhtml._stats is None
+    with mhtml.collect_stats() as stats:
+        assert mhtml._stats is stats
+        mhtarc = mhtml.parse_mhtml_struct(content)
+    assert mhtml._stats is None
+
+    assert stats.counters['parts_parsed'] == 2
+    assert stats.counters['headers_parsed'] == 3
+    assert stats.counters['boundary_false_positives'] == 1
+    assert stats.counters['bytes_parsed'] == len(content)
+    assert 0 < stats.counters['bytes_scanned'] <= 2 * len(content)
+    for phase in ('parse_main_header', 'parse_parts', 'parse_header',
+                  'build_resources', 'parse_mhtml_struct'):
+        assert stats.timings[phase] >= 0
+    assert stats.calls['parse_header'] == 3
+
+    # mutations
+    stats.reset()
+    assert stats.as_dict() == {'timings': {}, 'calls': {}, 'counters': {}}
+    with mhtml.collect_stats(stats):
+        mhtarc.remove_resource(0)
+    assert stats.counters['offsets_updated'] == 1
+    assert stats.counters['bytes_copied'] == \
+        len(part2) + len(bndry) + 4 + len(bndry) + 6
+    assert stats.calls['remove_resource'] == 1
+
+    # disabled again
+    mhtml.parse_mhtml_struct(content)
+    assert stats.calls['remove_resource'] == 1
+    assert 'parts_parsed' not in stats.counters
+
+
+def test_parse_mhtml_struct_lazy(make_archive_content):
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    part2 = b'\r\ncss\r\n'
+    part3 = b'Content-Type: image/png\r\n' \
+        b'Content-Transfer-Encoding: base64\r\n\r\ncG5n\r\n'
+    content = make_archive_content(bndry, [part1, part2, part3])
+
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    with mhtml.collect_stats() as stats:
+        lazyarc = mhtml.parse_mhtml_struct(content, lazy=True)
+    # only the main header
+    assert stats.counters['headers_parsed'] == 1
+
+    assert len(lazyarc.resources) == 3
+    for res, lazyres in zip(mhtarc.resources, lazyarc.resources):
+        assert lazyres._headers is None
+        assert (lazyres._offset_start, lazyres._offset_content,
+                lazyres._offset_end) == \
+            (res._offset_start, res._offset_content, res._offset_end)
+        assert lazyres.content == res.content
+
+    # parsed on first access
+    assert lazyarc.resources[0].location == 'loc0'
+    assert lazyarc.resources[0]._headers is not None
+    assert lazyarc.resources[1]._headers is None
+    assert lazyarc.resources[2].content_type == 'image/png'
+    assert lazyarc.resources[2].encoding == 'base64'
+    for res, lazyres in zip(mhtarc.resources, lazyarc.resources):
+        assert lazyres.headers == res.headers
+
+    # offsets are kept up to date by mutations
+    lazyarc = mhtml.parse_mhtml_struct(content, lazy=True)
+    lazyarc.remove_resource(0)
+    assert lazyarc.resources[1].content_type == 'image/png'
+    assert lazyarc.resources[0].headers == mhtml.ResourceHeader()
+
+
+def test_parse_parts_parallel(make_archive_content):
+    bndry = '---boundary---'
+    parts = [b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n'
+             b'<html>\r\n', b'', b'\r\ncss\r\n', b'',
+             # header runs into the next part
+             b'Content-Type: text/plain\r\n']
+    for nr in range(40):
+        parts.append('Content-Location: loc{}\r\n\r\n{}\r\n'
+                     .format(nr + 1, 'x' * (nr * 7)).encode())
+    content = make_archive_content(bndry, parts)
+    mhtarc = mhtml.parse_mhtml_struct(content, only_header=True)
+    pos = mhtarc._header_length
+
+    for lazy in (False, True):
+        expected = mhtml.parse_parts(content, bndry, pos, lazy=lazy)
+        assert len(expected[0]) == len(parts)
+        for jobs in (2, 3, 7):
+            assert mhtml.parse_parts_parallel(
+                content, bndry, pos, jobs=jobs, lazy=lazy,
+                min_segment_size=1) == expected
+
+    # data after the end-of-parts boundary
+    epilogue = content + b'--' + bndry.encode() + b'\r\nX: Y\r\n\r\nz\r\n'
+    assert mhtml.parse_parts_parallel(epilogue, bndry, pos, jobs=4,
+                                      min_segment_size=1) == \
+        mhtml.parse_parts(epilogue, bndry, pos)
+
+    # small content is parsed serially
+    with mhtml.collect_stats() as stats:
+        mhtarc = mhtml.parse_mhtml_struct(content, jobs=4)
+    assert 'parallel_segments' not in stats.counters
+    assert len(mhtarc.resources) == len(parts)
+
+
+def _shared_content_hashes(handle):
+    with mhtml.attach_archive(handle) as mhtarc:
+        return [res.content_hash for res in mhtarc.resources]
+
+
+def test_SharedArchive(make_archive_content):  # noqa: N802
+    from concurrent.futures import ProcessPoolExecutor
+
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    part2 = b'Content-Type: image/png\r\nX: a\r\nX: b\r\n\r\npng\r\n'
+    content = make_archive_content(bndry, [part1, part2])
+    mhtarc = mhtml.parse_mhtml_struct(content)
+
+    with mhtml.SharedArchive(mhtarc) as shared:
+        assert len(shared.handle) == 3 and shared.name == shared.handle[0]
+
+        view = mhtml.attach_archive(shared.handle)
+        assert view.content == content
+        assert view.headers == mhtarc.headers
+        assert view.boundary == bndry
+        assert len(view.resources) == 2
+        for res, view_res in zip(mhtarc.resources, view.resources):
+            assert view_res.headers == res.headers
+            assert view_res.content == res.content
+            assert view_res.content_with_headers == res.content_with_headers
+        assert view.resources[1].headers.as_list()[1:] == \
+            [('X', 'a'), ('X', 'b')]
+
+        with pytest.raises(TypeError):
+            view.remove_resource(0)
+        with pytest.raises(TypeError):
+            view.resources[0].content = b'abc'
+        with pytest.raises(TypeError):
+            view.append_resource(mhtarc.resources[0])
+        view.close()
+        view.close()
+
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(_shared_content_hashes,
+                                   shared.handle).result() == \
+                [res.content_hash for res in mhtarc.resources]
+    shared.close()
+
+
+def test_dumps_structure(make_archive_content):
+    import pickle
+
+    bndry = '---boundary---'
+    part1 = 'Content-Type: text/html\r\nContent-Location: lôc0\r\n\r\n' \
+        '<html>\r\n'.encode()
+    part2 = b'\r\ncss\r\n'
+    part3 = b'Content-Type: text/html\r\nX: a\r\nX: a\r\n\r\nhtml\r\n'
+    content = make_archive_content(bndry, [part1, part2, part3])
+    mhtarc = mhtml.parse_mhtml_struct(content, lazy=True)
+
+    data = mhtml.dumps_structure(mhtarc)
+    assert isinstance(data, bytes)
+    assert len(data) < len(pickle.dumps(mhtarc))
+    # header strings are only stored once
+    assert data.count(b'text/html') == 1
+
+    mhtarc2 = mhtml.loads_structure(data, content)
+    # headers are built on access
+    assert all(res._headers is None for res in mhtarc2.resources)
+    eager = mhtml.loads_structure(data, content, lazy=False)
+    assert [res._headers for res in eager.resources] == \
+        [res.headers for res in mhtarc.resources]
+    assert mhtarc2.content == content
+    assert mhtarc2.headers == mhtarc.headers
+    assert mhtarc2.boundary == bndry
+    assert mhtarc2._header_length == mhtarc._header_length
+    assert len(mhtarc2.resources) == 3
+    for res, res2 in zip(mhtarc.resources, mhtarc2.resources):
+        assert res2.headers == res.headers
+        assert (res2._offset_start, res2._offset_content,
+                res2._offset_end) == \
+            (res._offset_start, res._offset_content, res._offset_end)
+        assert res2.content == res.content
+    assert mhtarc2.resources[0].location == 'lôc0'
+    assert mhtarc2.resources[2].headers.as_list()[1:] == \
+        [('X', 'a'), ('X', 'a')]
+    # structure of a new archive (no boundary) can be encoded too
+    assert mhtml.loads_structure(mhtml.dumps_structure(
+        mhtml.MHTMLArchive(b'', mhtml.ResourceHeader(), 0, None)),
+        b'').boundary \
+        is None
+
+    with pytest.raises(ValueError):
+        mhtml.loads_structure(data, content[:-1])
+    with pytest.raises(ValueError):
+        mhtml.loads_structure(data[:-1], content)
+    with pytest.raises(ValueError):
+        mhtml.loads_structure(data[:10], content)
+    with pytest.raises(ValueError):
+        mhtml.loads_structure(b'XXXX' + data[4:], content)
+    # string index out of range
+    with pytest.raises(ValueError):
+        mhtml.loads_structure(data[:-4] + b'\xff' * 4, content)
+
+
+def test_ParseCache(tmp_path, make_archive_content):  # noqa: N802
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    part2 = b'Content-Type: text/css\r\n\r\ncss\r\n'
+    content = make_archive_content(bndry, [part1, part2])
+    filename = str(tmp_path / 'a.mhtml')
+    with open(filename, 'wb') as fout:
+        fout.write(content)
+
+    # small files are not worth it
+    cache = mhtml.ParseCache(str(tmp_path / 'cache'))
+    mhtml.MHTMLArchive_from_file(filename, cache=cache)
+    assert len(cache) == 0
+
+    cache = mhtml.ParseCache(str(tmp_path / 'cache'), min_size=0)
+    with mhtml.collect_stats() as stats:
+        mhtarc = mhtml.MHTMLArchive_from_file(filename, cache=cache)
+        assert stats.counters['cache_misses'] == 1
+        assert stats.counters['parts_parsed'] == 2
+        assert len(cache) == 1
+
+        stats.reset()
+        cached = mhtml.MHTMLArchive_from_file(filename, cache=cache)
+        assert stats.counters == {'cache_hits': 1}
+    assert cached.content == content
+    assert [res.headers for res in cached.resources] == \
+        [res.headers for res in mhtarc.resources]
+    assert cached.resources[1].content == b'css\r\n'
+
+    # headers are built on first access if lazy
+    cached = mhtml.MHTMLArchive_from_file(filename, lazy=True, cache=cache)
+    assert cached.resources[0]._headers is None
+    assert cached.resources[0].headers == mhtarc.resources[0].headers
+    cached = mhtml.MHTMLArchive_from_file(filename, cache=cache)
+    assert cached.resources[0]._headers is not None
+
+    # the content is only hashed if path, size and mtime match
+    digests = list()
+    digest = cache._digest
+    cache._digest = lambda content: digests.append(content) or digest(content)
+    assert cache.get(filename, content) is not None
+    assert len(digests) == 1
+    os.utime(filename, ns=(0, 0))
+    assert cache.get(filename, content) is None
+    assert len(digests) == 1
+    del cache._digest
+
+    # changed content, even with the same size and mtime
+    mhtml.MHTMLArchive_from_file(filename, cache=cache)
+    stat = os.stat(filename)
+    with open(filename, 'wb') as fout:
+        fout.write(content.replace(b'css', b'CSS'))
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    mhtarc = mhtml.MHTMLArchive_from_file(filename, cache=cache)
+    assert mhtarc.resources[1].content == b'CSS\r\n'
+    assert len(cache) == 1
+
+    # other processes (connections) see the entries
+    assert len(mhtml.ParseCache(str(tmp_path / 'cache'), min_size=0)) == 1
+
+    # least recently used entries are evicted
+    filename2 = str(tmp_path / 'b.mhtml')
+    with open(filename2, 'wb') as fout:
+        fout.write(content)
+    cache = mhtml.ParseCache(str(tmp_path / 'cache'),
+                             max_size=len(mhtml.dumps_structure(mhtarc)),
+                             min_size=0)
+    mhtml.MHTMLArchive_from_file(filename2, cache=cache)
+    assert len(cache) == 1
+    assert cache.get(filename2, content) is not None
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def _stream_parts(content, chunk_size):
+    parser = mhtml.StreamParser()
+    parts = list()
+    for pos in range(0, len(content), chunk_size):
+        parts.extend(parser.feed(content[pos:pos + chunk_size]))
+    parts.extend(parser.close())
+    assert parser.done
+    return parser, parts
+
+
+def test_StreamParser(make_archive_content):  # noqa: N802
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n--' + bndry.encode() + b'x\r\n'
+    part2 = b''
+    part3 = b'\r\n \r\n--' + bndry.encode() + b'--x\r\n'
+    part4 = b'Content-Type: text/css\r\n\r\ncss\r\n'
+    content = make_archive_content(bndry, [part1, part2, part3, part4])
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    expected = [(res.headers, res.content, res._offset_start)
+                for res in mhtarc.resources]
+
+    for chunk_size in (1, 2, 3, 7, 64, len(content)):
+        parser, parts = _stream_parts(content, chunk_size)
+        assert parser.headers == mhtarc.headers
+        assert parser.boundary == bndry
+        assert [tuple(part) for part in parts] == expected
+
+    # epilogue is ignored, missing end-of-parts boundary
+    _, parts = _stream_parts(content + b'--' + bndry.encode() + b'\r\n\r\n'
+                             b'x\r\n', 5)
+    assert len(parts) == 4
+    _, parts = _stream_parts(content[:-len(bndry) - 6], 5)
+    assert [tuple(part) for part in parts] == expected
+    # no boundary, empty stream
+    _, parts = _stream_parts(b'Content-Type: text/html\r\n\r\n\r\n', 5)
+    assert parts == []
+    assert mhtml.StreamParser().close() == []
+
+
+def test_async_api(tmp_path, make_archive_content):
+    import asyncio
+    import io
+    import time
+
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    part2 = b'Content-Type: text/css\r\n\r\ncss\r\n'
+    content = make_archive_content(bndry, [part1, part2])
+    filename = str(tmp_path / 'a.mhtml')
+    with open(filename, 'wb') as fout:
+        fout.write(content)
+
+    async def collect(stream):
+        parts = list()
+        async for part in mhtml.iter_resources(stream, chunk_size=10):
+            parts.append(part)
+        return parts
+
+    async def run():
+        mhtarc = await mhtml.load_archive(filename)
+        assert mhtarc.content == content
+        await mhtarc.save(str(tmp_path / 'b.mhtml'))
+        await mhtml.save_archive(mhtarc, str(tmp_path / 'c.mhtml'))
+        archives = await mhtml.load_archives(
+            [str(tmp_path / name) for name in ('a.mhtml', 'b.mhtml',
+                                               'c.mhtml')], limit=2,
+            lazy=True)
+        assert [arc.content for arc in archives] == [content] * 3
+
+        # file like and asyncio streams
+        parts = await collect(io.BytesIO(content))
+        reader = asyncio.StreamReader()
+        reader.feed_data(content)
+        reader.feed_eof()
+        assert await collect(reader) == parts
+
+        # blocking reads do not stall other tasks
+        class SlowStream:
+            def __init__(self, data):
+                self.num_reads = 0
+                self._fin = io.BytesIO(data)
+
+            def read(self, size):
+                self.num_reads += 1
+                time.sleep(0.01)
+                return self._fin.read(size)
+
+        ticks = list()
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.001)
+
+        task = asyncio.ensure_future(tick())
+        stream = SlowStream(content)
+        assert await collect(stream) == parts
+        task.cancel()
+        assert len(ticks) >= stream.num_reads
+        return mhtarc, parts
+
+    loop = asyncio.new_event_loop()
+    try:
+        mhtarc, parts = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    assert [part.content for part in parts] == [b'<html>\r\n', b'css\r\n']
+    assert parts[0].headers.location == 'loc0'
+    assert parts[1].offset == mhtarc.resources[1]._offset_start
+
+
+def test_compressed_files(tmp_path, make_archive_content):
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    part2 = b'Content-Type: text/css\r\n\r\ncss\r\n'
+    content = make_archive_content(bndry, [part1, part2])
+    mhtarc = mhtml.parse_mhtml_struct(content)
+
+    assert mhtml.detect_compression(content[:6]) is None
+    assert mhtml.decompress(content) is content
+    with pytest.raises(ValueError):
+        mhtml.open_archive_file(str(tmp_path / 'x'), 'r')
+
+    cache = mhtml.ParseCache(str(tmp_path / 'cache'), min_size=0)
+    for suffix, compression in (('.gz', 'gzip'), ('.xz', 'xz'),
+                                ('.bz2', 'bz2')):
+        # by suffix and explicit
+        filename = str(tmp_path / ('a.mhtml' + suffix))
+        mhtml.MHTMLArchive_to_file(mhtarc, filename)
+        filename2 = str(tmp_path / 'b.mhtml')
+        mhtml.MHTMLArchive_to_file(mhtarc, filename2, compression=compression)
+        for name in (filename, filename2):
+            with open(name, 'rb') as fin:
+                data = fin.read()
+            assert mhtml.detect_compression(data[:6]) == compression
+            assert mhtml.decompress(data) == content
+
+            loaded = mhtml.MHTMLArchive_from_file(name, cache=cache)
+            assert loaded.content == content
+            assert loaded.resources[1].content == b'css\r\n'
+            parts = list(mhtml.iter_file_parts(name, chunk_size=7))
+            assert [part.content for part in parts] == \
+                [b'<html>\r\n', b'css\r\n']
+
+        with mhtml.collect_stats() as stats:
+            mhtml.MHTMLArchive_from_file(filename, cache=cache)
+            assert stats.counters == {'cache_hits': 1}
+
+        with mhtml.MHTMLWriter(filename, boundary=bndry) as writer:
+            writer.add_raw_part(part1)
+        with mhtml.open_archive_file(filename) as fin:
+            assert mhtml.parse_mhtml_struct(fin.read()).resources[0] \
+                .content == b'<html>\r\n'
+
+    with pytest.raises(ValueError):
+        mhtml.MHTMLArchive_to_file(mhtarc, filename, compression='zip')
+
+
+def test_MHTMLContainer(tmp_path, make_archive_content):  # noqa: N802
+    import base64
+
+    bndry = '---boundary---'
+    part1 = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    part2 = b'Content-Type: image/png\r\nContent-Location: loc1\r\n' \
+        b'Content-Transfer-Encoding: base64\r\n\r\n' + \
+        base64.encodebytes(bytes(range(256)) * 4).replace(b'\n', b'\r\n')
+    part3 = b'Content-Type: text/css\r\n\r\ncss\r\n'
+    content = make_archive_content(bndry, [part1, part2, part3])
+    mhtarc = mhtml.parse_mhtml_struct(content)
+
+    filename = str(tmp_path / 'a.mhtz')
+    for compression in (None, 'gzip', 'xz', 'bz2'):
+        for block_size in (50, 1 << 20):
+            num_blocks = mhtml.write_container(
+                mhtarc, filename, compression=compression,
+                block_size=block_size)
+            with mhtml.MHTMLContainer(filename, cache_blocks=2) as container:
+                assert container.num_blocks == num_blocks
+                assert (num_blocks > 3) == (block_size == 50)
+                assert container.compression == compression
+                assert container.boundary == bndry
+                assert container.location == 'loc0'
+                assert len(container) == 3
+                for res, cres in zip(mhtarc.resources, container.resources):
+                    assert cres.headers == res.headers
+                    assert cres.content == res.content
+                    assert cres.content_with_headers == \
+                        res.content_with_headers
+                assert container.read(0, len(content) + 10) == content
+                assert container.read(5, 5) == b''
+                assert container.get_resource('loc1').get_content(
+                    decode=True) == bytes(range(256)) * 4
+                assert container.get_resource(2).size == 5
+                assert container.get_resource(3) is None
+                assert container.get_resource('nope') is None
+
+                assert container.to_archive().content == content
+                container.export(str(tmp_path / 'b.mhtml.gz'))
+            assert mhtml.MHTMLArchive_from_file(
+                str(tmp_path / 'b.mhtml.gz')).content == content
+
+    with pytest.raises(ValueError):
+        mhtml.write_container(mhtarc, filename, compression='zip')
+    with open(filename, 'wb') as fout:
+        fout.write(content)
+    with pytest.raises(ValueError):
+        mhtml.MHTMLContainer(filename)
+
+
+def test_MHTMLWriter(tmp_path):  # noqa: N802
+    import io
+
+    boundary = mhtml.make_boundary()
+    assert boundary.startswith('----MultipartBoundary--') and \
+        len(boundary) == 69 and boundary != mhtml.make_boundary()
+
+    data = bytes(range(256)) * 300
+    text = b'<html>\r\n' + b'x = "y"; ' * 50 + b'\r\n</html>'
+    fout = io.BytesIO()
+    with mhtml.MHTMLWriter(fout, headers=[('Snapshot-Content-Location',
+                                           'loc0')]) as writer:
+        assert writer.boundary.startswith('----MultipartBoundary--')
+        writer.add_part({'Content-Type': 'text/html',
+                         'Content-Location': 'loc0'}, text,
+                        encoding='quoted-printable')
+        writer.add_part([('Content-Type', 'image/png'),
+                         ('Content-Transfer-Encoding', 'base64')],
+                        io.BytesIO(data))
+        writer.add_part({'Content-Type': 'text/css'}, b'css')
+        writer.add_part({'Content-Type': 'text/plain'}, b'',
+                        encoding='base64')
+        assert writer.num_parts == 4
+    assert writer.closed
+    content = fout.getvalue()
+
+    mhtarc = mhtml.parse_mhtml_struct(content)
+    assert mhtarc.boundary == writer.boundary
+    assert mhtarc.location == 'loc0'
+    assert mhtarc.headers['MIME-Version'] == '1.0'
+    assert [res.encoding for res in mhtarc.resources] == \
+        ['quoted-printable', 'base64', 'binary', 'base64']
+    assert mhtarc.resources[0].location == 'loc0'
+    assert mhtml.decode_payload(mhtarc.resources[0].content,
+                                'quoted-printable') == text
+    assert mhtarc.open_resource(1).read() == data
+    assert mhtarc.resources[2].content == b'css\r\n'
+    assert mhtarc.open_resource(3).read() == b''
+    assert max(len(line) for line in
+               mhtarc.resources[1].content.split(b'\r\n')) == 76
+
+    # raw parts and resources of other archives are copied as is
+    filename = str(tmp_path / 'copy.mhtml')
+    with mhtml.MHTMLWriter(filename, headers=mhtarc.headers) as writer:
+        assert writer.boundary == mhtarc.boundary
+        for res in mhtarc.resources[:2]:
+            writer.add_resource(res)
+        # missing linebreak is added
+        writer.add_raw_part(mhtarc.resources[2].content_with_headers[:-2])
+        writer.add_raw_part(mhtarc.resources[3].content_with_headers)
+        writer.close()
+    assert mhtml.MHTMLArchive_from_file(filename).content == content
+
+    # collisions at the start of a line, also across chunks
+    writer = mhtml.MHTMLWriter(io.BytesIO(), boundary='b')
+    with pytest.raises(ValueError):
+        writer.add_part({}, b'xx\r\n--b\r\n')
+    writer.CHUNK_SIZE = 3
+    with pytest.raises(ValueError):
+        writer.add_part({}, b'xx\r\n--bx', encoding='binary')
+    with pytest.raises(ValueError):
+        writer.add_part({}, b'--b', encoding='7bit')
+    with pytest.raises(ValueError):
+        writer.add_raw_part(b'X: y\r\n\r\n--b')
+    with pytest.raises(ValueError):
+        writer.add_part({}, b'', encoding='x-unknown')
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.add_part({}, b'')
+
+    # the boundary inside of a line is no delimiter, parts with it are
+    # copied from parsed archives
+    fout = io.BytesIO()
+    with mhtml.MHTMLWriter(fout, boundary='bnd') as writer:
+        writer.CHUNK_SIZE = 3
+        writer.add_part({}, b'x--bnd\r\ny--bnd--', encoding='binary')
+        writer.add_part({}, b'y --bnd--', encoding='quoted-printable')
+    mhtarc = mhtml.parse_mhtml_struct(fout.getvalue())
+    fout = io.BytesIO()
+    with mhtml.MHTMLWriter(fout, headers=mhtarc.headers) as writer:
+        for res in mhtarc.resources:
+            writer.add_resource(res)
+    assert fout.getvalue() == mhtarc.content
+    assert [mhtml.decode_payload(res.content, res.encoding)
+            for res in mhtarc.resources] == \
+        [b'x--bnd\r\ny--bnd--', b'y --bnd--']
+
+    # trailing linebreaks of the data are kept
+    payloads = [b'hello\r\n', b'a=b\r\nline2\r\n', b'\r\n\r\n', b'end',
+                b'']
+    fout = io.BytesIO()
+    with mhtml.MHTMLWriter(fout) as writer:
+        for encoding in ('quoted-printable', '7bit'):
+            for payload in payloads:
+                writer.add_part({}, payload, encoding=encoding)
+    mhtarc = mhtml.parse_mhtml_struct(fout.getvalue())
+    assert [mhtml.decode_payload(res.content, res.encoding)
+            for res in mhtarc.resources] == payloads * 2
+
+    with pytest.raises(ValueError):
+        mhtml.MHTMLWriter(io.BytesIO(), headers={'Content-Type': 'text/html'})
+    with pytest.raises(ValueError):
+        mhtml.MHTMLWriter(io.BytesIO(), boundary='a', headers=mhtarc.headers)
+
+
+def test_payload_streamed_equals_whole(tmp_path):
+    import io
+
+    # readers and `decode_payload()` agree on where the payload ends and
+    # how it is decoded
+    texts = [b'hello\r\n', b'a=b\r\nline2\r\n', b'\r\n\r\n', b'end', b'']
+    data = bytes(range(256)) * 3 + b'\r\n'
+    expected = list()
+    fout = io.BytesIO()
+    with mhtml.MHTMLWriter(fout) as writer:
+        for encoding in ('base64', 'quoted-printable', 'binary', '7bit'):
+            payloads = texts + [data] if encoding in ('base64', 'binary') \
+                else texts
+            for payload in payloads:
+                writer.add_part({}, payload, encoding=encoding)
+            expected.extend(payloads)
+    mhtarc = mhtml.parse_mhtml_struct(fout.getvalue())
+    assert len(mhtarc.resources) == len(expected)
+
+    for res, payload in zip(mhtarc.resources, expected):
+        assert mhtml.decode_payload(res.content, res.encoding) == payload
+        for chunk_size in (1, 4, 5, 1 << 16):
+            with mhtml.ResourceReader(res, chunk_size=chunk_size) as raw:
+                pieces = list(iter(lambda raw=raw: raw.read(3), b''))
+            assert b''.join(pieces) == payload
+        with mhtarc.open_resource(res, decode=False) as fin:
+            assert fin.read() == res.content
+
+    filename = str(tmp_path / 'a.mhtz')
+    mhtml.write_container(mhtarc, filename, block_size=64)
+    # container resources keep binary and 7bit content as is, like
+    # `Resource.get_content(decode=True)`
+    with mhtml.MHTMLContainer(filename) as container:
+        for res, arc_res, payload in zip(container.resources,
+                                         mhtarc.resources, expected):
+            assert res.get_content(decode=True) == (
+                payload if res.encoding in ('base64', 'quoted-printable')
+                else arc_res.get_content(decode=True))
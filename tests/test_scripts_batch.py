@@ -0,0 +1,101 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import pytest
+
+from mhtml_scripts import batch
+
+
+def _touch(path, content=b''):
+    path.write_bytes(content)
+    return str(path)
+
+
+def _print_name(filename):
+    print(filename.rsplit('/', 1)[-1])
+
+
+def _fail(filename):
+    raise ValueError('bad ' + filename.rsplit('/', 1)[-1])
+
+
+def test_find_files(tmp_path):
+    sub = tmp_path / 'sub'
+    sub.mkdir()
+    fn_a = _touch(tmp_path / 'a.mhtml')
+    fn_b = _touch(tmp_path / 'b.MHT')
+    _touch(tmp_path / 'c.txt')
+    fn_d = _touch(sub / 'd.mhtml')
+
+    assert batch.find_files([str(tmp_path)]) == [fn_a, fn_b]
+    assert batch.find_files([str(tmp_path)], recursive=True) == \
+        [fn_a, fn_b, fn_d]
+    assert batch.find_files([str(tmp_path)], patterns=('*.txt',)) == \
+        [str(tmp_path / 'c.txt')]
+
+    # globs, duplicates removed, order kept
+    assert batch.find_files([fn_d, str(tmp_path / '*.mhtml'), fn_a]) == \
+        [fn_d, fn_a]
+    assert batch.find_files([str(tmp_path / '**' / '*.mhtml')],
+                            recursive=True) == [fn_a, fn_d]
+
+    # missing files are kept to be reported later
+    assert batch.find_files(['missing.mhtml']) == ['missing.mhtml']
+
+
+def test_run_batch(tmp_path):
+    fns = [_touch(tmp_path / '{}.mhtml'.format(i), b'x' * i)
+           for i in range(4)]
+
+    results = list(batch.run_batch(_print_name, fns))
+    assert [r.output for r in results] == \
+        ['{}.mhtml\n'.format(i) for i in range(4)]
+    assert [r.size for r in results] == [0, 1, 2, 3]
+    assert all(r.ok for r in results)
+
+    # per file error isolation, also in worker processes
+    for jobs in (1, 2):
+        results = list(batch.run_batch(_fail, fns, jobs=jobs))
+        assert [r.filename for r in results] == fns
+        assert not any(r.ok for r in results)
+        assert results[1].error == 'ValueError: bad 1.mhtml'
+
+    results = list(batch.run_batch(_print_name, fns, jobs=2, ordered=False))
+    assert sorted(r.output for r in results) == \
+        ['{}.mhtml\n'.format(i) for i in range(4)]
+
+    summary = batch.BatchSummary()
+    for result in batch.run_batch(_fail, fns[:2]):
+        summary.add(result)
+    summary.finish()
+    assert summary.num_files == 2
+    assert summary.num_bytes == 1
+    assert not summary.ok
+    assert len(summary.failures) == 2
+
+
+def test_make_output_path(tmp_path):
+    sub_a = tmp_path / 'a'
+    sub_b = tmp_path / 'b'
+    sub_a.mkdir()
+    sub_b.mkdir()
+    fn_a = _touch(sub_a / 'x.mhtml')
+    fn_b = _touch(sub_b / 'x.mhtml')
+    out = str(tmp_path / 'out')
+
+    root = batch.common_root([fn_a, fn_b])
+    assert root == str(tmp_path)
+    assert batch.common_root([fn_a]) == str(sub_a)
+
+    # same names from different directories do not clash
+    assert batch.make_output_path(fn_a, out, root) == \
+        str(tmp_path / 'out' / 'a' / 'x.mhtml')
+    assert batch.make_output_path(fn_b, out, root, '.html') == \
+        str(tmp_path / 'out' / 'b' / 'x.html')
+    assert (tmp_path / 'out' / 'b').is_dir()
+
+    # never the input itself
+    with pytest.raises(ValueError):
+        batch.make_output_path(fn_a, str(sub_a), str(sub_a))
+    with pytest.raises(ValueError):
+        batch.check_output(fn_a, str(sub_a / '.' / 'x.mhtml'))
+    batch.check_output(fn_a, fn_b)
@@ -0,0 +1,76 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import json
+
+import mhtml
+
+from mhtml_scripts import diff
+
+
+def _part(location, body, content_type='text/html'):
+    return 'Content-Type: {}\r\nContent-Location: {}\r\n\r\n'.format(
+        content_type, location).encode() + body + b'\r\n'
+
+
+def test_diff_archives(make_archive_content):
+    bndry = '---boundary---'
+    old = mhtml.parse_mhtml_struct(make_archive_content(bndry, [
+        _part('loc0', b'<html>'), _part('a.css', b'a'),
+        _part('b.css', b'b'), _part('c.png', b'c', 'image/png'),
+        _part('d.js', b'd'), _part('e.js', b'e')],
+        headers=b'Date: Mon, 1 Jan 2024\r\n'))
+    new = mhtml.parse_mhtml_struct(make_archive_content(bndry, [
+        _part('loc0', b'<html>'), _part('new.css', b'n'),
+        _part('c.png', b'c', 'image/webp'), _part('a.css', b'a'),
+        _part('d.js', b'd2'), _part('e.js', b'e')],
+        headers=b'Date: Tue\r\n'))
+
+    for jobs in (1, None, 0):
+        result = diff.diff_archives(old, new, jobs=jobs)
+        assert result.headers == [('Date', ['Mon, 1 Jan 2024'], ['Tue'])]
+        assert [(c.location, c.new_nr) for c in result.added] == \
+            [('new.css', 1)]
+        assert [(c.location, c.old_nr) for c in result.removed] == \
+            [('b.css', 2)]
+        # changed content or headers
+        assert [(c.location, c.old_nr, c.new_nr) for c in result.changed] \
+            == [('c.png', 3, 2), ('d.js', 4, 4)]
+        assert result.changed[0].old_digest == result.changed[0].new_digest
+        assert result.changed[0].headers == [
+            ('Content-Type', ['image/png'], ['image/webp'])]
+        assert result.changed[1].headers == []
+        # shifted by insertions/removals is not moved
+        assert [(c.location, c.old_nr, c.new_nr) for c in result.moved] == \
+            [('a.css', 1, 3)]
+        assert result.num_unchanged == 2
+        assert not diff.is_identical(result)
+
+    result = diff.diff_archives(old, old, ignore_headers=('date',))
+    assert diff.is_identical(result) and result.num_unchanged == 6
+
+    data = json.loads(json.dumps(diff.diff_as_dict(
+        diff.diff_archives(old, new, ignore_headers=('Date',)))))
+    assert data['headers'] == [] and data['unchanged'] == 2
+    assert data['moved'][0]['old_digest'] == data['moved'][0]['new_digest']
+    assert data['added'][0]['old_digest'] is None
+
+
+def test_cli(tmp_path, capsys, make_archive_content, run_cli):
+    bndry = '---boundary---'
+    old_file = str(tmp_path / 'old.mhtml')
+    new_file = str(tmp_path / 'new.mhtml.gz')
+    mhtml.MHTMLArchive_to_file(mhtml.parse_mhtml_struct(
+        make_archive_content(bndry, [_part('loc0', b'x')])), old_file)
+    mhtml.MHTMLArchive_to_file(mhtml.parse_mhtml_struct(
+        make_archive_content(bndry, [_part('loc0', b'y')])), new_file)
+
+    assert diff.main(old_file, old_file)
+    assert not diff.main(old_file, new_file)
+    out = capsys.readouterr().out.splitlines()
+    assert out[-2:] == ['M 0 -> 0 loc0',
+                        '0 added, 0 removed, 1 changed, 0 moved, '
+                        '0 unchanged']
+
+    assert run_cli(diff.cli_main, '--json', old_file, new_file) == 1
+    assert json.loads(capsys.readouterr().out)['changed'][0]['location'] == \
+        'loc0'
@@ -0,0 +1,45 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import pytest
+
+from mhtml_scripts import extract_main
+from mhtml_scripts.extract_main import cli_main
+
+
+def _part(body):
+    return b'Content-Type: text/html\r\nContent-Location: loc0\r\n' \
+        b'\r\n' + body + b'\r\n'
+
+
+def test_extract_main_cli(tmp_path, make_archive_content, run_cli):
+    bndry = '---boundary---'
+    archives = tmp_path / 'archives'
+    (archives / 'sub').mkdir(parents=True)
+    fn_a = tmp_path / 'a.mhtml'
+    fn_a.write_bytes(make_archive_content(bndry, [_part(b'<a>')]))
+    (archives / 'x.mhtml').write_bytes(
+        make_archive_content(bndry, [_part(b'<x>')]))
+    (archives / 'sub' / 'x.mhtml').write_bytes(
+        make_archive_content(bndry, [_part(b'<y>')]))
+
+    # old call signature: file output
+    assert run_cli(cli_main, str(fn_a), str(tmp_path / 'main.html')) == 0
+    assert (tmp_path / 'main.html').read_bytes() == b'<a>\r\n'
+
+    # a directory as second input is an input
+    assert run_cli(cli_main, str(fn_a), str(archives)) == 0
+    assert (tmp_path / 'a.html').read_bytes() == b'<a>\r\n'
+    assert (archives / 'x.html').read_bytes() == b'<x>\r\n'
+
+    # same names from different directories do not clash
+    out = tmp_path / 'out'
+    assert run_cli(cli_main, str(fn_a), str(archives), '-r',
+                   '-o', str(out)) == 0
+    assert (out / 'a.html').read_bytes() == b'<a>\r\n'
+    assert (out / 'archives' / 'x.html').read_bytes() == b'<x>\r\n'
+    assert (out / 'archives' / 'sub' / 'x.html').read_bytes() == \
+        b'<y>\r\n'
+
+    # never overwrites the input
+    with pytest.raises(ValueError):
+        extract_main.main(str(fn_a), str(fn_a))
@@ -0,0 +1,57 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import base64
+import binascii
+import gzip
+import re
+
+import mhtml
+
+from mhtml_scripts import grep
+
+
+def test_grep_file(tmp_path, capsys, make_archive_content):
+    html = b'Content-Type: text/html\r\nContent-Location: http://a/\r\n' \
+        b'Content-Transfer-Encoding: quoted-printable\r\n\r\n' + \
+        binascii.b2a_qp(b'<img src="http://t/pixel.gif?id=secret">') + \
+        b'\r\n'
+    js = b'Content-Type: text/javascript\r\nContent-Location: http://a/s.js' \
+        b'\r\n\r\nvar key = "secret";\r\n'
+    image = b'Content-Type: image/png\r\nContent-Location: http://a/p.png' \
+        b'\r\nContent-Transfer-Encoding: base64\r\n\r\n' + \
+        base64.encodebytes(b'\x89PNG secret') + b'\r\n'
+    content = make_archive_content('---boundary---', [html, js, image],
+                                   location='http://a/')
+    filename = str(tmp_path / 'a.mhtml')
+    with open(filename, 'wb') as fout:
+        fout.write(content)
+
+    regex = re.compile(b'secret')
+    matches = grep.grep_file(filename, regex)
+    assert [(m.nr, m.location, m.decoded) for m in matches] == \
+        [(0, 'http://a/', True), (1, 'http://a/s.js', False),
+         (2, 'http://a/p.png', True)]
+    # offsets in the archive or in the decoded content
+    assert content[matches[1].offset:].startswith(b'secret')
+    assert matches[2].offset == 5
+    assert all(match.match == b'secret' for match in matches)
+
+    # plain text stays readable in quoted-printable
+    assert [m.nr for m in grep.grep_file(filename, regex, decode=False)] == \
+        [0, 1]
+    assert [m.nr for m in grep.grep_file(
+        filename, regex,
+        resource_filter=mhtml.ResourceFilter(include='text/*'))] == [0, 1]
+
+    # compressed archives
+    filename_gz = str(tmp_path / 'b.mhtml.gz')
+    with gzip.open(filename_gz, 'wb') as fout:
+        fout.write(content)
+    assert grep.grep_file(filename_gz, regex)[1:] == \
+        [match._replace(path=filename_gz) for match in matches[1:]]
+
+    grep.main(filename, 'SECRET', types=['image/*'], ignore_case=True)
+    assert capsys.readouterr().out == \
+        '{}:2:d5:http://a/p.png: secret\n'.format(filename)
+    grep.main(filename, 'pixel.gif?', fixed_strings=True, count=True)
+    assert capsys.readouterr().out == '{}:1\n'.format(filename)
@@ -0,0 +1,59 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import os
+
+from mhtml_scripts import index
+
+
+def _write(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_Catalog(tmp_path, make_archive_content):  # noqa: N802
+    bndry = '---boundary---'
+    script = b'Content-Type: text/javascript\r\n' \
+        b'Content-Location: http://a/s.js\r\n\r\njs\r\n'
+    fn_a = _write(tmp_path / 'a.mhtml', make_archive_content(
+        bndry, [b'Content-Type: text/html\r\n'
+                b'Content-Location: http://a/\r\n\r\n<html>\r\n', script],
+        location='http://a/'))
+    fn_b = _write(tmp_path / 'b.mhtml', make_archive_content(
+        bndry, [b'Content-Type: text/html\r\n'
+                b'Content-Location: http://b/\r\n\r\n<html>\r\n'],
+        location='http://b/'))
+    fn_c = _write(tmp_path / 'c.mhtml', b'\xff\xfe broken')
+
+    catalog = index.Catalog(str(tmp_path / 'catalog.sqlite3'))
+    result = catalog.update([fn_a, fn_b, fn_c, fn_a], with_hash=True)
+    assert result == (2, 0, 1, 0)
+    assert len(catalog) == 2
+    assert catalog.find_location('http://a/s.js') == [(fn_a, 1)]
+    assert catalog.find_location('http://_/', like=True) == \
+        [(fn_a, 0), (fn_b, 0)]
+
+    # unchanged files are skipped, changed ones indexed again
+    os.remove(fn_c)
+    _write(tmp_path / 'b.mhtml', make_archive_content(
+        bndry, [b'Content-Type: text/html\r\n'
+                b'Content-Location: http://b/\r\n\r\n<html>\r\n', script],
+        location='http://b/'))
+    os.utime(fn_b, ns=(1, 1))
+    result = catalog.update([fn_a, fn_b], jobs=2, commit_every=1)
+    assert result == (1, 1, 0, 0)
+    assert catalog.find_location('http://a/s.js') == [(fn_a, 1), (fn_b, 1)]
+
+    os.remove(fn_a)
+    assert catalog.update([], prune=True) == (0, 0, 0, 1)
+    assert catalog.find_location('http://a/s.js') == [(fn_b, 1)]
+
+    import sqlite3
+    conn = sqlite3.connect(catalog.filename)
+    rows = conn.execute('SELECT nr, offset_start, offset_content, '
+                        'offset_end, content_type, encoding, size, '
+                        'length(digest) FROM resources ORDER BY nr') \
+        .fetchall()
+    conn.close()
+    assert [row[4] for row in rows] == ['text/html', 'text/javascript']
+    assert rows[1][6] == 4 and rows[1][5] is None and rows[1][7] is None
+    assert rows[1][3] - rows[1][2] == 4
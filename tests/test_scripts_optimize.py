@@ -0,0 +1,60 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import base64
+import mhtml
+
+from mhtml_scripts import optimize
+from mhtml_scripts.optimize import cli_main
+
+
+def _part(location, content_type, encoding, body):
+    return 'Content-Type: {}\r\nContent-Location: {}\r\n' \
+        'Content-Transfer-Encoding: {}\r\n\r\n'.format(
+            content_type, location, encoding).encode() + body + b'\r\n'
+
+
+def _encodings(filename):
+    mhtarc = mhtml.MHTMLArchive_from_file(str(filename))
+    return [res.encoding for res in mhtarc.resources]
+
+
+def test_optimize_cli(tmp_path, make_archive_content, run_cli):
+    data = bytes(range(256)) * 4
+    content = make_archive_content('---boundary---', [
+        _part('loc0', 'text/html', 'quoted-printable', b'<p a=3D"b">'),
+        _part('a.png', 'image/png', 'base64',
+              base64.encodebytes(data).replace(b'\n', b'\r\n')[:-2])])
+    archives = tmp_path / 'archives'
+    (archives / 'sub').mkdir(parents=True)
+    fn_a = archives / 'x.mhtml'
+    fn_a.write_bytes(content)
+    (archives / 'sub' / 'x.mhtml').write_bytes(content)
+
+    # single input, output next to it
+    assert run_cli(cli_main, str(fn_a)) == 0
+    out_file = archives / 'x.optimized.mhtml'
+    assert _encodings(out_file) == ['quoted-printable', 'binary']
+    assert len(out_file.read_bytes()) < len(content)
+    assert mhtml.verify_optimized(content, out_file.read_bytes())
+    assert fn_a.read_bytes() == content
+
+    # quoted-printable text, explicit compressed output
+    out_file = tmp_path / 'small.mhtml.gz'
+    assert run_cli(cli_main, str(fn_a), '-q', '--no-verify',
+                   '-o', str(out_file)) == 0
+    assert _encodings(out_file) == ['8bit', 'binary']
+    mhtarc = mhtml.MHTMLArchive_from_file(str(out_file))
+    assert [mhtml.decode_payload(res.content, res.encoding)
+            for res in mhtarc.resources] == [b'<p a="b">', data]
+
+    # multiple inputs into a folder, same names do not clash
+    out = tmp_path / 'out'
+    assert run_cli(cli_main, str(archives), '-r', '-o', str(out),
+                   '--pattern', 'x.mhtml') == 0
+    assert _encodings(out / 'x.mhtml') == ['quoted-printable', 'binary']
+    assert _encodings(out / 'sub' / 'x.mhtml') == \
+        ['quoted-printable', 'binary']
+
+    # never overwrites the input
+    assert run_cli(cli_main, str(fn_a), '-o', str(fn_a)) == 1
+    assert fn_a.read_bytes() == content
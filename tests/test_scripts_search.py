@@ -0,0 +1,68 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import base64
+import gzip
+import os
+
+from mhtml_scripts import search
+
+
+def test_tokenize():
+    assert list(search.tokenize('Hello, <b>World</b> a x1')) == \
+        [('hello', 0), ('world', 10), ('x1', 22)]
+    text = search.extract_text(b'<p class="tracking">Pixel</p>',
+                               'text/html')
+    assert text.split() == ['Pixel'] and text.index('Pixel') == 20
+    assert search.extract_text('café'.encode('latin-1'), 'text/plain',
+                               'iso-8859-1') == 'café'
+    assert search.extract_text(b'x', 'text/plain', 'no-such-charset') == 'x'
+
+
+def test_SearchIndex(tmp_path, make_archive_content):  # noqa: N802
+    bndry = '---boundary---'
+    html = b'Content-Type: text/html; charset="utf-8"\r\n' \
+        b'Content-Location: http://a/\r\n\r\n' \
+        b'<html><p>Tracking pixel here, tracking everywhere</p></html>\r\n'
+    css = b'Content-Type: text/css\r\nContent-Location: http://a/s.css\r\n' \
+        b'Content-Transfer-Encoding: base64\r\n\r\n' + \
+        base64.encodebytes(b'.pixel { color: red }') + b'\r\n'
+    image = b'Content-Type: image/png\r\nContent-Location: http://a/p.png' \
+        b'\r\n\r\npixel\r\n'
+    fn_a = str(tmp_path / 'a.mhtml')
+    with open(fn_a, 'wb') as fout:
+        fout.write(make_archive_content(bndry, [html, css, image],
+                                         location='http://a/'))
+    fn_b = str(tmp_path / 'b.mhtml')
+    with gzip.open(fn_b, 'wb') as fout:
+        fout.write(make_archive_content(bndry, [css], location='http://a/'))
+
+    index = search.SearchIndex(str(tmp_path / 'index.sqlite3'))
+    assert index.update([fn_a, fn_b]) == (2, 0, 0, 0)
+
+    hits = index.search('PIXEL')
+    assert [(hit.path, hit.nr) for hit in hits] == [(fn_a, 0), (fn_a, 1),
+                                                   (fn_b, 0)]
+    assert hits[0].location == 'http://a/' and hits[0].charset == 'utf-8'
+    assert hits[0].score == 1
+    assert search.SearchIndex.snippet(hits[0], width=12) == \
+        'Tracking pixel here,'
+    assert search.SearchIndex.snippet(hits[2]) == '.pixel { color: red }'
+
+    assert [hit.nr for hit in index.search('tracking pixel')] == [0]
+    assert index.search('tracking', limit=1)[0].score == 2
+    assert index.search('pixel nothing') == []
+    assert index.search('!') == []
+
+    # incremental, changed archive indexed again
+    assert index.update([fn_a, fn_b], jobs=2) == (0, 2, 0, 0)
+    with open(fn_a, 'wb') as fout:
+        fout.write(make_archive_content(bndry, [image, html],
+                                         location='http://a/'))
+    os.utime(fn_a, ns=(1, 1))
+    assert index.update([fn_a, fn_b], types=['text/html']) == (1, 1, 0, 0)
+    assert [(hit.path, hit.nr) for hit in index.search('pixel')] == \
+        [(fn_a, 1), (fn_b, 0)]
+
+    os.remove(fn_b)
+    assert index.update([], prune=True).num_removed == 1
+    assert [hit.path for hit in index.search('pixel')] == [fn_a]
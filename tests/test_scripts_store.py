@@ -0,0 +1,86 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import gzip
+import io
+import os
+
+import pytest
+
+import mhtml
+from mhtml_scripts import store
+
+
+def test_ArchiveStore(tmp_path, monkeypatch,  # noqa: N802
+                      make_archive_content):
+    bndry = '---boundary---'
+    html = b'Content-Type: text/html\r\nContent-Location: loc0\r\n\r\n' \
+        b'<html>\r\n'
+    # boundary lookalike, written as is
+    css = b'Content-Type: text/css\r\n\r\ncss --' + bndry.encode() + \
+        b'\r\n'
+    font = b'Content-Type: font/woff2\r\n\r\n' + bytes(range(256)) + b'\r\n'
+    content1 = make_archive_content(bndry, [html, css, font])
+    content2 = make_archive_content(bndry, [html.replace(b'<', b'['), font,
+                                             font], epilogue=b'epilogue\r\n')
+
+    st = store.ArchiveStore(str(tmp_path / 'store'))
+    result = st.add('a', content1)
+    assert result == ('a', 3, 3, 8 + 6 + len(bndry) + 2 + 258,
+                      len(content1))
+    # only the changed html body is new
+    result = st.add('b', content2)
+    assert (result.num_parts, result.num_new_bodies) == (3, 1)
+
+    assert st.get('a') == content1
+    assert st.get('b') == content2
+    assert st.names() == ['a', 'b'] and len(st) == 2 and 'a' in st
+    stats = st.stats()
+    assert stats['bodies'] == 4
+    assert stats['archive_bytes'] == len(content1) + len(content2)
+
+    # compressed output, other processes see the entries
+    filename = str(tmp_path / 'b.mhtml.gz')
+    store.ArchiveStore(str(tmp_path / 'store')).restore('b', filename)
+    with gzip.open(filename) as fin:
+        assert fin.read() == content2
+
+    # failures leave no archive that looks complete
+    def add_raw_part(writer, data, check=True):  # noqa: E501 pylint: disable=unused-argument
+        if writer.num_parts:
+            raise OSError('disk full')
+        writer._start_part()
+    monkeypatch.setattr(mhtml.MHTMLWriter, 'add_raw_part', add_raw_part)
+    with pytest.raises(OSError):
+        st.restore('b', filename)
+    assert sorted(os.listdir(str(tmp_path))) == ['b.mhtml.gz', 'store']
+    with gzip.open(filename) as fin:
+        assert fin.read() == content2
+    fout = io.BytesIO()
+    with pytest.raises(OSError):
+        st.restore('b', fout)
+    assert b'--' + bndry.encode() + b'--' not in fout.getvalue()
+    monkeypatch.undo()
+
+    # replaced, shared bodies stay
+    st.add('a', content2)
+    assert st.get('a') == content2
+    assert st.stats()['bodies'] == 2
+
+    assert st.remove('a')
+    assert not st.remove('a')
+    assert st.stats()['bodies'] == 2
+    assert st.remove('b')
+    assert st.stats() == {'archives': 0, 'archive_bytes': 0, 'bodies': 0,
+                          'body_bytes': 0}
+
+    with pytest.raises(KeyError):
+        st.get('a')
+    with pytest.raises(ValueError):
+        st.add('c', b'no archive\r\n\r\n')
+
+    # files, by name
+    filename = str(tmp_path / 'c.mhtml')
+    with open(filename, 'wb') as fout:
+        fout.write(content1)
+    assert st.add_file(filename).name == filename
+    assert st.get(filename) == content1
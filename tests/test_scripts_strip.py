@@ -0,0 +1,66 @@
+# pylint: disable=missing-docstring,invalid-name
+
+import mhtml
+
+from mhtml_scripts import strip
+from mhtml_scripts.strip import cli_main
+
+
+def _part(location, body, content_type='text/html'):
+    return 'Content-Type: {}\r\nContent-Location: {}\r\n\r\n'.format(
+        content_type, location).encode() + body + b'\r\n'
+
+
+def _locations(filename):
+    mhtarc = mhtml.MHTMLArchive_from_file(str(filename))
+    return [res.location for res in mhtarc.resources]
+
+
+def test_parse_size():
+    assert strip.parse_size('100') == 100
+    assert strip.parse_size(' 2k') == 2048
+    assert strip.parse_size('1.5M') == 1536 * 1024
+    assert strip.parse_size('1g') == 1024 ** 3
+
+
+def test_strip_cli(tmp_path, make_archive_content, run_cli):
+    content = make_archive_content('---boundary---', [
+        _part('loc0', b'<html>'), _part('a.css', b'a' * 100, 'text/css'),
+        _part('b.png', b'b' * 10, 'image/png')])
+    archives = tmp_path / 'archives'
+    (archives / 'sub').mkdir(parents=True)
+    fn_a = archives / 'x.mhtml'
+    fn_a.write_bytes(content)
+    (archives / 'sub' / 'x.mhtml').write_bytes(content)
+
+    # single input, output next to it
+    assert run_cli(cli_main, str(fn_a), '-e', 'image/*') == 0
+    assert _locations(archives / 'x.stripped.mhtml') == ['loc0', 'a.css']
+    assert fn_a.read_bytes() == content
+
+    # explicit output file, compressed by suffix
+    out_file = tmp_path / 'small.mhtml.gz'
+    assert run_cli(cli_main, str(fn_a), '-o', str(out_file),
+                   '--max-size', '50') == 0
+    assert mhtml.detect_compression(out_file.read_bytes()[:6]) == 'gzip'
+    assert _locations(out_file) == ['loc0', 'b.png']
+
+    # the main page is kept unless allowed
+    assert run_cli(cli_main, str(fn_a), '-o', str(out_file),
+                   '-i', 'image/*') == 0
+    assert _locations(out_file) == ['loc0', 'b.png']
+    assert run_cli(cli_main, str(fn_a), '-o', str(out_file),
+                   '-i', 'image/*', '--strip-main') == 0
+    assert _locations(out_file) == ['b.png']
+
+    # multiple inputs into a folder, same names do not clash
+    out = tmp_path / 'out'
+    assert run_cli(cli_main, str(archives), '-r', '-o', str(out),
+                   '--pattern', 'x.mhtml',
+                   '--exclude-location', r'\.css$') == 0
+    assert _locations(out / 'x.mhtml') == ['loc0', 'b.png']
+    assert _locations(out / 'sub' / 'x.mhtml') == ['loc0', 'b.png']
+
+    # never overwrites the input
+    assert run_cli(cli_main, str(fn_a), '-o', str(fn_a)) == 1
+    assert fn_a.read_bytes() == content